@@ -0,0 +1,336 @@
+"""
+A synthetic Discogs corpus, served to the API through the responses mock library.
+
+An artist with aliases has masters with several versions each, singles and
+appearances on Various compilations. Release details carry the fields Record
+ignores (images, videos, notes, credits), and part of the releases are in the
+user's collection. Responses carry an ETag, and conditional requests of unchanged
+payloads get a 304 Not Modified.
+
+    from corpus import Corpus
+
+    corpus = Corpus(masters=1000, versions=5)
+    with corpus.serve():
+        artist = Artist(corpus.artist_id, api=corpus.api())
+"""
+
+from discogs_track.api import API, RateLimiter
+from discogs_track.cache import Cache, LRUCache, SQLiteBackend
+
+from contextlib import contextmanager
+from random import Random
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+import re
+import zlib
+
+import responses  # type: ignore
+from ujson import dumps
+
+FORMATS = (
+    ("Vinyl", ["LP", "Album"]),
+    ("Vinyl", ['12"', "Single"]),
+    ("CD", ["Album"]),
+    ("CD", ["Album", "Remastered"]),
+    ("Cassette", ["Album"]),
+    ("File", ["FLAC", "Album"]),
+    ("File", ["MP3", "Album"]),
+)
+
+
+class BenchConfig:
+    auth = None
+    user_name = "bench"
+    cache_options: Dict[str, str] = {}
+
+
+def release(release_id: int, artist_id: int, title: str = None, tracks=10) -> dict:
+    """A release details payload, with the fields Record ignores"""
+    title = title or f"Album {release_id // 10}"
+    return {
+        "id": release_id,
+        "title": title,
+        "uri": f"https://www.discogs.com/release/{release_id}",
+        "year": 1980 + release_id % 40,
+        "formats": [{"name": "Vinyl", "descriptions": ["LP", "Album"]}],
+        "artists": [{"id": artist_id, "name": "Bench"}],
+        "tracklist": [
+            {
+                "type_": "track",
+                "position": f"A{n}",
+                "title": f"Song {release_id // 10}-{n}",
+                "duration": f"{3 + n % 3}:{release_id % 60:02}",
+                "extraartists": [{"id": 1000 + n, "name": "Producer"}],
+            }
+            for n in range(tracks)
+        ],
+        "images": [{"uri": "https://i.discogs.com/" + "x" * 120}] * 4,
+        "videos": [{"uri": "https://www.youtube.com/" + "y" * 40}] * 3,
+        "notes": "n" * 800,
+        "num_for_sale": release_id % 5,
+        "lowest_price": float(release_id % 23),
+    }
+
+
+class Corpus:
+    """
+    Generates the payloads of the Discogs endpoints used by discogs_track, for one
+    artist and its aliases. The same seed gives the same corpus.
+    """
+
+    base_url = "https://api.discogs.com"
+
+    def __init__(
+        self,
+        masters: int = 300,
+        versions: int = 8,
+        singles: int = 200,
+        compilations: int = 100,
+        aliases: int = 2,
+        titles: int = 400,
+        collected: float = 0.1,
+        seed: int = 0,
+        artist_id: int = 1,
+    ):
+        """
+        :param masters: number of masters of the artist
+        :param versions: average number of versions per master
+        :param singles: number of releases without master
+        :param compilations: number of Various compilations the artist appears on
+        :param aliases: number of aliases of the artist, with releases of their own
+        :param titles: number of distinct track titles of the artist
+        :param collected: share of the releases in the user's collection
+        """
+        rnd = Random(seed)
+        self.artist_id = artist_id
+        self.alias_ids = [artist_id + 1 + n for n in range(aliases)]
+        self.user_name = BenchConfig.user_name
+        self.artists: Dict[int, dict] = {}
+        self.artist_releases: Dict[int, List[dict]] = {}
+        self.master_versions: Dict[int, List[dict]] = {}
+        self.releases: Dict[int, dict] = {}
+        self.collection: List[int] = []
+        self.requests = 0
+        self.not_modified = 0
+
+        for n, an_artist_id in enumerate([artist_id] + self.alias_ids):
+            name = "Bench" if not n else f"Bench alias {n}"
+            self.artists[an_artist_id] = {
+                "id": an_artist_id,
+                "name": name,
+                "profile": "p" * 300,
+                "aliases": [
+                    {"id": other_id, "name": f"Bench alias {m}"}
+                    for m, other_id in enumerate(self.alias_ids, 1)
+                    if other_id != an_artist_id
+                ],
+            }
+            self.artist_releases[an_artist_id] = []
+
+        release_id = 10000
+        master_id = 500
+        for n in range(masters + singles + compilations):
+            an_artist_id = (
+                rnd.choice(self.alias_ids)
+                if self.alias_ids and rnd.random() < 0.1
+                else artist_id
+            )
+            name = self.artists[an_artist_id]["name"]
+            tracks = [
+                f"Song {rnd.randrange(titles)}" for _ in range(rnd.randint(2, 12))
+            ]
+            if n < masters:
+                master_id += 1
+                title = f"Album {n}"
+                self.artist_releases[an_artist_id].append(
+                    {"id": master_id, "type": "master", "artist": name, "title": title}
+                )
+                self.master_versions[master_id] = []
+                for _version in range(max(1, int(rnd.gauss(versions, versions / 2)))):
+                    release_id += 1
+                    summary = self._add_release(
+                        rnd, release_id, an_artist_id, title, tracks, master_id
+                    )
+                    self.master_versions[master_id].append(summary)
+            else:
+                release_id += 1
+                various = n >= masters + singles
+                title = f"Compilation {n}" if various else f"Single {n}"
+                self._add_release(
+                    rnd, release_id, an_artist_id, title, tracks, None, various
+                )
+                self.artist_releases[an_artist_id].append(
+                    {
+                        "id": release_id,
+                        "type": "release",
+                        "artist": "Various" if various else name,
+                        "title": title,
+                        "format": self.releases[release_id]["_format"],
+                    }
+                )
+            if rnd.random() < collected:
+                self.collection.append(release_id)
+
+        for details in self.releases.values():
+            del details["_format"]
+
+    def _add_release(
+        self,
+        rnd: Random,
+        release_id: int,
+        artist_id: int,
+        title: str,
+        tracks: List[str],
+        master_id: Optional[int],
+        various: bool = False,
+    ) -> dict:
+        name, descriptions = rnd.choice(FORMATS)
+        format_ = ", ".join([name] + descriptions)
+        details = release(release_id, artist_id, title=title, tracks=0)
+        details["formats"] = [{"name": name, "descriptions": descriptions}]
+        details["_format"] = format_
+        if master_id:
+            details["master_id"] = master_id
+        if various:
+            details["artists"] = [{"id": 194, "name": "Various"}]
+        details["tracklist"] = [
+            {
+                "type_": "track",
+                "position": f"{n + 1}",
+                "title": track_title,
+                "duration": rnd.choice(("", "3:30", "3:31", "3:45", "4:02", "6:15")),
+                "artists": [{"id": artist_id, "name": "Bench"}],
+                "extraartists": [{"id": 1000 + n, "name": "Producer"}],
+            }
+            for n, track_title in enumerate(tracks)
+        ]
+        if various:
+            details["tracklist"].append(
+                {
+                    "type_": "track",
+                    "position": "99",
+                    "title": "Someone else song",
+                    "duration": "3:00",
+                    "artists": [{"id": 999, "name": "Someone else"}],
+                }
+            )
+        self.releases[release_id] = details
+        return {
+            "id": release_id,
+            "title": title,
+            "format": format_,
+            "stats": {"user": {"in_collection": 0}},
+        }
+
+    @property
+    def records_number(self) -> int:
+        return len(self.releases)
+
+    def api(self, cache: Cache = None, **kwargs) -> API:
+        """
+        Returns an API without rate limit, caching in memory by default
+        :param cache: the responses cache (default: an in-memory SQLite one, with
+        an L1)
+        """
+        api = API(
+            BenchConfig(),
+            cache=cache or Cache(SQLiteBackend(":memory:"), memory=LRUCache()),
+            **kwargs,
+        )
+        api.rate_limiter = RateLimiter(10**9, burst=10**9)
+        return api
+
+    @staticmethod
+    def page(items: List[dict], key: str, query: Dict[str, List[str]]) -> dict:
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["50"])[0])
+        pages = max(1, -(-len(items) // per_page))
+        return {
+            "pagination": {
+                "page": page,
+                "pages": pages,
+                "per_page": per_page,
+                "items": len(items),
+            },
+            key: items[(page - 1) * per_page : page * per_page],
+        }
+
+    def payload(self, url: str) -> Optional[dict]:
+        """Returns the payload of a Discogs API url, None if it is unknown"""
+        parsed = urlparse(url)
+        path, query = parsed.path, parse_qs(parsed.query)
+        match = re.fullmatch(r"/artists/(\d+)(/releases)?", path)
+        if match:
+            an_artist_id = int(match.group(1))
+            if an_artist_id not in self.artists:
+                return None
+            if match.group(2):
+                return self.page(self.artist_releases[an_artist_id], "releases", query)
+            return self.artists[an_artist_id]
+        match = re.fullmatch(r"/masters/(\d+)/versions", path)
+        if match:
+            versions = self.master_versions.get(int(match.group(1)))
+            return None if versions is None else self.page(versions, "versions", query)
+        match = re.fullmatch(r"/releases/(\d+)", path)
+        if match:
+            return self.releases.get(int(match.group(1)))
+        match = re.fullmatch(r"/marketplace/stats/(\d+)", path)
+        if match and int(match.group(1)) in self.releases:
+            details = self.releases[int(match.group(1))]
+            return {
+                "num_for_sale": details["num_for_sale"],
+                "lowest_price": {"value": details["lowest_price"], "currency": "EUR"},
+                "blocked_from_sale": False,
+            }
+        match = re.fullmatch(r"/users/[^/]+/collection/releases/(\d+)", path)
+        if match:
+            release_id = int(match.group(1))
+            items = [{"id": release_id}] if release_id in self.collection else []
+            return self.page(items, "releases", query)
+        match = re.fullmatch(r"/users/[^/]+/collection/folders/0/releases", path)
+        if match:
+            items = [
+                {
+                    "id": release_id,
+                    "basic_information": {
+                        "id": release_id,
+                        "master_id": self.releases[release_id].get("master_id", 0),
+                    },
+                }
+                for release_id in self.collection
+            ]
+            return self.page(items, "releases", query)
+        return None
+
+    def callback(self, request):
+        self.requests += 1
+        payload = self.payload(request.url)
+        headers = {
+            "X-Discogs-Ratelimit": "1000000000",
+            "X-Discogs-Ratelimit-Used": "0",
+            "X-Discogs-Ratelimit-Remaining": "1000000000",
+        }
+        if payload is None:
+            return (
+                404,
+                headers,
+                dumps({"message": "The requested resource was not found."}),
+            )
+        body = dumps(payload)
+        headers["ETag"] = f'"{zlib.crc32(body.encode()):08x}"'
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            self.not_modified += 1
+            return 304, headers, ""
+        return 200, headers, body
+
+    @contextmanager
+    def serve(self) -> Iterator[responses.RequestsMock]:
+        """Serves the corpus to the requests sessions while in the context"""
+        with responses.RequestsMock(assert_all_requests_are_fired=False) as mock:
+            mock.add_callback(
+                responses.GET,
+                re.compile(re.escape(self.base_url) + r"/.*"),
+                callback=self.callback,
+                content_type="application/json",
+            )
+            yield mock
@@ -0,0 +1,66 @@
+"""
+Measures the memory held by Record objects built from synthetic release details,
+in default and in slim mode.
+
+    $ python benchmarks/memory.py -n 10000
+"""
+
+from discogs_track.api import API
+from discogs_track.artist import Artist
+from discogs_track.cache import Cache, SQLiteBackend
+from discogs_track.record import Record
+from discogs_track.track import TrackRegistry
+
+from corpus import BenchConfig, release
+
+import argparse
+import gc
+import tracemalloc
+
+
+def measure(records_number: int, slim: bool) -> int:
+    """Returns the bytes still allocated once records_number records are built"""
+    api = API(BenchConfig(), cache=Cache(SQLiteBackend(":memory:"), memory=None))
+    artist = Artist(1, api=None)
+    artist.name, artist.full_id = "Bench", "f1"
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    registry = TrackRegistry()
+    records = {
+        release_id: Record(
+            release_id,
+            artist=artist,
+            with_artists={1: artist},
+            api=api,
+            release_raw_data=release(release_id, 1),
+            version_raw_data={
+                "id": release_id,
+                "format": "Vinyl, LP, Album",
+                "stats": {"user": {"in_collection": 0}},
+            },
+            track_registry=registry,
+            slim=slim,
+        )
+        for release_id in range(records_number)
+    }
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    assert len(records) == records_number
+    return held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--records", type=int, default=10000)
+    args = parser.parse_args()
+    default = measure(args.records, slim=False)
+    slim = measure(args.records, slim=True)
+    print(f"{args.records} records")
+    print(f"default: {default / 2**20:8.1f} MiB")
+    print(f"slim:    {slim / 2**20:8.1f} MiB ({100 * slim / default:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Times the analysis of a synthetic Discogs artist, served by a mocked session, and
+the responses cache throughput. The results are written as JSON, to compare runs
+across versions.
+
+    $ python benchmarks/suite.py --masters 1000 --versions 5 -o results.json
+"""
+
+from discogs_track import __version__
+from discogs_track.artist import Artist
+from discogs_track.cache import Cache, LRUCache, SQLiteBackend
+from discogs_track.collection import CollectionIndex
+
+from corpus import Corpus
+
+from statistics import median
+from time import perf_counter, time
+from typing import Callable, Dict, List
+import argparse
+import platform
+import sys
+
+import ujson
+
+
+def timed(function: Callable, repeat: int, setup: Callable = None) -> Dict:
+    """
+    Calls function repeat times, after setup if provided
+    :return: the min, median and max durations, in seconds
+    """
+    durations: List[float] = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = perf_counter()
+        function()
+        durations.append(perf_counter() - start)
+    return {
+        "min": round(min(durations), 6),
+        "median": round(median(durations), 6),
+        "max": round(max(durations), 6),
+        "repeat": repeat,
+    }
+
+
+def build_artist(corpus: Corpus, api, **kwargs) -> Artist:
+    Artist.ARTISTS.clear()
+    return Artist(corpus.artist_id, api=api, collection=CollectionIndex(api), **kwargs)
+
+
+def bench_artist(corpus: Corpus, repeat: int, concurrency: int) -> Dict[str, Dict]:
+    results = {}
+    with corpus.serve():
+        apis = []
+        results["artist_cold"] = timed(
+            lambda: build_artist(corpus, apis[-1], concurrency=concurrency),
+            repeat,
+            setup=lambda: apis.append(corpus.api()),
+        )
+        results["artist_cold"]["requests"] = corpus.requests // repeat
+
+        api = apis[-1]
+        results["artist_warm"] = timed(lambda: build_artist(corpus, api), repeat)
+
+        memory = api.cache.memory
+        api.cache.memory = None
+        results["artist_warm_l2"] = timed(lambda: build_artist(corpus, api), repeat)
+        api.cache.memory = memory
+
+        artist = build_artist(corpus, api)
+        results["discover_missing_tracks"] = timed(
+            artist.discover_missing_tracks, repeat
+        )
+        results["tracks_report"] = timed(artist.tracks_report, repeat)
+        results["check_for_completing_records"] = timed(
+            artist.check_for_completing_records, repeat
+        )
+        artist.collection = None  # keeps the records in_collection
+        results["refresh_collection"] = timed(artist.refresh_collection, repeat)
+        results["completing_records_report"] = timed(
+            artist.completing_records_report, repeat
+        )
+        results["artist_size"] = {
+            "records": len(artist.records),
+            "tracks": len(artist.track_registry),
+            "missing_titles": len(artist.missing_tracks),
+        }
+    return results
+
+
+def bench_cache(corpus: Corpus, repeat: int, batch: int = 500) -> Dict[str, Dict]:
+    """Times writing and reading the release details, batch at a time"""
+    values = {
+        f"https://api.discogs.com/releases/{release_id}?EUR": ujson.dumps(details)
+        for release_id, details in corpus.releases.items()
+    }
+    keys = list(values)
+    results = {}
+    for name, with_memory in (("cache_l2", False), ("cache_l1", True)):
+        caches: List[Cache] = []
+
+        def new_cache(with_memory=with_memory, caches=caches):
+            memory = LRUCache(max_entries=len(keys)) if with_memory else None
+            caches.append(Cache(SQLiteBackend(":memory:"), memory=memory))
+
+        def write(caches=caches):
+            for start in range(0, len(keys), batch):
+                caches[-1].set_many({k: values[k] for k in keys[start : start + batch]})
+
+        def read(caches=caches):
+            for start in range(0, len(keys), batch):
+                caches[-1].get_entries(keys[start : start + batch])
+
+        results[f"{name}_write"] = timed(write, repeat, setup=new_cache)
+        results[f"{name}_read"] = timed(read, repeat)
+        for operation in ("write", "read"):
+            result = results[f"{name}_{operation}"]
+            result["entries_per_s"] = round(len(keys) / result["median"])
+        results[f"{name}_read"]["bytes_stored"] = caches[-1].info()["bytes_stored"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--masters", type=int, default=300)
+    parser.add_argument("--versions", type=int, default=8)
+    parser.add_argument("--singles", type=int, default=200)
+    parser.add_argument("--compilations", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    parser.add_argument(
+        "-o", "--output", help="the JSON results file (default: stdout)"
+    )
+    args = parser.parse_args()
+
+    corpus = Corpus(
+        masters=args.masters,
+        versions=args.versions,
+        singles=args.singles,
+        compilations=args.compilations,
+        seed=args.seed,
+    )
+    report = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time(),
+        "corpus": {
+            "masters": args.masters,
+            "versions": args.versions,
+            "singles": args.singles,
+            "compilations": args.compilations,
+            "seed": args.seed,
+            "releases": corpus.records_number,
+        },
+        "results": {},
+    }
+    report["results"].update(bench_artist(corpus, args.repeat, args.concurrency))
+    report["results"].update(bench_cache(corpus, args.repeat))
+
+    output = ujson.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
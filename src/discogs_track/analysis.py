@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .record import Record  # type: ignore
+    from .track import Track, TrackRegistry  # type: ignore
+
+
+if hasattr(int, "bit_count"):  # Python 3.10+
+    popcount = int.bit_count
+else:  # pragma: no cover
+
+    def popcount(mask: int) -> int:
+        return bin(mask).count("1")
+
+
+def bits(mask: int) -> Iterator[int]:
+    """Yields the indexes of the bits set in mask"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def mask_of(indexes) -> int:
+    mask = 0
+    for index in indexes:
+        mask |= 1 << index
+    return mask
+
+
+class Analysis:
+    """
+    The record × track incidence of a TrackRegistry, as bitsets: each record of the
+    registered tracks has the mask of its tracks, a Python int whose bit i is set
+    when it holds the track of id i.
+
+    The collected tracks are the union of the masks of the records in the
+    collection, and the missing tracks of an artist are its tracks mask minus the
+    collected ones and the undated tracks having a dated alternative. The missing
+    tracks of a record, their number and its missing tracks ratio then take a few
+    integer operations, so the collection can change and the missing tracks be
+    computed again without walking the tracks and their records.
+
+    An analysis is stale once tracks or records are registered after it was built,
+    see is_stale.
+    """
+
+    def __init__(self, registry: TrackRegistry):
+        self.registry = registry
+        self.registrations = registry.registrations
+        self.records: List[Record] = []
+        self.index: Dict[int, int] = {}  # id(record) -> record index
+        track_ids: List[List[int]] = []
+        for track in registry.tracks:
+            for record in track.records.values():
+                index = self.index.get(id(record))
+                if index is None:
+                    index = self.index[id(record)] = len(self.records)
+                    self.records.append(record)
+                    track_ids.append([])
+                track_ids[index].append(track.id)
+        self.masks: List[int] = [mask_of(ids) for ids in track_ids]
+
+        # the undated tracks having a dated alternative are never missing
+        self.undated = mask_of(
+            group[""].id for group in registry.groups if "" in group and len(group) > 1
+        )
+        self._artist_masks: Dict[Optional[str], int] = {}
+        self.collected = self.collected_mask()
+
+    @property
+    def is_stale(self) -> bool:
+        return self.registrations != self.registry.registrations
+
+    def collected_mask(self) -> int:
+        mask = 0
+        for record, record_mask in zip(self.records, self.masks):
+            if record.in_collection:
+                mask |= record_mask
+        return mask
+
+    def refresh_collection(self) -> int:
+        """
+        Takes into account the in_collection changes of the records: updates the
+        collected mask and the in_collection of the tracks that changed
+        :return: the number of tracks that changed
+        """
+        collected = self.collected_mask()
+        changed = collected ^ self.collected
+        for track_id in bits(changed):
+            self.registry.tracks[track_id].in_collection = bool(
+                collected >> track_id & 1
+            )
+        self.collected = collected
+        return popcount(changed)
+
+    def artist_mask(self, artist_full_id: Optional[str]) -> int:
+        mask = self._artist_masks.get(artist_full_id)
+        if mask is None:
+            mask = self._artist_masks[artist_full_id] = mask_of(
+                track.id
+                for group_id in self.registry.title_groups(artist_full_id).values()
+                for track in self.registry.groups[group_id].values()
+            )
+        return mask
+
+    def missing_mask(self, artist_full_id: Optional[str]) -> int:
+        return self.artist_mask(artist_full_id) & ~self.collected & ~self.undated
+
+    def tracks(self, mask: int) -> List[Track]:
+        return [self.registry.tracks[track_id] for track_id in bits(mask)]
+
+    def record_mask(self, record: Record) -> int:
+        index = self.index.get(id(record))
+        return 0 if index is None else self.masks[index]
+
+    def discover(self, artist_full_id: Optional[str]) -> Dict[str, Dict[str, Track]]:
+        """
+        Sets the artist missing tracks of the records of the artist tracks. The
+        missing tracks of the other artists of a record, like on a compilation, are
+        kept.
+        :return: the artist missing tracks, indexed by title then duration
+        """
+        missing = self.missing_mask(artist_full_id)
+        artist_mask = self.artist_mask(artist_full_id)
+        for record, record_mask in zip(self.records, self.masks):
+            if record_mask & artist_mask:
+                record.missing_tracks = [
+                    track
+                    for track in record.missing_tracks
+                    if not artist_mask >> track.id & 1
+                ] + self.tracks(record_mask & missing)
+        _missing: Dict[str, Dict[str, Track]] = {}
+        for track in self.tracks(missing):
+            _missing.setdefault(track.title, {})[track.duration] = track
+        return _missing
+
+    def completing_records(
+        self, records: Dict[int, Record], artist_full_id: Optional[str]
+    ) -> Dict[int, Dict[int, Record]]:
+        """
+        Sets the missing tracks ratio of the records, see
+        Record.set_missing_tracks_ratio()
+        :return: the records indexed by their number of missing tracks, then id
+        """
+        missing = self.missing_mask(artist_full_id)
+        buckets: Dict[int, Dict[int, Record]] = {}
+        for id_, record in records.items():
+            missing_nb = popcount(self.record_mask(record) & missing)
+            if record.in_collection or not missing_nb:
+                score = 0.0
+            else:
+                score = missing_nb / (
+                    len(record.tracks.get(artist_full_id, ())) or missing_nb
+                )
+            record.missing_tracks_ratio[artist_full_id] = score
+            buckets.setdefault(missing_nb, {})[id_] = record
+        return buckets
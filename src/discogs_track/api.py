@@ -1,16 +1,34 @@
-from redis import Redis
-from requests import Session, Response, PreparedRequest
+from requests import Response, Session
+from requests.exceptions import HTTPError, RequestException
 from requests_oauthlib import OAuth1  # type: ignore
-from ujson import loads
+from ujson import dumps, loads
 
 import discogs_track
-
-from time import sleep
+from .cache import Cache, CacheEntry, CachePolicy  # type: ignore
+from .metrics import Metrics  # type: ignore
+
+from time import monotonic, sleep, time
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from threading import Lock, Thread
+from queue import Queue
+import asyncio
 import configparser
 import os
-from typing import List, Union
-
-from logging import getLogger
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from logging import getLogger, DEBUG, WARNING
 
 logger = getLogger("discogs_track")
 
@@ -33,6 +51,8 @@ class Config:
             consumer_secret = ...
             access_token_here = ...
             access_secret_here = ...
+
+        It can have a Cache section, see Cache.from_config()
         """
         config = configparser.ConfigParser()
         config.read(
@@ -49,6 +69,9 @@ class Config:
             config.get("Discogs", "access_secret_here"),
         )
         self._user_name = config.get("Discogs", "user_name")
+        self._cache_options = (
+            dict(config.items("Cache")) if config.has_section("Cache") else {}
+        )
 
     @property
     def auth(self):
@@ -58,26 +81,143 @@ class Config:
     def user_name(self):
         return self._user_name
 
+    @property
+    def cache_options(self):
+        return self._cache_options
+
 
 class TooQuicklyRequests(Exception):
     pass
 
 
-class Cache:
-    _cache: Redis
-    REDIS_DB = 0
+class RateLimiter:
+    """
+    A token bucket spacing out requests to stay just under a requests per minute
+    quota.
+
+    The bucket refills continuously at per_minute / 60 tokens per second and holds
+    at most burst tokens: Discogs counts requests over a moving 60s window, so a
+    large burst would be paid back by a long stall. acquire() takes a token,
+    sleeping until it is available. Concurrent callers queue behind each other,
+    each one getting the next free slot. update() resyncs the bucket from the
+    X-Discogs-Ratelimit, X-Discogs-Ratelimit-Used and X-Discogs-Ratelimit-Remaining
+    response headers: once the quota is spent, by this process or another one
+    sharing it, the next request waits for the window to free it.
+
+    State members:
+    - tokens: the number of requests that can be sent right away
+    - waited: the total time in seconds spent sleeping in acquire()
+    - requests: the number of tokens taken
+    """
+
+    window = 60.0  # the Discogs quota window, in seconds
+
+    def __init__(
+        self,
+        per_minute: int,
+        burst: int = 1,
+        margin: int = 1,
+        clock: Callable[[], float] = monotonic,
+        sleeper: Callable[[float], None] = sleep,
+    ):
+        """
+        :param per_minute: the maximum number of requests per minute
+        :param burst: the maximum number of requests sent without spacing (default: 1)
+        :param margin: number of requests kept unused in the Discogs quota (default: 1)
+        :param clock: the time source, in seconds
+        :param sleeper: the function used to wait, in seconds
+        """
+        self.max_per_minute = per_minute
+        self.per_minute = per_minute
+        self.burst = burst
+        self.margin = margin
+        self.waited = 0.0
+        self.requests = 0
+        self.used = 0
+        self._in_flight = 0
+        self._clock = clock
+        self._sleep = sleeper
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = Lock()
 
-    def __init__(self):
-        self._cache = Redis(host="localhost", port=6379, db=Cache.REDIS_DB)
+    @property
+    def rate(self) -> float:
+        """Refill rate, in tokens per second"""
+        return self.per_minute / 60.0
 
-    def __getitem__(self, key: str) -> Union[str, None]:
-        return self._cache.get(key)
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return max(self._tokens, 0.0)
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(
+            float(self.burst), self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
 
-    def __setitem__(self, key: str, value: str) -> None:
-        self._cache.set(key, value)
+    def acquire(self) -> float:
+        """
+        Takes a token, waiting for it if the bucket is empty
+        :return: the time waited, in seconds
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            self.requests += 1
+            self._in_flight += 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += wait
+        if wait:
+            logger.log(
+                WARNING if wait > 10 else DEBUG, f"Wait {wait:.1f}s for rate limit"
+            )
+            self._sleep(wait)
+        return wait
 
-    def __contains__(self, key: str) -> bool:
-        return bool(self._cache.exists(key))
+    def update(self, headers: Mapping[str, str]) -> None:
+        """
+        Resyncs the bucket from a Discogs response rate limit headers.
+        Must be called once per acquire(), with empty headers if the request failed.
+        :param headers: the response headers
+        """
+        with self._lock:
+            self._in_flight = max(self._in_flight - 1, 0)
+            try:
+                limit = int(headers["X-Discogs-Ratelimit"])
+                remaining = int(headers["X-Discogs-Ratelimit-Remaining"])
+                self.used = int(headers.get("X-Discogs-Ratelimit-Used", 0))
+            except (KeyError, ValueError):
+                return
+            self._refill()
+            self.per_minute = max(min(self.max_per_minute, limit - self.margin), 1)
+            # Requests still in flight have already taken their token
+            available = remaining - self.margin - self._in_flight
+            if available > 0:
+                self._tokens = min(self._tokens, float(available))
+            else:
+                self._exhaust()
+
+    def exhaust(self) -> None:
+        """Makes the next request wait for the quota window, like after a 429"""
+        with self._lock:
+            self._refill()
+            self._exhaust()
+
+    def _exhaust(self):
+        self._tokens = min(self._tokens, 1.0 - self.window * self.rate)
+
+    def state(self) -> Dict[str, float]:
+        return {
+            "per_minute": self.per_minute,
+            "tokens": self.tokens,
+            "used": self.used,
+            "requests": self.requests,
+            "waited": self.waited,
+        }
 
 
 class API(object):
@@ -89,24 +229,55 @@ class API(object):
     base_url = "https://api.discogs.com"
     max_per_minute = 59
 
-    def __init__(self, config: Config = None, currency: str = "EUR"):
+    per_page = 500
+    batch_size = 50
+    max_retries = 2  # of a request answered by a 429 status
+
+    def __init__(
+        self,
+        config: Config = None,
+        currency: str = "EUR",
+        max_concurrency: int = 4,
+        cache_policy: CachePolicy = None,
+        cache: Cache = None,
+        metrics: Metrics = None,
+    ):
         """
         :param config: instance of Config class
         :param currency: The currency for Discogs prices. Takes "EUR" if not provided.
+        :param max_concurrency: maximum number of pages of a paginated endpoint
+        fetched simultaneously (default: 4)
+        :param cache_policy: the TTLs of cached responses. Takes CachePolicy() if not
+        provided.
+        :param cache: the responses cache. Takes the config Cache section settings
+        if not provided.
+        :param metrics: the analysis metrics, see collect_metrics(). Takes a new
+        Metrics if not provided.
         """
         self.currency = currency
-
-        self.cache = Cache()
+        self.max_concurrency = max_concurrency
 
         if config is None:
             config = Config()
 
+        self.cache = cache or Cache.from_config(config.cache_options)
+        self.cache_policy = cache_policy or CachePolicy()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._revalidating: Set[str] = set()
+        self._revalidate_queue: "Queue[str]" = Queue()
+        self._revalidate_lock = Lock()
+        self._revalidate_thread: Optional[Thread] = None
+        self._master_versions: Dict[int, Dict[int, dict]] = {}
+        # the urls fetched by this instance, read from cache even when not from_cache
+        self.fetched: Set[str] = set()
+
         self.user_name = config.user_name
         self.user_agent = f"discogs_track/{discogs_track.__version__}"
 
         self.session = Session()
         self.session.auth = config.auth
         self.session.headers.update({"User-Agent": self.user_agent})
+        self.rate_limiter = RateLimiter(API.max_per_minute)
 
     def get_artist(self, artist_id: int, from_cache: bool = False) -> dict:
         """
@@ -127,24 +298,13 @@ class API(object):
         :param from_cache: True to get releases from cache if available
         :return: an array of pages of Discogs releases for the artist
         """
-        pages: List[dict] = []
-        while True:
-            expected_page_number = len(pages) + 1
-            obj = self.get_artist_releases_page(
-                artist_id, expected_page_number, from_cache=from_cache
-            )
-            pages.append(obj)
-            if obj["pagination"]["pages"] == expected_page_number:
-                break
-        return pages
+        return list(self.iter_releases(artist_id, from_cache=from_cache))
 
-    def get_artist_releases_page(
-        self, artist_id, expected_page_number, from_cache
-    ) -> dict:
-        return self.uncache_or_get(
-            f"/artists/{artist_id}/releases?per_page=500&page={expected_page_number}",
-            from_cache=from_cache,
-        )
+    def iter_releases(self, artist_id: int, from_cache: bool = True) -> Iterator[dict]:
+        """
+        Yields the pages of Discogs releases for the artist, see get_releases()
+        """
+        return self.iter_pages(f"/artists/{artist_id}/releases", from_cache=from_cache)
 
     def get_release(self, release_id: int, from_cache: bool = True) -> dict:
         """
@@ -153,11 +313,85 @@ class API(object):
         :param from_cache: True to get release from cache if available
         :return: a dictionary containing the details of the release
         """
-        obj = self.uncache_or_get(
-            f"/releases/{release_id}?{self.currency}", from_cache=from_cache
-        )
+        obj = self.uncache_or_get(self.release_query(release_id), from_cache=from_cache)
         return obj
 
+    def release_query(self, release_id: int) -> str:
+        return f"/releases/{release_id}?{self.currency}"
+
+    def get_cached_releases(
+        self, release_ids: Iterable[int], from_cache: bool = True
+    ) -> Dict[int, dict]:
+        """
+        Reads the cached details of several releases, with one cache round trip per
+        per_page releases
+        :param release_ids: the Discogs record release ids
+        :param from_cache: Set to False to only read the releases fetched by this
+        instance (default: True)
+        :return: a dictionary of the cached release details, indexed by release id
+        """
+        return {
+            release_id: self.parsed(entry)
+            for release_id, entry in self.get_cached_release_entries(
+                release_ids, from_cache=from_cache
+            ).items()
+        }
+
+    def get_cached_release_entries(
+        self, release_ids: Iterable[int], from_cache: bool = True
+    ) -> Dict[int, CacheEntry]:
+        """
+        Reads the usable cache entries of several releases, without parsing them,
+        with one cache round trip per per_page releases
+        :param release_ids: the Discogs record release ids
+        :param from_cache: Set to False to only read the releases fetched by this
+        instance (default: True)
+        :return: a dictionary of the cache entries, indexed by release id
+        """
+        release_ids = [
+            release_id
+            for release_id in release_ids
+            if from_cache or self.url(self.release_query(release_id)) in self.fetched
+        ]
+        cached_entries = {}
+        for start in range(0, len(release_ids), self.per_page):
+            chunk = release_ids[start : start + self.per_page]
+            urls = [self.url(self.release_query(release_id)) for release_id in chunk]
+            entries = self.cache.get_entries(urls)
+            for release_id, url, entry in zip(chunk, urls, entries):
+                entry = self.usable_cached_entry(url, entry)
+                if entry is not None:
+                    cached_entries[release_id] = entry
+        return cached_entries
+
+    def get_many_releases(
+        self, release_ids: Iterable[int], from_cache: bool = True
+    ) -> Dict[int, dict]:
+        """
+        Gets the details of several releases. Cached releases are read at once, the
+        others are fetched and then cached batch_size at a time.
+        :param release_ids: the Discogs record release ids
+        :param from_cache: True to get releases from cache if available
+        :return: a dictionary of release details, indexed by release id
+        """
+        release_ids = list(dict.fromkeys(release_ids))
+        releases_details = self.get_cached_releases(release_ids, from_cache=from_cache)
+        missing = [i for i in release_ids if i not in releases_details]
+        for start in range(0, len(missing), self.batch_size):
+            urls = {
+                release_id: self.url(self.release_query(release_id))
+                for release_id in missing[start : start + self.batch_size]
+            }
+            cached = dict(
+                zip(urls.values(), self.cache.get_entries(list(urls.values())))
+            )
+            entries = {}
+            for release_id, url in urls.items():
+                entries[url] = self.fetch_entry(url, cached[url])
+                releases_details[release_id] = self.parsed(entries[url])
+            self.cache.set_entries(entries)
+        return releases_details
+
     def get_stats(self, release_id: int, from_cache: bool = True) -> dict:
         """
         https://www.discogs.com/developers#page:database,header:database-release-stats
@@ -170,30 +404,49 @@ class API(object):
         )
         return obj
 
+    def get_marketplace_stats(self, release_id: int, from_cache: bool = True) -> dict:
+        """
+        https://www.discogs.com/developers#page:marketplace,header:marketplace-release-statistics
+        The marketplace responses are cached for the marketplace TTL of the cache
+        policy, an hour by default. Older ones are fetched again before being
+        returned, never served stale, see CachePolicy.ALWAYS_REVALIDATE.
+        :param release_id: the Discogs record release id
+        :param from_cache: True to get the statistics from cache if fresh enough
+        :return: the number of copies for sale and the lowest price, in currency
+        """
+        return self.uncache_or_get(
+            f"/marketplace/stats/{release_id}?curr_abbr={self.currency}",
+            from_cache=from_cache,
+        )
+
     def get_master_releases(self, master_id: int, from_cache=True) -> List[dict]:
         """
         https://www.discogs.com/developers#page:database,header:database-master-release-versions-get
         :param from_cache: True to get master releases from cache if available
         :param master_id: the Discogs record master id
-        :return:
+        :return: an array of pages of the master versions
         """
-        pages: List[dict] = []
-        while True:
-            expected_page_number = len(pages) + 1
-            obj = self.get_master_releases_page(
-                master_id, expected_page_number, from_cache=from_cache
-            )
-            pages.append(obj)
-            if obj["pagination"]["pages"] == expected_page_number:
-                break
-        return pages
+        return self.get_pages(f"/masters/{master_id}/versions", from_cache=from_cache)
 
-    def get_master_releases_page(self, master_id, pages_number, from_cache):
-        obj = self.uncache_or_get(
-            f"/masters/{master_id}/versions?per_page=500&page={pages_number + 1}",
-            from_cache=from_cache,
-        )
-        return obj
+    def get_master_versions(
+        self, master_id: int, from_cache: bool = True
+    ) -> Dict[int, dict]:
+        """
+        Returns the master versions indexed by their release id. The index of a
+        master is built once per API instance and shared by all its callers.
+        :param master_id: the Discogs record master id
+        :param from_cache: True to get master releases from cache if available
+        :return: a dictionary of versions, indexed by release id
+        """
+        versions = self._master_versions.get(master_id)
+        if versions is None:
+            versions = {
+                version["id"]: version
+                for page in self.get_master_releases(master_id, from_cache=from_cache)
+                for version in page["versions"]
+            }
+            self._master_versions[master_id] = versions
+        return versions
 
     def get_collection_item(
         self, release_id: int, from_cache: bool = True
@@ -205,38 +458,224 @@ class API(object):
         :param from_cache: True to get collection items from cache if available
         :return: a dictionary containing the details of the release
         """
-        pages: List[dict] = []
-        while True:
-            expected_page_number = len(pages) + 1
-            obj = self.get_collection_item_page(
-                release_id, expected_page_number, from_cache=from_cache
-            )
-            pages.append(obj)
-            if obj["pagination"]["pages"] == expected_page_number:
-                break
-        return pages
+        return self.get_pages(
+            f"/users/{self.user_name}/collection/releases/{release_id}",
+            from_cache=from_cache,
+        )
 
-    def get_collection_item_page(self, release_id, expected_page_number, from_cache):
-        obj = self.uncache_or_get(
-            f"/users/{self.user_name}/collection/releases/{release_id}?"
-            f"per_page=500&page={expected_page_number}",
+    def get_collection_releases(
+        self, folder_id: int = 0, from_cache: bool = True
+    ) -> List[dict]:
+        """
+        https://www.discogs.com/developers/
+                page:user-collection,header:user-collection-collection-items-by-folder
+        :param folder_id: the collection folder id. Folder 0 contains all the
+        collection releases (default: 0)
+        :param from_cache: True to get collection pages from cache if available
+        :return: an array of pages of the folder releases
+        """
+        return self.get_pages(
+            f"/users/{self.user_name}/collection/folders/{folder_id}/releases",
             from_cache=from_cache,
         )
-        return obj
+
+    def get_pages(self, query: str, from_cache: bool = True) -> List[dict]:
+        """
+        Fetches all the pages of a paginated endpoint. See iter_pages().
+        :param query: the endpoint query, without pagination parameters
+        :param from_cache: True to get pages from cache if available
+        :return: the array of pages, in page order
+        """
+        return list(self.iter_pages(query, from_cache=from_cache))
+
+    def iter_pages(
+        self, query: str, from_cache: bool = True, ordered: bool = True
+    ) -> Iterator[dict]:
+        """
+        Yields the pages of a paginated endpoint. Page 1 gives the number of pages,
+        pages 2..N are then fetched concurrently, max_concurrency at a time. The
+        rate limiter still spaces out the requests.
+        :param query: the endpoint query, without pagination parameters
+        :param from_cache: True to get pages from cache if available
+        :param ordered: Set to False to yield pages as they arrive (default: True)
+        """
+        first_page = self.uncache_or_get(self.page_query(query, 1), from_cache)
+        yield first_page
+        pages_number = first_page["pagination"]["pages"]
+        if pages_number < 2:
+            return
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_concurrency, pages_number - 1))
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self.uncache_or_get, self.page_query(query, page), from_cache
+                )
+                for page in range(2, pages_number + 1)
+            ]
+            for future in futures if ordered else as_completed(futures):
+                yield future.result()
+
+    @classmethod
+    def page_query(cls, query: str, page: int) -> str:
+        separator = "&" if "?" in query else "?"
+        return f"{query}{separator}per_page={cls.per_page}&page={page}"
 
     def uncache_or_get(self, query: str, from_cache: bool = True) -> dict:
-        url = f"{API.base_url}{query}"
-        cached = url in self.cache and from_cache
-        if cached:
-            logger.debug(f"{url} (from cache)")
-            text = self.cache[url]
-        else:
-            text = self.get(url)
-            self.cache[url] = text
+        url = self.url(query)
+        cached = self.cache.get_entry(url)
+        if from_cache or url in self.fetched:
+            entry = self.usable_cached_entry(url, cached)
+            if entry is not None:
+                logger.debug(f"{url} (from cache)")
+                return self.parsed(entry)
+
+        entry = self.fetch_entry(url, cached)
+        self.cache.set_entry(url, entry)
+        return self.parsed(entry)
+
+    def fetch_entry(self, url: str, cached: CacheEntry = None) -> CacheEntry:
+        """
+        Fetches url and returns its new cache entry, without storing it. When the
+        cached entry has validators, the request is conditional: a 304 Not Modified
+        response gives back the cached body, with a new fetched_at.
+
+        Only a successful response gives a new entry: on an error status, the
+        cached entry is returned unchanged, so that it is requested again once
+        expired. Without cached entry, the error is raised, as TooQuicklyRequests
+        for a 429 status, else as an HTTPError.
+        :param cached: the current cache entry of url, if any
+        """
+        headers = cached.validators if cached is not None else {}
+        resp = self.request(url, headers=headers)
+        endpoint = self.cache_policy.endpoint(url)
+        if headers and resp.status_code == 304:
+            self.metrics.inc(
+                "revalidations_total", endpoint=endpoint, result="unchanged"
+            )
+            self.metrics.inc(
+                "revalidation_bytes_saved_total", len(cached.body), endpoint=endpoint
+            )
+            logger.debug(f"{url} (not modified)")
+            return replace(cached, fetched_at=time())
+        if not 200 <= resp.status_code < 300:
+            if cached is not None:
+                logger.warning(
+                    f"{url} refresh failed with status {resp.status_code}, "
+                    "cached response kept"
+                )
+                return cached
+            if resp.status_code == 429:
+                raise TooQuicklyRequests()
+            raise HTTPError(f"{resp.status_code} response for {url}", response=resp)
+        if headers:
+            self.metrics.inc("revalidations_total", endpoint=endpoint, result="changed")
+        obj, text = self.loads_and_project(url, resp.text)
+        return self.cache.new_entry(
+            text,
+            parsed=obj,
+            etag=resp.headers.get("ETag"),
+            last_modified=resp.headers.get("Last-Modified"),
+        )
 
-        obj = self.loads_or_fail(text)
+    def loads_and_project(self, url: str, text: str) -> Tuple[dict, str]:
+        """
+        Parses a fetched response, and keeps only the fields the cache policy
+        projects for url
+        :return: the object and the text to cache
+        """
+        with self.metrics.timer("parse_seconds", source="response"):
+            obj = self.loads_or_fail(text)
+        fields = self.cache_policy.projection(url)
+        if fields is not None:
+            obj = {key: value for key, value in obj.items() if key in fields}
+            text = dumps(obj)
+        return obj, text
+
+    def usable_cached_entry(
+        self, url: str, entry: Optional[CacheEntry]
+    ) -> Optional[CacheEntry]:
+        """
+        Returns the cached entry of url when the cache policy allows serving it.
+        A stale entry is served when the policy serves it, see
+        CachePolicy.serves_stale(), and queued for a background refresh.
+        """
+        endpoint = self.cache_policy.endpoint(url)
+        if entry is None:
+            self.metrics.inc("cache_lookups_total", endpoint=endpoint, result="miss")
+            return None
+        if self.cache_policy.is_fresh(url, entry):
+            self.metrics.inc("cache_lookups_total", endpoint=endpoint, result="fresh")
+            return entry
+        if self.cache_policy.serves_stale(url):
+            self.metrics.inc("cache_lookups_total", endpoint=endpoint, result="stale")
+            self.revalidate(url)
+            return entry
+        self.metrics.inc("cache_lookups_total", endpoint=endpoint, result="expired")
+        return None
+
+    def parsed(self, entry: CacheEntry):
+        """Returns the object of a cached entry, parsing its body once"""
+        if entry.parsed is None:
+            with self.metrics.timer("parse_seconds", source="cache"):
+                entry.parsed = self.loads_or_fail(entry.body)
+        return entry.parsed
+
+    def revalidate(self, url: str) -> None:
+        """Queues url to be fetched again and cached by a background thread"""
+        with self._revalidate_lock:
+            if url in self._revalidating:
+                return
+            self._revalidating.add(url)
+            if self._revalidate_thread is None:
+                self._revalidate_thread = Thread(
+                    target=self._revalidate_forever,
+                    name="discogs_track-revalidate",
+                    daemon=True,
+                )
+                self._revalidate_thread.start()
+        logger.debug(f"{url} (stale, refresh queued)")
+        self._revalidate_queue.put(url)
 
-        return obj
+    @property
+    def pending_revalidations(self) -> int:
+        return len(self._revalidating)
+
+    def _revalidate_forever(self):
+        while True:
+            url = self._revalidate_queue.get()
+            try:
+                self.cache.set_entry(
+                    url, self.fetch_entry(url, self.cache.get_entry(url))
+                )
+            except Exception as e:  # noqa: B902
+                # like a non-JSON error page, or a cache backend error: the url is
+                # served stale until the next refresh, and the thread keeps going
+                logger.warning(f"{url} refresh failed: {e!r}")
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.discard(url)
+
+    @staticmethod
+    def url(query: str) -> str:
+        return f"{API.base_url}{query}"
+
+    def collect_metrics(self) -> Metrics:
+        """
+        Returns the metrics, after setting the gauges of the cache tiers and rate
+        limiter statistics
+        """
+        for key, value in self.cache.info().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                tier, _, stat = key.rpartition(".")
+                if tier:
+                    self.metrics.set(f"cache_{stat}", value, tier=tier)
+                else:
+                    self.metrics.set(f"cache_{stat}", value)
+        for key, value in self.rate_limiter.state().items():
+            self.metrics.set(f"rate_limit_{key}", value)
+        self.metrics.set("revalidations_pending", self.pending_revalidations)
+        return self.metrics
 
     @staticmethod
     def loads_or_fail(text):
@@ -245,23 +684,143 @@ class API(object):
             raise TooQuicklyRequests()
         return obj
 
-    def get(self, url) -> str:
-        resp = self.session.get(url)
-        text = resp.text
-        self.sleep_if_needed(resp)
-        return text
-
-    @staticmethod
-    def sleep_if_needed(resp: Response):
-        rate_limit_remaining = int(resp.headers["X-Discogs-Ratelimit-Remaining"])
-        request: PreparedRequest = resp.request
+    def request(self, url: str, headers: Dict[str, str] = None) -> Response:
+        """
+        Sends a GET request once the rate limiter allows it. A 429 response is sent
+        again, up to max_retries times, once the quota window is over.
+        :param headers: the request headers, like the conditional request ones
+        """
+        for attempt in range(self.max_retries + 1):
+            resp = self.send(url, headers=headers)
+            if resp.status_code != 429 or attempt == self.max_retries:
+                break
+            logger.warning(f"{url} rate limited, sent again after the quota window")
+            self.rate_limiter.exhaust()
+        self.fetched.add(url)
+        return resp
+
+    def send(self, url: str, headers: Dict[str, str] = None) -> Response:
+        """Sends a single GET request once the rate limiter allows it"""
+        endpoint = self.cache_policy.endpoint(url)
+        self.metrics.observe("rate_limit_wait_seconds", self.rate_limiter.acquire())
+        resp = None
+        start = monotonic()
+        try:
+            resp = self.session.get(url, headers=headers)
+        finally:
+            self.metrics.observe(
+                "request_seconds", monotonic() - start, endpoint=endpoint
+            )
+            self.metrics.inc(
+                "requests_total",
+                endpoint=endpoint,
+                status=resp.status_code if resp is not None else "error",
+            )
+            self.rate_limiter.update(resp.headers if resp is not None else {})
+        self.metrics.inc("response_bytes_total", len(resp.content), endpoint=endpoint)
         logger.debug(
-            f"{request.url} (remaining rate limit: {rate_limit_remaining}/minute)"
+            f"{url} (remaining rate limit: "
+            f"{resp.headers.get('X-Discogs-Ratelimit-Remaining')}/minute)"
         )
-        if rate_limit_remaining < 2:
-            logger.warning("Wait 90s")
-            sleep(90)
-        elif rate_limit_remaining < 6:
-            sleep(5)
-        elif rate_limit_remaining < 10:
-            sleep(2)
+        return resp
+
+
+class AsyncAPI(object):
+    """
+    An asyncio front-end of API, exposing the same get_* and uncache_or_get methods
+    as coroutines.
+
+    The blocking API calls run in a pool of max_concurrency threads, so that many
+    requests can be in flight at once. The wrapped API keeps the cache and the
+    Discogs rate limit handling.
+    """
+
+    def __init__(self, api: API = None, max_concurrency: int = 8):
+        """
+        :param api: instance of API class. Creates one if not provided.
+        :param max_concurrency: maximum number of simultaneous requests (default: 8)
+        """
+        self.api = api or API()
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="discogs_track"
+        )
+
+    async def _run(self, func: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
+
+    async def get_artist(self, artist_id: int, from_cache: bool = False) -> dict:
+        return await self._run(self.api.get_artist, artist_id, from_cache=from_cache)
+
+    async def get_releases(self, artist_id: int, from_cache: bool = True) -> List[dict]:
+        return await self._run(self.api.get_releases, artist_id, from_cache=from_cache)
+
+    async def get_release(self, release_id: int, from_cache: bool = True) -> dict:
+        return await self._run(self.api.get_release, release_id, from_cache=from_cache)
+
+    async def get_stats(self, release_id: int, from_cache: bool = True) -> dict:
+        return await self._run(self.api.get_stats, release_id, from_cache=from_cache)
+
+    async def get_marketplace_stats(
+        self, release_id: int, from_cache: bool = True
+    ) -> dict:
+        return await self._run(
+            self.api.get_marketplace_stats, release_id, from_cache=from_cache
+        )
+
+    async def get_many_marketplace_stats(
+        self, release_ids: Iterable[int], from_cache: bool = True
+    ) -> Dict[int, dict]:
+        """
+        Gets the marketplace statistics of several releases concurrently
+        :return: a dictionary of statistics, indexed by release id
+        """
+        release_ids = list(dict.fromkeys(release_ids))
+        objs = await asyncio.gather(
+            *(self.get_marketplace_stats(i, from_cache=from_cache) for i in release_ids)
+        )
+        return dict(zip(release_ids, objs))
+
+    async def get_master_releases(
+        self, master_id: int, from_cache: bool = True
+    ) -> List[dict]:
+        return await self._run(
+            self.api.get_master_releases, master_id, from_cache=from_cache
+        )
+
+    async def get_collection_item(
+        self, release_id: int, from_cache: bool = True
+    ) -> List[dict]:
+        return await self._run(
+            self.api.get_collection_item, release_id, from_cache=from_cache
+        )
+
+    async def uncache_or_get(self, query: str, from_cache: bool = True) -> dict:
+        return await self._run(self.api.uncache_or_get, query, from_cache=from_cache)
+
+    async def get_many_releases(
+        self, release_ids: Iterable[int], from_cache: bool = True
+    ) -> Dict[int, dict]:
+        """
+        Gets the details of several releases. Cached releases are read at once, the
+        others are fetched concurrently.
+        :param release_ids: the Discogs record release ids
+        :param from_cache: True to get releases from cache if available
+        :return: a dictionary of release details, indexed by release id
+        """
+        release_ids = list(dict.fromkeys(release_ids))
+        releases_details = await self._run(
+            self.api.get_cached_releases, release_ids, from_cache=from_cache
+        )
+        missing = [i for i in release_ids if i not in releases_details]
+        objs = await asyncio.gather(
+            *(self.get_release(i, from_cache=False) for i in missing)
+        )
+        releases_details.update(zip(missing, objs))
+        return releases_details
+
+    def close(self):
+        self._executor.shutdown(wait=True)
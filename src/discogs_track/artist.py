@@ -1,11 +1,24 @@
 from tqdm import tqdm  # type: ignore  # https://github.com/tqdm/tqdm/issues/260
 
-from .api import API  # type: ignore
+from .analysis import Analysis  # type: ignore
+from .api import API, AsyncAPI  # type: ignore
+from .collection import CollectionIndex  # type: ignore
+from .matching import TrackMatcher  # type: ignore
 from .record import Record  # type: ignore
-from .track import Track  # type: ignore
+from .snapshot import Snapshot  # type: ignore
+from .state import ArtistState  # type: ignore
+from .track import Track, TrackRegistry  # type: ignore
 
-from typing import Optional, Dict, Union, ClassVar
+from typing import Optional, Dict, Iterable, Iterator, List, Tuple, Union, ClassVar
 from dataclasses import dataclass
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import islice
+from logging import getLogger
+import asyncio
+
+logger = getLogger("discogs_track")
+
+Candidate = Tuple[int, Union["Artist", "Various"], Optional[dict]]
 
 
 @dataclass
@@ -31,7 +44,10 @@ class Artist:
                              '3:50': Track(Collapsing New People, 3:50), ... }
 
     The class is mostly useful for its discover_missing_tracks() and
-    check_for_completing_records() methods
+    check_for_completing_records() methods.
+
+    Built with stream=True, the records are not fetched by the constructor but while
+    iterating stream_records(), which yields them as they are built.
     """
 
     raw: dict
@@ -41,6 +57,11 @@ class Artist:
     name: str
     api: API
     from_cache: bool
+    complete: bool
+    is_entry: bool
+    collection: Optional[CollectionIndex]
+    track_registry: TrackRegistry
+    analysis: Optional[Analysis]
 
     aliases: list
     records: dict
@@ -78,6 +99,14 @@ class Artist:
         alias=None,
         from_cache=True,
         verbosity: int = 0,
+        concurrency: int = 0,
+        workers: int = 0,
+        collection: CollectionIndex = None,
+        track_registry: TrackRegistry = None,
+        slim: bool = False,
+        stream: bool = False,
+        incremental: bool = False,
+        matcher: TrackMatcher = None,
     ):
         """
         The constructor is typically called without alias.
@@ -86,6 +115,22 @@ class Artist:
         :param artist_id:
         :param api:
         :param alias:
+        :param concurrency: number of release details fetched simultaneously. 0 or 1
+        fetches them one after the other (default: 0)
+        :param workers: number of processes parsing the cached release details. 0 or
+        1 parses them in the main process (default: 0)
+        :param collection: the index of the user's collection. When not provided,
+        each record looks up its own release in the collection
+        :param track_registry: the registry of the analysis tracks. Aliases share
+        the entry artist one. Takes a new TrackRegistry if not provided.
+        :param slim: Set to True to build the records in slim mode, see Record
+        :param stream: Set to True to defer the records building to stream_records()
+        or build()
+        :param incremental: Set to True to reuse the saved state of the artist and
+        save the new one, see ArtistState. Ignored for aliases.
+        :param matcher: the matcher of the tracks whose title or duration differ
+        slightly. A new track_registry gets a fresh copy of it, the merges are then
+        counted by track_registry.merges. Tracks match exactly if not provided.
         """
 
         self.id = artist_id
@@ -95,6 +140,21 @@ class Artist:
         self.records = {}
         self.missing_tracks = {}
         self.completing_records = {}
+        self.complete = False
+        self.is_entry = not alias
+        self.collection = collection
+        self.verbosity, self.slim = verbosity, slim
+        self.concurrency, self.workers = concurrency, workers
+        self.incremental = incremental and not alias
+        if alias:
+            self.track_registry = alias.track_registry
+        elif track_registry is not None:
+            self.track_registry = track_registry
+        else:
+            self.track_registry = TrackRegistry(
+                matcher=matcher.fresh() if matcher is not None else None
+            )
+        self.analysis = None  # shared with the aliases, see get_analysis()
 
         Artist.ARTISTS[artist_id] = self
 
@@ -105,13 +165,99 @@ class Artist:
         self.from_cache = from_cache
         self.name = self.raw["name"]
         self.__init_aliases(alias, api)
-        self.records = self.get_records(
-            artist_id, api=api, from_cache=from_cache, verbosity=verbosity
-        )
-        if not alias:
-            self.missing_tracks.update(self.discover_missing_tracks())
-            for alias in self.aliases:
-                alias.missing_tracks.update(alias.discover_missing_tracks())
+        if not stream:
+            self.build()
+
+    def stream_records(self) -> Iterator[Record]:
+        """
+        Yields the artist records as they are built and stores them in self.records.
+        The missing tracks are discovered once the last record is yielded: they
+        depend on all the records of the artist and its aliases.
+
+        In incremental mode, the saved state of the artist provides the details of
+        the already known releases, and the new state is saved at the end.
+
+        Once the artist is complete, like when built or loaded from a snapshot, its
+        records are yielded again without being fetched.
+        """
+        if self.complete:
+            yield from list(self.records.values())
+            return
+        previous = state = None
+        if self.incremental:
+            state = ArtistState(self.id)
+            if self.from_cache:
+                previous = ArtistState.load(self.api.cache, self.id)
+        for record in self.iter_records(
+            self.id,
+            api=self.api,
+            from_cache=self.from_cache,
+            concurrency=self.concurrency,
+            workers=self.workers,
+            slim=self.slim,
+            previous=previous,
+            state=state,
+        ):
+            self.records[record.id] = record
+            yield record
+        if self.is_entry:
+            self.__discover_all_missing_tracks()
+            merges = self.track_registry.merges
+            if merges:
+                logger.info(f"{self} tracks merged by the matcher: {merges}")
+                for kind, number in merges.items():
+                    self.api.metrics.set("track_merges", number, kind=kind)
+        if state is not None:
+            state.in_collection = {
+                record.id for record in self.records.values() if record.in_collection
+            }
+            state.save(self.api.cache)
+            if previous is not None:
+                logger.info(f"{self} state changes: {state.diff(previous)}")
+        self.complete = True
+
+    def build(self) -> "Artist":
+        """Builds all the artist records, unless already done, and returns self"""
+        if not self.complete:
+            with tqdm(desc="releases") as pbar:
+                for _record in self.stream_records():
+                    pbar.update(1)
+        return self
+
+    def __discover_all_missing_tracks(self):
+        self.missing_tracks.update(self.discover_missing_tracks())
+        for alias in self.aliases:
+            alias.missing_tracks.update(alias.discover_missing_tracks())
+
+    def get_analysis(self) -> Analysis:
+        """
+        Returns the record × track incidence of the artist and its aliases tracks,
+        built again when tracks or records were registered since the last call
+        """
+        if self.analysis is None or self.analysis.is_stale:
+            self.analysis = Analysis(self.track_registry)
+            for an_artist in self.all.values():
+                an_artist.analysis = self.analysis
+        return self.analysis
+
+    def refresh_collection(self, from_cache: bool = True) -> int:
+        """
+        Takes into account the changes of the user's collection: updates the
+        in_collection of the records and tracks, then their missing tracks and the
+        completing records, without fetching the records again.
+        :param from_cache: Set to False to fetch the collection index again
+        :return: the number of tracks that entered or left the collection
+        """
+        analysis = self.get_analysis()
+        if self.collection is not None:
+            self.collection.refresh(from_cache=from_cache)
+            for record in analysis.records:
+                record.in_collection = record.id in self.collection
+        changed = analysis.refresh_collection()
+        for an_artist in self.all.values():
+            an_artist.missing_tracks = an_artist.discover_missing_tracks()
+            an_artist.check_for_completing_records()
+        return changed
 
     def __init_aliases(self, alias, api):
         if not alias:
@@ -140,25 +286,159 @@ class Artist:
     def check_for_completing_records(self):
         """Sets self.completing_records and calculates for each artist record,
         its missing tracks ratio"""
-        self.completing_records = {}
-        for id_, record in self.records.items():
-            if isinstance(record, Record):
-                record.set_missing_tracks_ratio(self.full_id)
-                self.completing_records.setdefault(len(record.missing_tracks), {})[
-                    id_
-                ] = record
+        self.completing_records = self.get_analysis().completing_records(
+            {
+                id_: record
+                for id_, record in self.records.items()
+                if isinstance(record, Record)
+            },
+            self.full_id,
+        )
 
     def get_records(
-        self, artist_id: int, api: API, from_cache: bool = None, verbosity: int = 0
+        self,
+        artist_id: int,
+        api: API,
+        from_cache: bool = None,
+        verbosity: int = 0,
+        concurrency: int = 0,
+        slim: bool = False,
+        workers: int = 0,
     ) -> dict:
+        """
+        Creates the Record objects of the artist releases and master versions, and
+        returns them indexed by their release id. See iter_records
+        """
         records = {}
-        releases_pages = api.get_releases(artist_id, from_cache=from_cache)
         with tqdm(desc="releases") as pbar:
-            for release in [
-                release
-                for release_page in releases_pages
-                for release in release_page["releases"]
-            ]:
+            for record in self.iter_records(
+                artist_id,
+                api=api,
+                from_cache=from_cache,
+                concurrency=concurrency,
+                slim=slim,
+                workers=workers,
+            ):
+                pbar.update(1)
+                records[record.id] = record
+        return records
+
+    def iter_records(
+        self,
+        artist_id: int,
+        api: API,
+        from_cache: bool = None,
+        concurrency: int = 0,
+        slim: bool = False,
+        workers: int = 0,
+        previous: ArtistState = None,
+        state: ArtistState = None,
+    ) -> Iterator[Record]:
+        """
+        Yields the Record objects of the artist releases and master versions as they
+        are built, their tracks registered.
+
+        The candidate releases are consumed api.batch_size at a time: the release
+        details of a batch are fetched together, then its records are built and
+        yielded before the next releases page or master versions are requested.
+
+        With workers > 1, the cached release details are parsed and normalized by a
+        pool of workers processes, api.per_page at a time, while the main process
+        builds the records and registers their tracks.
+
+        :param previous: an earlier state of the artist. The details of its releases
+        are used instead of being fetched.
+        :param state: a state receiving the normalized details of the artist
+        releases, once all records are yielded
+        """
+        known = previous.releases if previous is not None else {}
+        releases: Dict[int, dict] = {}
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        batch_size = (
+            api.per_page if pool is not None else max(api.batch_size, concurrency)
+        )
+        candidates = self.iter_candidates(artist_id, api=api, from_cache=from_cache)
+        try:
+            for batch in self.batched(candidates, batch_size):
+                release_ids = [
+                    record_id
+                    for record_id, _artist, _version in batch
+                    if record_id not in known
+                ]
+                if not release_ids:
+                    releases_details = {}
+                elif pool is not None:
+                    releases_details = self.parse_releases_details(
+                        release_ids,
+                        api=api,
+                        from_cache=from_cache,
+                        concurrency=concurrency,
+                        pool=pool,
+                        workers=workers,
+                    )
+                elif concurrency > 1:
+                    releases_details = self.fetch_releases_details(
+                        release_ids,
+                        api=api,
+                        from_cache=from_cache,
+                        concurrency=concurrency,
+                    )
+                else:
+                    releases_details = api.get_many_releases(
+                        release_ids, from_cache=from_cache
+                    )
+                for record_id, _artist, _version in batch:
+                    if record_id in known:
+                        releases_details[record_id] = known[record_id]
+                    if state is not None:
+                        releases[record_id] = Record.normalize_release(
+                            releases_details[record_id]
+                        )
+                yield from self.build_records(
+                    batch, releases_details, api=api, from_cache=from_cache, slim=slim
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if state is not None:
+            state.releases = releases
+
+    def build_records(
+        self,
+        batch: List[Candidate],
+        releases_details: Dict[int, dict],
+        api: API,
+        from_cache: bool = None,
+        slim: bool = False,
+    ) -> Iterator[Record]:
+        """Yields the non digital records of a batch of candidates"""
+        for record_id, artist, version in batch:
+            record = Record(
+                record_id=record_id,
+                artist=artist,
+                with_artists=self.ARTISTS,
+                version_raw_data=version,
+                release_raw_data=releases_details.pop(record_id, None),
+                collection=self.collection,
+                track_registry=self.track_registry,
+                api=api,
+                from_cache=from_cache,
+                slim=slim,
+            )
+            if not record.is_digital:
+                yield record
+
+    def iter_candidates(
+        self, artist_id: int, api: API, from_cache: bool = None
+    ) -> Iterator[Candidate]:
+        """
+        Yields (release id, artist, master version summary) tuples for the artist
+        releases and master versions, following the releases pages.
+        Digital versions are skipped from their summary format, before fetching
+        their release details.
+        """
+        for release_page in api.iter_releases(artist_id, from_cache=from_cache):
+            for release in release_page["releases"]:
                 if release["artist"] == self.name:
                     artist: Union[Artist, Various] = self
                 elif release["artist"] == "Various":
@@ -167,54 +447,135 @@ class Artist:
                     continue
 
                 if release["type"] == "master":
-                    master_versions_pages = api.get_master_releases(
+                    master_versions = api.get_master_versions(
                         master_id=release["id"], from_cache=from_cache
                     )
-                    for page in master_versions_pages:
-                        for version in page["versions"]:
-                            record = Record(
-                                record_id=version["id"],
-                                artist=artist,
-                                with_artists=self.ARTISTS,
-                                version_raw_data=version,
-                                api=api,
-                                from_cache=from_cache,
-                            )
-                            pbar.update(1)
-                            if not record.is_digital:
-                                records[record.id] = record
+                    for version in master_versions.values():
+                        if not Record.is_digital_summary(version):
+                            yield version["id"], artist, version
                 else:
                     assert release["type"] == "release"
-                    record = Record(
-                        record_id=release["id"],
-                        artist=artist,
-                        with_artists=self.ARTISTS,
-                        api=api,
-                        from_cache=from_cache,
-                    )
-                    pbar.update(1)
-                    if not record.is_digital:
-                        records[record.id] = record
-        return records
+                    if not Record.is_digital_summary(release):
+                        yield release["id"], artist, None
+
+    @staticmethod
+    def batched(iterable: Iterable, size: int) -> Iterator[list]:
+        """Yields lists of size elements of iterable, the last one possibly shorter"""
+        iterator = iter(iterable)
+        while True:
+            batch = list(islice(iterator, size))
+            if not batch:
+                return
+            yield batch
+
+    @staticmethod
+    def parse_releases_details(
+        release_ids: List[int],
+        api: API,
+        from_cache: bool,
+        concurrency: int,
+        pool: Executor,
+        workers: int,
+    ) -> Dict[int, dict]:
+        """
+        Gets the details of the releases. The cached response bodies not parsed yet
+        are parsed and normalized in the pool, see Record.parse_release. The others
+        are fetched, concurrency requests at a time.
+        """
+        entries = api.get_cached_release_entries(release_ids, from_cache=from_cache)
+        releases_details = {
+            release_id: entry.parsed
+            for release_id, entry in entries.items()
+            if entry.parsed is not None
+        }
+        bodies = {
+            release_id: entry.body
+            for release_id, entry in entries.items()
+            if entry.parsed is None
+        }
+        releases_details.update(
+            zip(
+                bodies,
+                pool.map(
+                    Record.parse_release,
+                    bodies.values(),
+                    chunksize=max(1, len(bodies) // (4 * workers)),
+                ),
+            )
+        )
+        missing = [i for i in release_ids if i not in entries]
+        if concurrency > 1:
+            releases_details.update(
+                Artist.fetch_releases_details(
+                    missing, api=api, from_cache=False, concurrency=concurrency
+                )
+            )
+        else:
+            releases_details.update(api.get_many_releases(missing, from_cache=False))
+        return releases_details
+
+    @staticmethod
+    def fetch_releases_details(
+        release_ids: List[int], api: API, from_cache: bool, concurrency: int
+    ) -> Dict[int, dict]:
+        """Fetches the details of the releases, concurrency requests at a time"""
+        async_api = AsyncAPI(api, max_concurrency=concurrency)
+        try:
+            return asyncio.run(
+                async_api.get_many_releases(release_ids, from_cache=from_cache)
+            )
+        finally:
+            async_api.close()
+
+    def refresh_marketplace(
+        self, from_cache: bool = True, concurrency: int = None
+    ) -> int:
+        """
+        Sets the num_for_sale and lowest_price of the records completing the
+        collection, those not in the collection with missing tracks, of the artist
+        and its aliases. Only their marketplace statistics are requested, not their
+        release details, so a fresh for sale check costs one request per candidate
+        record, or none when cached for less than the marketplace TTL.
+        :param from_cache: Set to False to ignore the cached statistics
+        :param concurrency: number of statistics fetched simultaneously (default:
+        the artist concurrency, at least 4)
+        :return: the number of records refreshed
+        """
+        candidates = {
+            record.id: record
+            for an_artist in self.all.values()
+            for record in an_artist.records.values()
+            if isinstance(record, Record)
+            and record.missing_tracks
+            and not record.in_collection
+        }
+        if not candidates:
+            return 0
+        async_api = AsyncAPI(
+            self.api, max_concurrency=concurrency or max(self.concurrency, 4)
+        )
+        try:
+            stats = asyncio.run(
+                async_api.get_many_marketplace_stats(candidates, from_cache=from_cache)
+            )
+        finally:
+            async_api.close()
+        for release_id, release_stats in stats.items():
+            candidates[release_id].set_marketplace_stats(release_stats)
+        logger.info(f"{self} marketplace refreshed for {len(stats)} records")
+        return len(stats)
 
     def get_tracks(self):
         """Returns the list of the artist related Track objects"""
-        return Track.get_all(self)
+        return self.track_registry.get_all(self)
 
     def discover_missing_tracks(self) -> dict:
-        tracks = self.get_tracks()
-        _missing: Dict[str, Dict[str, Track]] = {}
-        for title, title_data in tracks.items():
-            for duration, track in title_data.items():
-                if not track.in_collection and not (
-                    not track.duration and track.alternatives
-                ):
-                    _missing.setdefault(title, {})[duration] = track
-                    for _record_id, record in track.records.items():
-                        assert not record.in_collection
-                        if track not in record.missing_tracks:
-                            record.missing_tracks.append(track)
-        return _missing
+        """
+        Sets the missing tracks of the artist records and returns the artist tracks
+        that are not in the collection, indexed by title then duration. An undated
+        track with a dated alternative is not missing.
+        """
+        return self.get_analysis().discover(self.full_id)
 
     def tracks_report(self):
         """
@@ -226,30 +587,43 @@ class Artist:
 
         :return: A list of tuples
         """
-        tracks_table = [
-            ("", "track", "m:s", "alt", "artist", "record", "", "format", "year", "uri")
-        ]
+        return list(self.iter_tracks_report())
+
+    def iter_tracks_report(self) -> Iterator[tuple]:
+        """
+        Yields the rows of tracks_report(), headers first, without building the
+        whole table
+        """
+        yield (
+            "",
+            "track",
+            "m:s",
+            "alt",
+            "artist",
+            "record",
+            "",
+            "format",
+            "year",
+            "uri",
+        )
         tracks = self.get_tracks()
         for track_title in sorted(tracks):
             track_data = tracks[track_title]
             for duration in sorted(track_data)[::-1]:
                 track = track_data[duration]
                 for _record_id, record in track.records.items():
-                    tracks_table.append(
-                        (
-                            "" if not track.in_collection else "X",
-                            track_title,
-                            duration,
-                            len(track.alternatives),
-                            record.artist.name,
-                            record.title,
-                            "" if not record.in_collection else "X",
-                            record.format,
-                            record.year,
-                            record.url,
-                        )
+                    yield (
+                        "" if not track.in_collection else "X",
+                        track_title,
+                        duration,
+                        track.alternatives_count,
+                        record.artist.name,
+                        record.title,
+                        "" if not record.in_collection else "X",
+                        record.format,
+                        record.year,
+                        record.url,
                     )
-        return tracks_table
 
     def completing_records_report(
         self, min_tracks_number: int = 0, for_sale: bool = False
@@ -260,7 +634,20 @@ class Artist:
         :param for_sale: To only get Records for sale, set this flag to True
         :return: An array of arrays. The first line is the header (nb, record)
         """
-        records_table = [["nb", "record"]]
+        return list(
+            self.iter_completing_records_report(
+                min_tracks_number=min_tracks_number, for_sale=for_sale
+            )
+        )
+
+    def iter_completing_records_report(
+        self, min_tracks_number: int = 0, for_sale: bool = False
+    ) -> Iterator[list]:
+        """
+        Yields the rows of completing_records_report(), header first, without
+        building the whole table
+        """
+        yield ["nb", "record"]
         for missing_nb in sorted(self.completing_records):
             if missing_nb <= min_tracks_number:
                 continue
@@ -269,9 +656,73 @@ class Artist:
             for _release_id, record in with_this_nb.items():
                 if for_sale and not record.num_for_sale:
                     continue
-                records_table.append([missing_nb_s, record])
+                yield [missing_nb_s, record]
                 missing_nb_s = ""
-        return records_table
+
+    @staticmethod
+    def snapshot_settings(
+        slim: bool = False, matcher: TrackMatcher = None
+    ) -> Dict[str, object]:
+        """Returns the settings an artist snapshot must have been built with"""
+        return {
+            "slim": slim,
+            "matcher": matcher.settings() if matcher is not None else None,
+        }
+
+    def save_snapshot(self, path: str = None) -> str:
+        """
+        Writes a snapshot of the artist, its aliases, records and tracks, built
+        first if needed. See load_snapshot()
+        :param path: the snapshot file path (default: Snapshot.path(artist id))
+        :return: the snapshot file path
+        """
+        path = path or Snapshot.path(str(self.id))
+        settings = self.snapshot_settings(self.slim, self.track_registry.matcher)
+        Snapshot.write(path, self.build(), settings)
+        return path
+
+    @classmethod
+    def load_snapshot(
+        cls,
+        artist_id: int,
+        api: API,
+        collection: CollectionIndex = None,
+        max_age: float = None,
+        path: str = None,
+        slim: bool = False,
+        matcher: TrackMatcher = None,
+    ) -> Optional["Artist"]:
+        """
+        Returns the artist of a snapshot written by save_snapshot(), with the api
+        and collection of the current analysis, or None if there is no usable
+        snapshot.
+        :param max_age: number of seconds after which a snapshot is ignored. No
+        limit if not provided.
+        :param path: the snapshot file path (default: Snapshot.path(artist_id))
+        :param slim: the slim mode the snapshot artist must have been built in
+        :param matcher: the settings of this matcher must be the ones of the
+        snapshot artist matcher. No matcher requires exactly matched tracks.
+        """
+        artist = Snapshot.read(
+            path or Snapshot.path(str(artist_id)),
+            max_age,
+            settings=cls.snapshot_settings(slim, matcher),
+        )
+        if artist is None:
+            return None
+        records = artist.track_registry.relink()
+        for an_artist in artist.all.values():
+            an_artist.api, an_artist.collection = api, collection
+            Artist.ARTISTS[an_artist.id] = an_artist
+            records.extend(an_artist.records.values())
+        for record in records:
+            record._api, record.with_artists = api, Artist.ARTISTS
+        return artist
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["api"] = state["collection"] = state["analysis"] = None
+        return state
 
     def __repr__(self):
         return f"Artist({self.name})"
@@ -282,5 +733,9 @@ class Various:
         self.name = "Various"
         self.id, self.all, self.full_id = None, {None: self}, None
 
+    def __reduce__(self):
+        # unpickled as the module various instance
+        return "various"
+
 
 various = Various()
@@ -0,0 +1,138 @@
+from requests.exceptions import RequestException
+
+from .api import API, TooQuicklyRequests  # type: ignore
+from .artist import Artist  # type: ignore
+from .collection import CollectionIndex  # type: ignore
+
+from time import perf_counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import os
+
+from logging import getLogger
+
+logger = getLogger("discogs_track")
+
+
+class Batch:
+    """
+    Analyzes several artists one after the other, with one API and collection
+    index: the Discogs session, the cache and its in-memory tier, the master
+    versions index and the urls fetched by the API are shared. A release or master
+    shared by several artists, like a Various compilation, is fetched and parsed
+    once, even when not from_cache.
+
+    The tracks and completing records reports of each artist are written as tab
+    separated files in output_dir.
+    """
+
+    def __init__(
+        self,
+        api: API,
+        collection: CollectionIndex = None,
+        output_dir: str = ".",
+        for_sale: bool = False,
+        marketplace: bool = False,
+        **artist_options: Any,
+    ):
+        """
+        :param api: instance of API class
+        :param collection: the index of the user's collection
+        :param output_dir: the directory of the reports files (default: ".")
+        :param for_sale: To only report completing records for sale, set this flag
+        to True
+        :param marketplace: Set to True to refresh the for sale figures of the
+        completing records, see Artist.refresh_marketplace()
+        :param artist_options: the other Artist constructor arguments, like
+        from_cache or concurrency
+        """
+        self.api = api
+        self.collection = collection
+        self.output_dir = output_dir
+        self.for_sale = for_sale
+        self.marketplace = marketplace
+        self.artist_options = artist_options
+
+    @staticmethod
+    def read_ids(lines: Iterable[str]) -> List[int]:
+        """Returns the artist ids of lines, ignoring blank lines and # comments"""
+        ids = []
+        for line in lines:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                ids.append(int(line))
+        return ids
+
+    def run(self, artist_ids: Iterable[int]) -> Iterator[Dict[str, Any]]:
+        """Analyzes the artists, once each, and yields their summary"""
+        for artist_id in dict.fromkeys(artist_ids):
+            yield self.analyze(artist_id)
+
+    def analyze(self, artist_id: int) -> Dict[str, Any]:
+        """
+        Analyzes an artist and writes its reports
+        :return: a summary of the analysis. Its error is set when it failed.
+        """
+        summary: Dict[str, Any] = {"id": artist_id, "name": None, "error": None}
+        requests = len(self.api.fetched)
+        start = perf_counter()
+        # the records of an artist must not take the tracks of the previous ones
+        Artist.ARTISTS.clear()
+        try:
+            try:
+                artist = Artist(
+                    artist_id,
+                    api=self.api,
+                    collection=self.collection,
+                    stream=True,
+                    **self.artist_options,
+                )
+            except KeyError as e:
+                # the response of an unknown artist, like a cached 404, has no name
+                raise ValueError(f"artist {artist_id} not found") from e
+            artist.build()
+            if self.marketplace:
+                artist.refresh_marketplace(
+                    from_cache=self.artist_options.get("from_cache", True)
+                )
+            artist.check_for_completing_records()
+            summary.update(
+                name=artist.name,
+                records=len(artist.records),
+                missing_titles=len(artist.missing_tracks),
+                completing_records=sum(
+                    len(records)
+                    for missing_nb, records in artist.completing_records.items()
+                    if missing_nb
+                ),
+                reports=self.write_reports(artist),
+            )
+        except (RequestException, TooQuicklyRequests, ValueError) as e:
+            # ValueError: an unknown artist, or a response body which is not JSON,
+            # like a 502 error page
+            logger.error(f"artist {artist_id} analysis failed: {e!r}")
+            summary["error"] = repr(e)
+        summary["fetched"] = len(self.api.fetched) - requests
+        summary["seconds"] = round(perf_counter() - start, 3)
+        return summary
+
+    def write_reports(self, artist: Artist) -> List[str]:
+        """Writes the artist reports and returns their paths"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = []
+        for name, rows in (
+            ("tracks", artist.iter_tracks_report()),
+            (
+                "completing",
+                artist.iter_completing_records_report(for_sale=self.for_sale),
+            ),
+        ):
+            path = os.path.join(self.output_dir, f"{artist.id}-{name}.tsv")
+            Batch.write_table(path, rows)
+            paths.append(path)
+        return paths
+
+    @staticmethod
+    def write_table(path: str, rows: Iterable[Iterable[Optional[Any]]]) -> None:
+        with open(path, "w") as f:
+            for row in rows:
+                f.write("\t".join(map(str, row)) + "\n")
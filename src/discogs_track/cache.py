@@ -0,0 +1,643 @@
+from redis import Redis
+from ujson import dumps, loads
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Lock
+from time import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+import os
+import re
+import sqlite3
+import zlib
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+MAGIC = b"\x00dt1"
+
+# codec name: (compress, decompress)
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (zlib.compress, zlib.decompress),
+}
+if zstandard is not None:
+    CODECS["zstd"] = (
+        lambda b: zstandard.ZstdCompressor().compress(b),
+        lambda b: zstandard.ZstdDecompressor().decompress(b),
+    )
+
+
+@dataclass
+class CacheEntry:
+    """
+    A cached response body and its metadata.
+
+    Entries are stored as MAGIC, a 2 bytes header length, a JSON header and the
+    body, compressed when the header names a codec. Values stored before this format
+    decode as entries with an unknown fetched_at, see Cache.get_entries().
+
+    The header also keeps the ETag and Last-Modified validators of the response,
+    when it had some, to revalidate the entry with a conditional request.
+    """
+
+    body: bytes
+    fetched_at: Optional[float] = None
+    codec: Optional[str] = None  # the codec of the stored value
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # the object parsed from body, kept along in the in-process cache
+    parsed: Any = field(default=None, compare=False, repr=False)
+
+    def age(self, now: float = None) -> Optional[float]:
+        """Returns the entry age in seconds, or None when it is unknown"""
+        if self.fetched_at is None:
+            return None
+        return (now or time()) - self.fetched_at
+
+    def encode(self, codec: str = None) -> bytes:
+        """
+        :param codec: the CODECS name used to compress the body. Stores it
+        uncompressed if not provided.
+        """
+        header_dict: dict = {"t": self.fetched_at}
+        if self.etag:
+            header_dict["e"] = self.etag
+        if self.last_modified:
+            header_dict["m"] = self.last_modified
+        body = self.body
+        if codec:
+            header_dict["c"] = codec
+            body = CODECS[codec][0](body)
+        header = dumps(header_dict).encode()
+        return b"".join((MAGIC, len(header).to_bytes(2, "big"), header, body))
+
+    @classmethod
+    def decode(cls, value: bytes) -> "CacheEntry":
+        if not value.startswith(MAGIC):
+            return cls(body=value)
+        start = len(MAGIC) + 2
+        end = start + int.from_bytes(value[len(MAGIC) : start], "big")
+        header = loads(value[start:end])
+        body = value[end:]
+        codec = header.get("c")
+        if codec:
+            body = CODECS[codec][1](body)
+        return cls(
+            body=body,
+            fetched_at=header.get("t"),
+            codec=codec,
+            etag=header.get("e"),
+            last_modified=header.get("m"),
+        )
+
+    @property
+    def validators(self) -> Dict[str, str]:
+        """The headers of a conditional request revalidating the entry"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class CacheBackend:
+    """
+    The interface of the stores of encoded cache values. Keys are strings, values
+    are bytes.
+
+    hits and misses count the looked up keys found and not found.
+    """
+
+    name = "none"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        raise NotImplementedError
+
+    def set_many(self, mapping: Dict[str, bytes]) -> None:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def scan(self, match: str) -> Iterator[str]:
+        """Yields the keys matching a glob pattern"""
+        raise NotImplementedError
+
+    def _count(self, values: List[Optional[bytes]]) -> List[Optional[bytes]]:
+        found = sum(value is not None for value in values)
+        self.hits += found
+        self.misses += len(values) - found
+        return values
+
+    def info(self) -> Dict[str, Any]:
+        looked_up = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / looked_up, 3) if looked_up else None,
+        }
+
+
+class RedisBackend(CacheBackend):
+    name = "redis"
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0):
+        super().__init__()
+        self._redis = Redis(host=host, port=port, db=db)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._count([self._redis.get(key)])[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self._count(self._redis.mget(keys)) if keys else []
+
+    def set_many(self, mapping: Dict[str, bytes]) -> None:
+        if not mapping:
+            return
+        pipeline = self._redis.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipeline.set(key, value)
+        pipeline.execute()
+
+    def exists(self, key: str) -> bool:
+        return bool(self._redis.exists(key))
+
+    def scan(self, match: str) -> Iterator[str]:
+        for key in self._redis.scan_iter(match=match, count=500):
+            yield key.decode()
+
+
+class SQLiteBackend(CacheBackend):
+    """A single file store, for machines without Redis"""
+
+    name = "sqlite"
+    MAX_PARAMETERS = 500
+
+    def __init__(self, path: str = "~/.cache/discogs_track/cache.sqlite"):
+        super().__init__()
+        self.path = os.path.expanduser(path)
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)"
+            )
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            for start in range(0, len(keys), SQLiteBackend.MAX_PARAMETERS):
+                chunk = keys[start : start + SQLiteBackend.MAX_PARAMETERS]
+                found.update(
+                    self._db.execute(
+                        "SELECT key, value FROM cache WHERE key IN "
+                        f"({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                )
+        return self._count([found.get(key) for key in keys])
+
+    def set_many(self, mapping: Dict[str, bytes]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                mapping.items(),
+            )
+
+    def exists(self, key: str) -> bool:
+        with self._lock:
+            return bool(
+                self._db.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone()
+            )
+
+    def scan(self, match: str) -> Iterator[str]:
+        with self._lock:
+            keys = [
+                key
+                for (key,) in self._db.execute(
+                    "SELECT key FROM cache WHERE key GLOB ?", (match,)
+                )
+            ]
+        yield from keys
+
+
+class LRUCache:
+    """
+    A bounded in-process store of cache entries, keeping the parsed objects along
+    with the bodies. The least recently used entries are evicted beyond max_entries
+    entries or max_bytes bytes of memory.
+
+    The memory of an entry is estimated from its body length, see size(): a parsed
+    Discogs response holds about PARSED_RATIO times its body length, once parsed
+    on its first read.
+    """
+
+    PARSED_RATIO = 6
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 256 * 2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    @staticmethod
+    def size(entry: CacheEntry) -> int:
+        """Returns the estimated memory of an entry body and parsed object"""
+        return len(entry.body) * (1 + LRUCache.PARSED_RATIO)
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        size = LRUCache.size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= LRUCache.size(previous)
+            self._entries[key] = entry
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self.bytes -= LRUCache.size(evicted)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def info(self) -> Dict[str, Any]:
+        looked_up = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / looked_up, 3) if looked_up else None,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "evictions": self.evictions,
+        }
+
+
+class Cache:
+    """
+    The two tiers store of Discogs responses: an in-process LRUCache (L1) in front
+    of a Redis or SQLite backend (L2).
+
+    L2 bodies larger than min_compress_size bytes are stored compressed with codec.
+    bytes_raw and bytes_stored count the bytes written before and after compression.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend = None,
+        memory: Optional[LRUCache] = None,
+        codec: Optional[str] = "zlib",
+        min_compress_size: int = 256,
+    ):
+        """
+        :param backend: the L2 store. Takes a local RedisBackend if not provided.
+        :param memory: the L1 store, or None to not keep entries in memory
+        :param codec: the CODECS name used to compress values, or None to store
+        them uncompressed (default: "zlib")
+        :param min_compress_size: smaller bodies are stored uncompressed
+        (default: 256)
+        """
+        if codec is not None and codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec}, expected one of {list(CODECS)}")
+        self.backend = backend or RedisBackend()
+        self.memory = memory
+        self.codec = codec
+        self.min_compress_size = min_compress_size
+        self.bytes_raw = 0
+        self.bytes_stored = 0
+
+    @classmethod
+    def from_config(cls, options: Mapping[str, str]) -> "Cache":
+        """
+        Creates a Cache from the options of a config file Cache section:
+            [Cache]
+            backend = redis  # or sqlite
+            redis_host = localhost
+            redis_port = 6379
+            redis_db = 0
+            sqlite_path = ~/.cache/discogs_track/cache.sqlite
+            memory_entries = 10000  # 0 disables the in-process cache
+            memory_bytes = 268435456
+            codec = zlib  # or zstd, or none
+        """
+        backend_name = options.get("backend", "redis")
+        backend: CacheBackend
+        if backend_name == "redis":
+            backend = RedisBackend(
+                host=options.get("redis_host", "localhost"),
+                port=int(options.get("redis_port", 6379)),
+                db=int(options.get("redis_db", 0)),
+            )
+        elif backend_name == "sqlite":
+            backend = SQLiteBackend(
+                options.get("sqlite_path", "~/.cache/discogs_track/cache.sqlite")
+            )
+        else:
+            raise ValueError(f"Unknown cache backend {backend_name}")
+        memory_entries = int(options.get("memory_entries", 10000))
+        memory = (
+            LRUCache(
+                max_entries=memory_entries,
+                max_bytes=int(options.get("memory_bytes", 256 * 2**20)),
+            )
+            if memory_entries
+            else None
+        )
+        codec = options.get("codec", "zlib")
+        return cls(backend, memory, codec=None if codec == "none" else codec)
+
+    def __getitem__(self, key: str) -> Union[bytes, None]:
+        return self.get(key)
+
+    def __setitem__(self, key: str, value: Union[str, bytes]) -> None:
+        self.set_entry(key, self.new_entry(value))
+
+    def __contains__(self, key: str) -> bool:
+        return self.backend.exists(key)
+
+    @staticmethod
+    def new_entry(
+        value: Union[str, bytes],
+        parsed: Any = None,
+        etag: str = None,
+        last_modified: str = None,
+    ) -> CacheEntry:
+        body = value.encode() if isinstance(value, str) else value
+        return CacheEntry(
+            body=body,
+            fetched_at=time(),
+            parsed=parsed,
+            etag=etag,
+            last_modified=last_modified,
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Single round trip lookup: returns None when the key is not cached"""
+        entry = self.get_entry(key)
+        return entry.body if entry else None
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        return self.get_entries([key])[0]
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Looks up several keys with one L2 round trip. Missing keys give None"""
+        return [entry.body if entry else None for entry in self.get_entries(keys)]
+
+    def get_entries(self, keys: List[str]) -> List[Optional[CacheEntry]]:
+        """
+        Looks up keys in L1, then the missing ones in L2, promoting L2 hits.
+        The entries of unknown age, stored before the entry format, are given the
+        current time as fetched_at and written back, so that they expire a TTL after
+        the upgrade instead of being all fetched again at once. Except the ones of
+        the ALWAYS_REVALIDATE endpoints, left expired, see CachePolicy.dates_legacy.
+        """
+        entries = [
+            self.memory.get(key) if self.memory is not None else None for key in keys
+        ]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if not missing:
+            return entries
+        values = self.backend.get_many([keys[i] for i in missing])
+        dated: Dict[str, CacheEntry] = {}
+        for i, value in zip(missing, values):
+            if value is not None:
+                entry = entries[i] = CacheEntry.decode(value)
+                if entry.fetched_at is None and CachePolicy.dates_legacy(keys[i]):
+                    entry.fetched_at = time()
+                    dated[keys[i]] = entry
+                if self.memory is not None:
+                    self.memory.set(keys[i], entry)
+        if dated:
+            self.backend.set_many(
+                {key: self.encode(entry) for key, entry in dated.items()}
+            )
+        return entries
+
+    def codec_for(self, entry: CacheEntry) -> Optional[str]:
+        return self.codec if len(entry.body) >= self.min_compress_size else None
+
+    def encode(self, entry: CacheEntry) -> bytes:
+        value = entry.encode(self.codec_for(entry))
+        self.bytes_raw += len(entry.body)
+        self.bytes_stored += len(value)
+        return value
+
+    def set_entry(self, key: str, entry: CacheEntry) -> None:
+        self.set_entries({key: entry})
+
+    def set_entries(self, entries: Dict[str, CacheEntry]) -> None:
+        """Stores entries in L1, and in L2 with one round trip"""
+        if not entries:
+            return
+        if self.memory is not None:
+            for key, entry in entries.items():
+                self.memory.set(key, entry)
+        self.backend.set_many(
+            {key: self.encode(entry) for key, entry in entries.items()}
+        )
+
+    def set_many(self, mapping: Dict[str, Union[str, bytes]]) -> None:
+        """Stores several values in one L2 round trip"""
+        self.set_entries({key: self.new_entry(value) for key, value in mapping.items()})
+
+    def migrate(self, match: str = "https://api.discogs.com/*") -> Dict[str, int]:
+        """
+        Rewrites the values stored uncompressed, or in a former format, with the
+        cache codec. Entry ages are kept, the entries of unknown age are given the
+        migration time, unless left expired by CachePolicy.dates_legacy.
+        :param match: the pattern of the keys to migrate
+        :return: a report of the number of keys scanned and migrated, and of the
+        size of the migrated values before and after
+        """
+        report = {"scanned": 0, "migrated": 0, "bytes_before": 0, "bytes_after": 0}
+        keys: List[str] = []
+        for key in self.backend.scan(match):
+            keys.append(key)
+            if len(keys) == 500:
+                self._migrate_keys(keys, report)
+                keys = []
+        self._migrate_keys(keys, report)
+        return report
+
+    def _migrate_keys(self, keys: List[str], report: Dict[str, int]) -> None:
+        migrated = {}
+        for key, value in zip(keys, self.backend.get_many(keys)):
+            report["scanned"] += 1
+            if value is None:
+                continue
+            entry = CacheEntry.decode(value)
+            if value.startswith(MAGIC) and entry.codec == self.codec_for(entry):
+                continue
+            if entry.fetched_at is None and CachePolicy.dates_legacy(key):
+                entry.fetched_at = time()
+            migrated[key] = self.encode(entry)
+            report["migrated"] += 1
+            report["bytes_before"] += len(value)
+            report["bytes_after"] += len(migrated[key])
+        self.backend.set_many(migrated)
+
+    def info(self) -> Dict[str, Any]:
+        """Returns the statistics of each tier"""
+        info: Dict[str, Any] = {}
+        if self.memory is not None:
+            info.update({f"l1.{k}": v for k, v in self.memory.info().items()})
+        info.update({f"l2.{k}": v for k, v in self.backend.info().items()})
+        info.update({"bytes_raw": self.bytes_raw, "bytes_stored": self.bytes_stored})
+        return info
+
+
+class CachePolicy:
+    """
+    Time to live of the cached responses, per endpoint class.
+
+    Artist and release bodies hardly change and are kept long. Collection, stats and
+    marketplace responses are kept a short time. An entry older than its endpoint
+    TTL is stale: with stale_while_revalidate, the caller is served the stale entry
+    right away and the API refreshes it in the background. The stale entries of the
+    ALWAYS_REVALIDATE endpoint classes, the collection and the for sale figures, are
+    fetched again before being returned, as the user expects them up to date.
+    """
+
+    # (endpoint class, URL path pattern), first match wins
+    ENDPOINTS = (
+        ("stats", re.compile(r"/releases/\d+/stats")),
+        ("marketplace", re.compile(r"/marketplace/")),
+        ("collection", re.compile(r"/users/[^/]+/collection/")),
+        ("master_versions", re.compile(r"/masters/\d+/versions")),
+        ("artist_releases", re.compile(r"/artists/\d+/releases")),
+        ("release", re.compile(r"/releases/\d+")),
+        ("artist", re.compile(r"/artists/\d+")),
+    )
+
+    DAY = 24 * 3600.0
+    TTLS: Dict[str, Optional[float]] = {
+        "artist": 30 * DAY,
+        "release": 30 * DAY,
+        "master_versions": 7 * DAY,
+        "artist_releases": DAY,
+        "stats": 3600.0,
+        "marketplace": 3600.0,
+        "collection": 600.0,
+        "other": None,
+    }
+
+    ALWAYS_REVALIDATE: FrozenSet[str] = frozenset(("collection", "marketplace"))
+
+    # The top-level fields Record reads, per endpoint class
+    PROJECTIONS: Dict[str, FrozenSet[str]] = {
+        "release": frozenset(
+            (
+                "id",
+                "title",
+                "uri",
+                "year",
+                "released",
+                "master_id",
+                "artists",
+                "format",
+                "formats",
+                "tracklist",
+                "stats",
+                "num_for_sale",
+                "lowest_price",
+            )
+        ),
+    }
+
+    def __init__(
+        self,
+        ttls: Dict[str, Optional[float]] = None,
+        stale_while_revalidate: bool = True,
+        project: bool = False,
+    ):
+        """
+        :param ttls: TTL in seconds overriding TTLS, per endpoint class. None never
+        expires.
+        :param stale_while_revalidate: Set to False to fetch stale entries again
+        before returning them (default: True)
+        :param project: Set to True to only cache the PROJECTIONS fields of
+        responses (default: False)
+        """
+        self.ttls = dict(CachePolicy.TTLS, **(ttls or {}))
+        self.stale_while_revalidate = stale_while_revalidate
+        self.project = project
+
+    @staticmethod
+    def endpoint(url: str) -> str:
+        for name, pattern in CachePolicy.ENDPOINTS:
+            if pattern.search(url):
+                return name
+        return "other"
+
+    @staticmethod
+    def dates_legacy(url: str) -> bool:
+        """
+        Returns whether an entry of url of unknown age, stored before the entry
+        format, may count its age from now. The ALWAYS_REVALIDATE ones may be
+        months old: they stay of unknown age, thus expired.
+        """
+        return CachePolicy.endpoint(url) not in CachePolicy.ALWAYS_REVALIDATE
+
+    def ttl(self, url: str) -> Optional[float]:
+        return self.ttls.get(self.endpoint(url))
+
+    def is_fresh(self, url: str, entry: CacheEntry, now: float = None) -> bool:
+        ttl = self.ttl(url)
+        if ttl is None:
+            return True
+        age = entry.age(now)
+        return age is not None and age <= ttl
+
+    def serves_stale(self, url: str) -> bool:
+        """Returns whether a stale entry of url is served while revalidated"""
+        return (
+            self.stale_while_revalidate
+            and self.endpoint(url) not in CachePolicy.ALWAYS_REVALIDATE
+        )
+
+    def projection(self, url: str) -> Optional[FrozenSet[str]]:
+        """Returns the fields of url responses to cache, or None to cache them all"""
+        if not self.project:
+            return None
+        return CachePolicy.PROJECTIONS.get(self.endpoint(url))
@@ -1,21 +1,99 @@
 import click
 from tabulate import tabulate
 
-from .api import API, Cache  # type: ignore
+from .api import API, Cache, CachePolicy, Config, RateLimiter  # type: ignore
 from .artist import Artist  # type: ignore
+from .batch import Batch  # type: ignore
+from .collection import CollectionIndex  # type: ignore
+from .matching import TrackMatcher  # type: ignore
+from .planner import Planner  # type: ignore
+from .warm import Warmer, WarmQueue  # type: ignore
 
 from logging import getLogger, basicConfig, DEBUG, INFO
+from itertools import chain
 from pprint import pprint
+from time import sleep
+from typing import Iterator, Optional
+from ujson import dumps
 
 logger = getLogger("discogs_track")
 
 
+def print_table(rows: Iterator, stream: bool = False):
+    """
+    Prints a table whose first row is the headers. Streamed, the rows are printed
+    tab separated as they are produced, instead of being aligned by tabulate once
+    all are known.
+    """
+    headers = next(rows)
+    if stream:
+        for row in chain([headers], rows):
+            print("\t".join(map(str, row)), flush=True)
+    else:
+        print(tabulate(list(rows), headers=headers))
+
+
 @click.group("discogs_track")
 @click.version_option()
 @click.option("-v", "--verbose", count=True)
 @click.option("--from-cache/--no-from-cache", default=True)
+@click.option(
+    "-c",
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=1,
+    help="number of simultaneous Discogs requests",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="number of processes parsing the cached releases",
+)
+@click.option(
+    "--collection-index/--no-collection-index",
+    default=True,
+    help="download the whole collection once instead of looking up each release",
+)
+@click.option(
+    "--stale/--no-stale",
+    default=True,
+    help="serve expired cached responses while refreshing them in background",
+)
+@click.option(
+    "--project/--no-project",
+    default=False,
+    help="only cache the release fields used by discogs_track",
+)
+@click.option(
+    "--cache-backend",
+    type=click.Choice(["redis", "sqlite"]),
+    help="overrides the config file Cache backend (default: redis)",
+)
+@click.option(
+    "--stats", is_flag=True, help="print requests, cache and timing metrics at exit"
+)
+@click.option(
+    "--stats-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="write the metrics at exit, in Prometheus text format if FILE ends with "
+    ".prom, as JSON otherwise",
+)
 @click.pass_context
-def cli(ctx, from_cache: bool, verbose: int):
+def cli(
+    ctx,
+    from_cache: bool,
+    verbose: int,
+    concurrency: int,
+    workers: int,
+    collection_index: bool,
+    stale: bool,
+    project: bool,
+    cache_backend: str,
+    stats: bool,
+    stats_file: str,
+):
     ctx.ensure_object(dict)
     basicConfig()
     if verbose == 1:
@@ -23,49 +101,258 @@ def cli(ctx, from_cache: bool, verbose: int):
     elif verbose > 1:
         logger.setLevel(DEBUG)
     ctx.obj["from_cache"] = from_cache
-    ctx.obj["api"] = API()
+    config = Config()
+    cache_options = dict(config.cache_options)
+    if cache_backend:
+        cache_options["backend"] = cache_backend
+    ctx.obj["api"] = API(
+        config,
+        cache=Cache.from_config(cache_options),
+        max_concurrency=concurrency,
+        cache_policy=CachePolicy(stale_while_revalidate=stale, project=project),
+    )
     ctx.obj["verbose"] = verbose
+    ctx.obj["concurrency"] = concurrency
+    ctx.obj["workers"] = workers
+    ctx.obj["collection"] = (
+        CollectionIndex(ctx.obj["api"]) if collection_index else None
+    )
     if verbose > 2:
         for line in tabulate(ctx.obj["api"].cache.info().items()).split("\n"):
             logger.debug(f"{ line}")
+    if stats or stats_file:
+        ctx.call_on_close(lambda: report_metrics(ctx.obj["api"], stats, stats_file))
+
+
+def report_metrics(api: API, stats: bool, stats_file: Optional[str]):
+    metrics = api.collect_metrics()
+    if stats:
+        click.echo(
+            tabulate(metrics.summary(), headers=("metric", "labels", "value")),
+            err=True,
+        )
+    if stats_file:
+        with open(stats_file, "w") as f:
+            if stats_file.endswith(".prom"):
+                f.write(metrics.prometheus())
+            else:
+                f.write(dumps(metrics.as_dict(), indent=2))
+
+
+def matching_options(command):
+    """Adds the options of the fuzzy tracks matching, see get_matcher()"""
+    for option in reversed(
+        (
+            click.option(
+                "--fuzzy",
+                is_flag=True,
+                help="merge the tracks whose title or duration differ slightly",
+            ),
+            click.option(
+                "--duration-tolerance",
+                type=click.IntRange(min=0),
+                default=1,
+                show_default=True,
+                metavar="SECONDS",
+                help="maximum duration difference of fuzzy matching tracks",
+            ),
+            click.option(
+                "--title-similarity",
+                type=click.FloatRange(min=0, max=1),
+                default=0,
+                metavar="RATIO",
+                help="also merge the titles whose trigrams similarity reaches RATIO",
+            ),
+        )
+    ):
+        command = option(command)
+    return command
+
+
+def get_matcher(
+    fuzzy: bool, duration_tolerance: int, title_similarity: float
+) -> Optional[TrackMatcher]:
+    if not fuzzy:
+        return None
+    return TrackMatcher(
+        duration_tolerance=duration_tolerance, title_similarity=title_similarity
+    )
 
 
 @cli.group("artist")
 @click.option("-i", "--id", type=click.INT, required=True, help="discogs artist id")
+@click.option(
+    "--slim", is_flag=True, help="only keep in memory the record fields reported"
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="reuse the artist analysis saved by the previous incremental run",
+)
+@click.option(
+    "--snapshot",
+    type=click.FloatRange(min=0),
+    metavar="HOURS",
+    help="reuse the artist snapshot if newer than HOURS, else save a new one",
+)
+@matching_options
 @click.pass_context
-def artist(ctx, id: int):
+def artist(
+    ctx,
+    id: int,
+    slim: bool,
+    incremental: bool,
+    snapshot: float,
+    fuzzy: bool,
+    duration_tolerance: int,
+    title_similarity: float,
+):
+    matcher = get_matcher(fuzzy, duration_tolerance, title_similarity)
+    if snapshot is not None and ctx.obj["from_cache"]:
+        ctx.obj["artist"] = Artist.load_snapshot(
+            id,
+            api=ctx.obj["api"],
+            collection=ctx.obj["collection"],
+            max_age=snapshot * 3600,
+            slim=slim,
+            matcher=matcher,
+        )
+        if ctx.obj["artist"] is not None:
+            changed = ctx.obj["artist"].refresh_collection()
+            logger.info(
+                f"{ctx.obj['artist']} loaded from snapshot, "
+                f"{changed} tracks entered or left the collection since"
+            )
+            return
     ctx.obj["artist"] = Artist(
         api=ctx.obj["api"],
         artist_id=id,
         verbosity=ctx.obj["verbose"],
         from_cache=ctx.obj["from_cache"],
+        concurrency=ctx.obj["concurrency"],
+        workers=ctx.obj["workers"],
+        collection=ctx.obj["collection"],
+        slim=slim,
+        stream=True,
+        incremental=incremental,
+        matcher=matcher,
+    )
+    if snapshot is not None:
+
+        def save_snapshot():
+            if ctx.obj["artist"].complete:
+                path = ctx.obj["artist"].save_snapshot()
+                logger.info(f"{ctx.obj['artist']} snapshot saved in {path}")
+
+        ctx.call_on_close(save_snapshot)
+
+
+stream_option = click.option(
+    "--stream", is_flag=True, help="print tab separated rows as they are produced"
+)
+marketplace_option = click.option(
+    "-m",
+    "--marketplace",
+    is_flag=True,
+    help="refresh the for sale figures of the completing records only",
+)
+
+
+@artist.command()
+@click.pass_context
+def show_records(ctx):
+    """Display the artist records as they are fetched"""
+    print_table(
+        chain(
+            [("", "artist", "record", "format", "year", "uri")],
+            (
+                (
+                    "" if not record.in_collection else "X",
+                    record.artist.name,
+                    record.title,
+                    record.format,
+                    record.year,
+                    record.url,
+                )
+                for record in ctx.obj["artist"].stream_records()
+            ),
+        ),
+        stream=True,
     )
 
 
 @artist.command()
+@stream_option
 @click.pass_context
-def show_tracks(ctx):
+def show_tracks(ctx, stream: bool):
     """Display details of artist tracks"""
-    tracks_table = ctx.obj["artist"].tracks_report()
-    print(tabulate(tracks_table[1:], headers=tracks_table[0]))
+    print_table(ctx.obj["artist"].build().iter_tracks_report(), stream=stream)
 
 
 @artist.command()
+@stream_option
+@marketplace_option
 @click.pass_context
 @click.option("-s", "--for-sale", is_flag=True)
-def show_completing(ctx, for_sale: bool):
+def show_completing(ctx, for_sale: bool, stream: bool, marketplace: bool):
     """Display details of records needed to complete the artist tracks collection"""
-    artist = ctx.obj["artist"]
+    artist = ctx.obj["artist"].build()
+    if marketplace:
+        artist.refresh_marketplace(from_cache=ctx.obj["from_cache"])
     artist.check_for_completing_records()
-    record_table = artist.completing_records_report(for_sale=for_sale)
-    print(tabulate(record_table[1:], headers=record_table[0]))
+    print_table(artist.iter_completing_records_report(for_sale=for_sale), stream=stream)
+
+
+@artist.command()
+@marketplace_option
+@click.pass_context
+@click.option("-s", "--for-sale", is_flag=True)
+@click.option(
+    "-w",
+    "--weight",
+    type=click.Choice(sorted(Planner.WEIGHTS)),
+    default="records",
+    show_default=True,
+    help="minimize the number of records, their price or their scarcity",
+)
+@click.option(
+    "--by-title", is_flag=True, help="any duration of a missing title covers it"
+)
+@click.option(
+    "--exact/--greedy",
+    default=None,
+    help="search a minimum plan, or only run the greedy algorithm "
+    "(default: exact for small plans)",
+)
+def show_plan(
+    ctx, for_sale: bool, weight: str, by_title: bool, exact: bool, marketplace: bool
+):
+    """Display the fewest or cheapest records giving the missing artist tracks"""
+    artist = ctx.obj["artist"].build()
+    if marketplace:
+        artist.refresh_marketplace(from_cache=ctx.obj["from_cache"])
+    plan = Planner.from_artist(
+        artist, weight=weight, for_sale=for_sale, by_title=by_title
+    ).plan(exact=exact)
+    covered = 0
+    rows = []
+    for rank, step in enumerate(plan.steps, 1):
+        covered += len(step.tracks)
+        rows.append((rank, len(step.tracks), covered, f"{step.cost:g}", step.record))
+    print(tabulate(rows, headers=("#", "new", "covered", "cost", "record")))
+    print(
+        f"{len(plan.steps)} records, cost {plan.cost:g}, {plan.covered}/{plan.missing}"
+        f" missing tracks{' (minimum)' if plan.exact else ''}"
+    )
+    if plan.uncoverable:
+        print(f"not in any candidate record: {plan.uncoverable}")
 
 
 @artist.group("release")
 @click.option("-i", "--id", type=click.INT, required=True, help="discogs release id")
 @click.pass_context
 def release(ctx, id: int):
-    ctx.obj["record"] = ctx.obj["artist"].records[int(id)]
+    ctx.obj["record"] = ctx.obj["artist"].build().records[int(id)]
 
 
 @release.command()
@@ -76,5 +363,167 @@ def show(ctx):
     pprint([(t, t.alternatives) for ts in record.tracks.values() for t in ts])
 
 
+@cli.command()
+@click.argument("artist_ids", nargs=-1, type=click.INT)
+@click.option(
+    "-f",
+    "--file",
+    "ids_file",
+    type=click.File(),
+    help="file of artist ids, one per line, # comments allowed",
+)
+@click.option(
+    "-o",
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    default=".",
+    show_default=True,
+    help="directory of the ID-tracks.tsv and ID-completing.tsv reports",
+)
+@click.option("-s", "--for-sale", is_flag=True)
+@marketplace_option
+@click.option("--slim", is_flag=True)
+@click.option("--incremental", is_flag=True)
+@matching_options
+@click.pass_context
+def batch(
+    ctx,
+    artist_ids: tuple,
+    ids_file,
+    output_dir: str,
+    for_sale: bool,
+    marketplace: bool,
+    slim: bool,
+    incremental: bool,
+    fuzzy: bool,
+    duration_tolerance: int,
+    title_similarity: float,
+):
+    """Analyze several artists in one process, sharing requests and cache"""
+    ids = list(artist_ids) + (Batch.read_ids(ids_file) if ids_file else [])
+    if not ids:
+        raise click.UsageError("no artist id given")
+    summaries = list(
+        Batch(
+            ctx.obj["api"],
+            collection=ctx.obj["collection"],
+            output_dir=output_dir,
+            for_sale=for_sale,
+            marketplace=marketplace,
+            from_cache=ctx.obj["from_cache"],
+            verbosity=ctx.obj["verbose"],
+            concurrency=ctx.obj["concurrency"],
+            workers=ctx.obj["workers"],
+            slim=slim,
+            incremental=incremental,
+            matcher=get_matcher(fuzzy, duration_tolerance, title_similarity),
+        ).run(ids)
+    )
+    columns = (
+        "id",
+        "name",
+        "records",
+        "missing_titles",
+        "completing_records",
+        "fetched",
+        "seconds",
+    )
+    print(
+        tabulate(
+            [[summary.get(c) for c in columns] for summary in summaries],
+            headers=columns,
+        )
+    )
+    failed = [summary for summary in summaries if summary["error"]]
+    for summary in failed:
+        click.echo(f"artist {summary['id']}: {summary['error']}", err=True)
+    if failed:
+        ctx.exit(1)
+
+
+@cli.group("cache")
+def cache():
+    """Manage the Discogs responses cache"""
+
+
+@cache.command()
+@click.option("-m", "--match", default="https://api.discogs.com/*", show_default=True)
+@click.pass_context
+def migrate(ctx, match: str):
+    """Compress the cached responses stored in a former format"""
+    report = ctx.obj["api"].cache.migrate(match=match)
+    saved = report["bytes_before"] - report["bytes_after"]
+    print(tabulate(report.items()))
+    print(f"{saved} bytes saved")
+
+
+@cache.command()
+@click.argument("artist_ids", nargs=-1, type=click.INT)
+@click.option(
+    "-f",
+    "--file",
+    "ids_file",
+    type=click.File(),
+    help="watchlist file of artist ids, one per line, # comments allowed",
+)
+@click.option(
+    "--per-minute",
+    type=click.IntRange(min=1),
+    default=30,
+    show_default=True,
+    help="maximum requests per minute, leaving the rest of the quota to other runs",
+)
+@click.option(
+    "--max-requests", type=click.IntRange(min=1), help="stop after this many requests"
+)
+@click.option(
+    "--daemon",
+    is_flag=True,
+    help="warm the watchlist again every --interval seconds, until killed",
+)
+@click.option(
+    "--interval", type=click.FloatRange(min=0), default=3600.0, show_default=True
+)
+@click.option(
+    "--lease",
+    type=click.FloatRange(min=0),
+    default=300.0,
+    show_default=True,
+    help="seconds after which the urls claimed by a killed warmer are queued again",
+)
+@click.option("--clear", is_flag=True, help="empty the queue first")
+@click.pass_context
+def warm(
+    ctx,
+    artist_ids: tuple,
+    ids_file,
+    per_minute: int,
+    max_requests: Optional[int],
+    daemon: bool,
+    interval: float,
+    lease: float,
+    clear: bool,
+):
+    """Prefetch the responses of the analysis of a watchlist of artists"""
+    api = ctx.obj["api"]
+    try:
+        queue = WarmQueue.for_backend(api.cache.backend)
+    except ValueError as e:
+        raise click.UsageError(str(e)) from e
+    if clear:
+        queue.clear()
+    api.rate_limiter = RateLimiter(min(per_minute, api.max_per_minute))
+    ids = list(artist_ids) + (Batch.read_ids(ids_file) if ids_file else [])
+    warmer = Warmer(api, queue, collection=ctx.obj["collection"], lease=lease)
+    while True:
+        queued = warmer.watch(ids)
+        stats = warmer.drain(max_requests=max_requests)
+        logger.info(f"cache warmed: {queued} urls queued, {stats}, {queue.info()}")
+        print(tabulate({**stats, **queue.info()}.items()))
+        if not daemon:
+            break
+        sleep(interval)
+
+
 if __name__ == "__main__":
     cli()
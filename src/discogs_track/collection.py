@@ -0,0 +1,75 @@
+from .api import API  # type: ignore
+
+from threading import Lock
+from time import time
+from typing import Optional, Set
+
+from logging import getLogger
+
+logger = getLogger("discogs_track")
+
+
+class CollectionIndex:
+    """
+    Hosts the release ids and master ids of the whole user's collection, for O(1)
+    "is it in my collection?" lookups.
+
+    The collection "All" folder is downloaded at once, 500 items per page, on first
+    use and again when it is older than max_age seconds.
+    """
+
+    def __init__(self, api: API, max_age: float = 3600.0):
+        """
+        :param api: instance of API class
+        :param max_age: number of seconds after which the collection is downloaded
+        again (default: 3600)
+        """
+        self.api = api
+        self.max_age = max_age
+        self.release_ids: Set[int] = set()
+        self.master_ids: Set[int] = set()
+        self.refreshed_at: Optional[float] = None
+        self._lock = Lock()
+
+    @property
+    def is_stale(self) -> bool:
+        return self.refreshed_at is None or time() - self.refreshed_at > self.max_age
+
+    def refresh(self, from_cache: bool = True) -> None:
+        """
+        Downloads the user's collection and rebuilds the index
+        :param from_cache: True to get the collection pages from cache if the cache
+        policy considers them fresh enough (default: True)
+        """
+        release_ids, master_ids = set(), set()
+        for page in self.api.get_collection_releases(from_cache=from_cache):
+            for item in page["releases"]:
+                release_ids.add(item["id"])
+                master_id = item.get("basic_information", {}).get("master_id")
+                if master_id:
+                    master_ids.add(master_id)
+        self.release_ids, self.master_ids = release_ids, master_ids
+        self.refreshed_at = time()
+        logger.info(
+            f"collection index: {len(release_ids)} releases, {len(master_ids)} masters"
+        )
+
+    def refresh_if_stale(self) -> None:
+        with self._lock:
+            if self.is_stale:
+                self.refresh()
+
+    def has_master(self, master_id: int) -> bool:
+        self.refresh_if_stale()
+        return master_id in self.master_ids
+
+    def __contains__(self, release_id: int) -> bool:
+        self.refresh_if_stale()
+        return release_id in self.release_ids
+
+    def __len__(self) -> int:
+        self.refresh_if_stale()
+        return len(self.release_ids)
+
+    def __repr__(self):
+        return f"CollectionIndex({len(self.release_ids)} releases)"
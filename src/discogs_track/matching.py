@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+from math import ceil
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple, TYPE_CHECKING
+import re
+import unicodedata
+
+if TYPE_CHECKING:
+    from .track import Track, TrackRegistry  # type: ignore
+
+# (artist full id, title, duration)
+TrackKey = Tuple[Optional[str], str, str]
+
+
+class TrackMatcher:
+    """
+    Matches a track to a registered track of the same artist whose title and
+    duration differ slightly, like "Song (Remastered)" and "song", or 3:30 and
+    3:31, so that they count as one track.
+
+    Titles match when their keys are equal: the title case folded, without accents,
+    punctuation and version annotations like "(Remastered)" or "- 2009 Remaster".
+    With a title_similarity, titles also match when the Jaccard index of the
+    trigrams of their keys reaches it.
+
+    The comparisons are limited by blocking: the title keys of an artist are
+    indexed, as well as their trigrams, and a track is only compared by duration to
+    the tracks of its title group, see TrackRegistry. Undated tracks only match
+    undated tracks.
+
+    A key of n trigrams can only reach the title_similarity t with a key of m
+    trigrams sharing at least t / (1 + t) * (n + m) of them, so t * n at least, and
+    when t * n <= m <= n / t. The similar keys are then looked up by the n - t * n
+    + 1 rarest trigrams of the key only, one of which they share, and the other
+    keys found are compared when their size passes these bounds.
+
+    merges counts the distinct (artist, title, duration) tracks matched to another
+    track, by kind:
+    - "title": the title differs, the key is the same
+    - "duration": only the duration differs, within the duration_tolerance
+    - "similar": the title key differs, within the title_similarity
+    """
+
+    VERSIONS = (
+        r"remaster(?:ed)?",
+        r"album version",
+        r"lp version",
+        r"single version",
+        r"bonus track",
+    )
+
+    def __init__(
+        self,
+        casefold: bool = True,
+        strip_versions: bool = True,
+        duration_tolerance: int = 1,
+        title_similarity: float = 0.0,
+    ):
+        """
+        :param casefold: Set to False to tell titles apart by their case
+        :param strip_versions: Set to False to keep the version annotations in the
+        title keys
+        :param duration_tolerance: maximum difference, in seconds, of the durations
+        of matching tracks (default: 1)
+        :param title_similarity: minimum trigrams Jaccard index of similar title
+        keys, between 0 and 1. 0 disables the similar titles matching (default: 0)
+        """
+        self.casefold = casefold
+        self.strip_versions = strip_versions
+        self.duration_tolerance = duration_tolerance
+        self.title_similarity = title_similarity
+        versions = "|".join(TrackMatcher.VERSIONS)
+        self.versions_pattern = re.compile(
+            rf"\s*[(\[][^)\]]*\b(?:{versions})\b[^)\]]*[)\]]"
+            rf"|\s+-\s+(?:\d{{4}}\s+)?(?:digital(?:ly)?\s+)?(?:{versions})\b.*$",
+            re.IGNORECASE,
+        )
+        # artist full id -> title key -> group id
+        self.groups: Dict[Optional[str], Dict[str, int]] = {}
+        # artist full id -> trigram -> title keys
+        self.grams: Dict[Optional[str], Dict[str, Set[str]]] = {}
+        # artist full id -> title key -> trigrams
+        self.key_grams: Dict[Optional[str], Dict[str, FrozenSet[str]]] = {}
+        self.matched: Dict[TrackKey, int] = {}  # -> track id
+        self.merges: Dict[str, int] = {"title": 0, "duration": 0, "similar": 0}
+
+    def fresh(self) -> TrackMatcher:
+        """Returns a matcher of the same settings, with an empty index"""
+        return TrackMatcher(**self.settings())
+
+    def settings(self) -> Dict[str, Any]:
+        """Returns the constructor arguments of the matcher"""
+        return {
+            "casefold": self.casefold,
+            "strip_versions": self.strip_versions,
+            "duration_tolerance": self.duration_tolerance,
+            "title_similarity": self.title_similarity,
+        }
+
+    @property
+    def merges_number(self) -> int:
+        return sum(self.merges.values())
+
+    def title_key(self, title: str) -> str:
+        if self.strip_versions:
+            title = self.versions_pattern.sub("", title)
+        if self.casefold:
+            title = title.casefold()
+        title = unicodedata.normalize("NFKD", title)
+        title = "".join(c for c in title if not unicodedata.combining(c))
+        title = title.replace("&", " and ")
+        return " ".join(re.sub(r"[^\w]+", " ", title).split()) or title.strip()
+
+    @staticmethod
+    def trigrams(key: str) -> FrozenSet[str]:
+        padded = f"  {key} "
+        return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+    @staticmethod
+    def seconds(duration: str) -> Optional[int]:
+        """Returns the seconds of a m:ss or h:mm:ss duration, None if undated"""
+        try:
+            seconds = 0
+            for part in duration.split(":"):
+                seconds = seconds * 60 + int(part)
+            return seconds
+        except ValueError:
+            return None
+
+    def register(self, artist_full_id: Optional[str], title: str, group_id: int):
+        """Indexes the title group of a new artist title"""
+        key = self.title_key(title)
+        groups = self.groups.setdefault(artist_full_id, {})
+        if key in groups:
+            return
+        groups[key] = group_id
+        if self.title_similarity:
+            key_grams = TrackMatcher.trigrams(key)
+            self.key_grams.setdefault(artist_full_id, {})[key] = key_grams
+            grams = self.grams.setdefault(artist_full_id, {})
+            for gram in key_grams:
+                grams.setdefault(gram, set()).add(key)
+
+    def group(
+        self, artist_full_id: Optional[str], title: str
+    ) -> Tuple[Optional[int], bool]:
+        """
+        :return: the group id of the artist title, None if unknown, and whether the
+        title is only similar to the group one
+        """
+        key = self.title_key(title)
+        groups = self.groups.get(artist_full_id, {})
+        group_id = groups.get(key)
+        if group_id is not None or not self.title_similarity:
+            return group_id, False
+        key_grams = TrackMatcher.trigrams(key)
+        grams = self.grams.get(artist_full_id, {})
+        others_grams = self.key_grams.get(artist_full_id, {})
+        t, size = self.title_similarity, len(key_grams)
+        # the blocking: the keys sharing one of the rarest trigrams of key
+        probed = sorted(key_grams, key=lambda gram: len(grams.get(gram, ())))
+        candidates: Set[str] = set()
+        for gram in probed[: size - ceil(t * size - 1e-9) + 1]:
+            candidates.update(grams.get(gram, ()))
+        best, best_similarity = None, t
+        for other in candidates:
+            other_grams = others_grams[other]
+            other_size = len(other_grams)
+            if not t * size - 1e-9 <= other_size <= size / t + 1e-9:
+                continue
+            count = len(key_grams & other_grams)
+            if count < t / (1 + t) * (size + other_size) - 1e-9:
+                continue
+            similarity = count / (size + other_size - count)
+            if similarity > best_similarity or (
+                similarity == best_similarity
+                and (best is None or groups[other] < groups[best])
+            ):
+                best, best_similarity = other, similarity
+        return (None, False) if best is None else (groups[best], True)
+
+    def match(
+        self,
+        registry: TrackRegistry,
+        artist_full_id: Optional[str],
+        title: str,
+        duration: str,
+    ) -> Optional[Track]:
+        """Returns the registered track matching the title and duration, if any"""
+        key = (artist_full_id, title, duration)
+        track_id = self.matched.get(key)
+        if track_id is not None:
+            return registry.tracks[track_id]
+        group_id, similar = self.group(artist_full_id, title)
+        if group_id is None:
+            return None
+        group = registry.groups[group_id]
+        track = group.get(duration) or self.nearest(group.values(), duration)
+        if track is None:
+            return None
+        self.matched[key] = track.id
+        if similar:
+            self.merges["similar"] += 1
+        elif track.title != title:
+            self.merges["title"] += 1
+        else:
+            self.merges["duration"] += 1
+        return track
+
+    def nearest(self, tracks, duration: str) -> Optional[Track]:
+        """Returns the track of the closest duration within the tolerance"""
+        seconds = TrackMatcher.seconds(duration)
+        if seconds is None:
+            return None
+        candidates: List[Tuple[int, int, Track]] = []
+        for track in tracks:
+            other = TrackMatcher.seconds(track.duration)
+            if other is not None and abs(other - seconds) <= self.duration_tolerance:
+                candidates.append((abs(other - seconds), track.id, track))
+        return min(candidates)[2] if candidates else None
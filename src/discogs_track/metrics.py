@@ -0,0 +1,183 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# (metric name, sorted (label, value) pairs)
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    """
+    Counts observed values in cumulative buckets, Prometheus style: buckets[i] counts
+    the values lower or equal to bounds[i].
+    """
+
+    BOUNDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, bounds: Tuple[float, ...] = BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)  # not cumulative, see buckets
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        if index < len(self.bounds):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def buckets(self) -> List[int]:
+        cumulated, buckets = 0, []
+        for count in self.counts:
+            cumulated += count
+            buckets.append(cumulated)
+        return buckets
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns the bound of the bucket of the q quantile, None if unknown"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, cumulated in zip(self.bounds, self.buckets):
+            if cumulated >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Hosts the counters, gauges and histograms of an analysis, each identified by a
+    name and labels, and exports them as a text summary, a JSON-able dict or the
+    Prometheus text format.
+
+    Names follow the Prometheus conventions: counters end with _total, durations are
+    in seconds.
+    """
+
+    prefix = "discogs_track_"
+
+    def __init__(self):
+        self.counters: Dict[Key, float] = {}
+        self.gauges: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def key(name: str, labels: Dict[str, str]) -> Key:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = Metrics.key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        self.gauges[Metrics.key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = Metrics.key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observes in the name histogram the duration of the with block"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - start, **labels)
+
+    def counter(self, name: str, **labels) -> float:
+        """Returns the sum of the name counters matching labels"""
+        return sum(
+            value
+            for (key_name, key_labels), value in self.counters.items()
+            if key_name == name and set(labels.items()) <= set(key_labels)
+        )
+
+    @staticmethod
+    def quote(value) -> str:
+        """Quotes a label value, escaped as the Prometheus text format expects"""
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        return '"' + escaped.replace("\n", "\\n") + '"'
+
+    @staticmethod
+    def labels_string(labels: Tuple[Tuple[str, str], ...]) -> str:
+        return ",".join(f"{k}={Metrics.quote(v)}" for k, v in labels)
+
+    def summary(self) -> List[Tuple[str, str, str]]:
+        """Returns (metric, labels, value) rows, histograms summed up"""
+        rows = []
+        for (name, labels), value in sorted({**self.counters, **self.gauges}.items()):
+            rows.append((name, Metrics.labels_string(labels), f"{value:g}"))
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            p95 = histogram.quantile(0.95)
+            rows.append(
+                (
+                    name,
+                    Metrics.labels_string(labels),
+                    f"n={histogram.count} sum={histogram.sum:.3f} "
+                    f"avg={histogram.sum / histogram.count:.4f} p95<={p95:g}",
+                )
+            )
+        return rows
+
+    def as_dict(self) -> Dict[str, list]:
+        return {
+            "counters": [
+                {"name": n, "labels": dict(ls), "value": v}
+                for (n, ls), v in sorted(self.counters.items())
+            ],
+            "gauges": [
+                {"name": n, "labels": dict(ls), "value": v}
+                for (n, ls), v in sorted(self.gauges.items())
+            ],
+            "histograms": [
+                {
+                    "name": n,
+                    "labels": dict(ls),
+                    "count": h.count,
+                    "sum": h.sum,
+                    "buckets": dict(zip(map(str, h.bounds), h.buckets)),
+                }
+                for (n, ls), h in sorted(self.histograms.items())
+            ],
+        }
+
+    def prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        typed = set()
+
+        def sample(name: str, labels: Tuple[Tuple[str, str], ...], value) -> None:
+            labels_string = Metrics.labels_string(labels)
+            braces = f"{{{labels_string}}}" if labels_string else ""
+            lines.append(f"{self.prefix}{name}{braces} {value}")
+
+        def type_line(name: str, type_: str) -> None:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {self.prefix}{name} {type_}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            type_line(name, "counter")
+            sample(name, labels, value)
+        for (name, labels), value in sorted(self.gauges.items()):
+            type_line(name, "gauge")
+            sample(name, labels, value)
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            type_line(name, "histogram")
+            for bound, cumulated in zip(histogram.bounds, histogram.buckets):
+                sample(f"{name}_bucket", labels + (("le", f"{bound:g}"),), cumulated)
+            sample(f"{name}_bucket", labels + (("le", "+Inf"),), histogram.count)
+            sample(f"{name}_sum", labels, histogram.sum)
+            sample(f"{name}_count", labels, histogram.count)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,285 @@
+from .analysis import bits, popcount  # type: ignore
+from .record import Record  # type: ignore
+from .track import Track  # type: ignore
+
+from dataclasses import dataclass, field
+from heapq import heapify, heappop, heappush
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from logging import getLogger
+
+logger = getLogger("discogs_track")
+
+
+@dataclass
+class PlanStep:
+    record: Record
+    tracks: List[Track]  # the missing tracks the record adds to the previous steps
+    cost: float
+
+
+@dataclass
+class Plan:
+    """
+    A shopping list of records giving the missing tracks, ranked by the number of
+    tracks each adds to the previous ones over its cost.
+    """
+
+    steps: List[PlanStep] = field(default_factory=list)
+    missing: int = 0  # the number of missing tracks to cover
+    uncoverable: List[Track] = field(default_factory=list)  # in no candidate record
+    exact: bool = False  # True when the plan is a proven minimum cost cover
+
+    @property
+    def cost(self) -> float:
+        return sum(step.cost for step in self.steps)
+
+    @property
+    def covered(self) -> int:
+        return sum(len(step.tracks) for step in self.steps)
+
+
+class Planner:
+    """
+    Plans the records to get to complete the collection with the missing tracks of
+    an artist: a weighted set cover of the missing tracks by the records that are
+    not in the collection.
+
+    The tracks covered by a record are a bitset, as a Python int. A lazy greedy
+    algorithm gives a cover within a log factor of the optimum. For small
+    instances, a branch and bound search finds a minimum cost cover, and falls back
+    to the greedy one when it exceeds its nodes budget.
+
+    The cost of a record depends on the weight:
+    - "records": 1, to get the fewest records
+    - "price": its lowest price, to get the cheapest ones
+    - "availability": 1 / its number of copies for sale, to get the easiest to find
+    Records without price or copies for sale are not candidates of the last two,
+    nor of any weight when for_sale. The marketplace figures are not read from
+    cache, see Record and Artist.refresh_marketplace().
+    """
+
+    WEIGHTS: Dict[str, Callable[[Record], Optional[float]]] = {
+        "records": lambda record: 1.0,
+        "price": lambda record: record.lowest_price or None,
+        "availability": lambda record: (
+            1.0 / record.num_for_sale if record.num_for_sale else None
+        ),
+    }
+
+    def __init__(
+        self,
+        records: Iterable[Record],
+        missing_tracks: Iterable[Track],
+        weight: str = "records",
+        for_sale: bool = False,
+        by_title: bool = False,
+        exact_max_candidates: int = 40,
+        nodes_budget: int = 200000,
+    ):
+        """
+        :param records: the candidate records, those in the collection are skipped
+        :param missing_tracks: the tracks to cover
+        :param weight: one of WEIGHTS (default: "records")
+        :param for_sale: To only plan records for sale, set this flag to True
+        :param by_title: Set to True to cover each missing title once, whatever the
+        duration
+        :param exact_max_candidates: maximum number of candidates for which plan()
+        searches a minimum cover by default (default: 40)
+        :param nodes_budget: maximum number of nodes of the exact search
+        """
+        if weight not in Planner.WEIGHTS:
+            raise ValueError(
+                f"Unknown weight {weight}, expected one of {list(Planner.WEIGHTS)}"
+            )
+        self.weight = weight
+        self.by_title = by_title
+        self.exact_max_candidates = exact_max_candidates
+        self.nodes_budget = nodes_budget
+
+        # the elements to cover, and their bit index
+        self.elements: List[List[Track]] = []
+        self.bits: Dict[Hashable, int] = {}
+        for track in missing_tracks:
+            key = self.key(track)
+            if key not in self.bits:
+                self.bits[key] = len(self.elements)
+                self.elements.append([])
+            self.elements[self.bits[key]].append(track)
+        self.universe = (1 << len(self.elements)) - 1
+
+        cost_of = Planner.WEIGHTS[weight]
+        self.candidates: List[Record] = []
+        self.masks: List[int] = []
+        self.costs: List[float] = []
+        cheapest: Dict[int, int] = {}  # mask -> index of its cheapest candidate
+        for record in records:
+            if record.in_collection or (for_sale and not record.num_for_sale):
+                continue
+            mask = self.mask(record)
+            cost = cost_of(record)
+            if not mask or cost is None:
+                continue
+            index = cheapest.get(mask)
+            if index is not None:
+                if cost < self.costs[index]:
+                    self.candidates[index], self.costs[index] = record, cost
+                continue
+            cheapest[mask] = len(self.candidates)
+            self.candidates.append(record)
+            self.masks.append(mask)
+            self.costs.append(cost)
+
+    @classmethod
+    def from_artist(cls, artist, **kwargs) -> "Planner":
+        """
+        Returns the planner of the missing tracks of an artist and its aliases, once
+        discovered, over their records
+        """
+        records = {}
+        missing_tracks = []
+        for an_artist in artist.all.values():
+            records.update(an_artist.records)
+            for tracks in an_artist.missing_tracks.values():
+                missing_tracks.extend(tracks.values())
+        return cls(records.values(), missing_tracks, **kwargs)
+
+    def key(self, track: Track) -> Hashable:
+        if self.by_title:
+            return track.artist.full_id if track.artist else None, track.title
+        return track.id
+
+    def mask(self, record: Record) -> int:
+        mask = 0
+        for track in record.missing_tracks:
+            bit = self.bits.get(self.key(track))
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def plan(self, exact: Optional[bool] = None) -> Plan:
+        """
+        :param exact: True to search a minimum cost cover, False to only run the
+        greedy algorithm. By default, the minimum is searched when there are at most
+        exact_max_candidates candidates.
+        """
+        coverable = 0
+        for mask in self.masks:
+            coverable |= mask
+        chosen = self.greedy(coverable)
+        is_exact = False
+        if exact or (
+            exact is None and len(self.candidates) <= self.exact_max_candidates
+        ):
+            minimum = self.minimum(coverable, chosen)
+            if minimum is not None:
+                chosen, is_exact = self.rank(minimum), True
+        plan = Plan(missing=len(self.elements), exact=is_exact)
+        covered = 0
+        for index in chosen:
+            new = self.masks[index] & ~covered
+            covered |= new
+            plan.steps.append(
+                PlanStep(self.candidates[index], self.tracks(new), self.costs[index])
+            )
+        plan.uncoverable = self.tracks(self.universe & ~coverable)
+        return plan
+
+    def tracks(self, mask: int) -> List[Track]:
+        """Returns the first track of each element of mask"""
+        return [self.elements[bit][0] for bit in bits(mask)]
+
+    def greedy(
+        self, universe: int, indexes: Optional[Iterable[int]] = None
+    ) -> List[int]:
+        """
+        Returns the candidate indexes covering universe, picking at each step the
+        candidate with the most uncovered elements over its cost. As these ratios can
+        only decrease, they are computed again only when a candidate reaches the
+        heap top.
+        """
+        indexes = range(len(self.candidates)) if indexes is None else indexes
+        heap: List[Tuple[float, float, int]] = [
+            (-popcount(self.masks[i] & universe) / self.costs[i], self.costs[i], i)
+            for i in indexes
+        ]
+        heapify(heap)
+        uncovered, chosen = universe, []
+        while uncovered and heap:
+            _ratio, cost, index = heappop(heap)
+            gain = popcount(self.masks[index] & uncovered)
+            if not gain:
+                continue
+            ratio = -gain / cost
+            if heap and ratio > heap[0][0]:
+                heappush(heap, (ratio, cost, index))
+                continue
+            chosen.append(index)
+            uncovered &= ~self.masks[index]
+        return chosen
+
+    def rank(self, indexes: List[int]) -> List[int]:
+        """Orders a cover as the greedy algorithm would pick its candidates"""
+        universe = 0
+        for index in indexes:
+            universe |= self.masks[index]
+        ranked = self.greedy(universe, indexes)
+        return ranked + [i for i in indexes if i not in ranked]
+
+    def minimum(self, universe: int, upper: List[int]) -> Optional[List[int]]:
+        """
+        Returns the indexes of a minimum cost cover of universe, by a branch and
+        bound search on the element with the fewest candidates. None when the
+        search exceeds the nodes budget.
+        :param upper: a cover of universe, the initial bound
+        """
+        covering: Dict[int, List[int]] = {}
+        for index, mask in enumerate(self.masks):
+            for bit in bits(mask):
+                covering.setdefault(bit, []).append(index)
+        for candidates in covering.values():
+            candidates.sort(key=lambda i: self.costs[i] / popcount(self.masks[i]))
+        min_cost = min(self.costs) if self.costs else 0.0
+        max_gain = max(map(popcount, self.masks)) if self.masks else 1
+        best_cost, best_cover = sum(self.costs[i] for i in upper), list(upper)
+        nodes = 0
+
+        def search(uncovered: int, chosen: List[int], cost: float) -> bool:
+            nonlocal nodes, best_cost, best_cover
+            nodes += 1
+            if nodes > self.nodes_budget:
+                return False
+            if not uncovered:
+                if cost < best_cost:
+                    best_cost, best_cover = cost, list(chosen)
+                return True
+            # at least ceil(uncovered / max_gain) more candidates are needed
+            lower = cost + -(-popcount(uncovered) // max_gain) * min_cost
+            if lower >= best_cost - 1e-9:
+                return True
+            bit = min(
+                (b for b in covering if uncovered >> b & 1),
+                key=lambda b: len(covering[b]),
+            )
+            for index in covering[bit]:
+                chosen.append(index)
+                complete = search(
+                    uncovered & ~self.masks[index], chosen, cost + self.costs[index]
+                )
+                chosen.pop()
+                if not complete:
+                    return False
+            return True
+
+        if not search(universe, [], 0.0):
+            logger.info(f"set cover search stopped after {self.nodes_budget} nodes")
+            return None
+        return best_cover
@@ -1,8 +1,9 @@
 from __future__ import annotations
-from typing import Dict, Optional, TYPE_CHECKING
+from typing import ClassVar, Dict, Optional, Tuple, TYPE_CHECKING
 
 from .api import API  # type: ignore
-from .track import Track  # type: ignore
+from .collection import CollectionIndex  # type: ignore
+from .track import Track, TrackRegistry  # type: ignore
 
 if TYPE_CHECKING:
     from .artist import Artist  # type: ignore
@@ -23,9 +24,38 @@ class Record:
     number of release tracks
     - track_artist_ids: List of Discogs ids of all tracks contributing ARTISTS
     - tracks: dict of Track objects lists for a specific artist in the record
+    - num_for_sale, lowest_price: the release marketplace figures, None when the
+    release details are read from cache until set_marketplace_stats()
+
+    In slim mode, the raw release and version data are dropped once the record is
+    built, and raw is reloaded from the API cache when read.
     """
 
-    raw: dict
+    __slots__ = (
+        "_raw",
+        "_api",
+        "version_raw",
+        "id",
+        "artist",
+        "with_artists",
+        "track_registry",
+        "artists",
+        "artist_full_id",
+        "title",
+        "url",
+        "format",
+        "year",
+        "is_digital",
+        "num_for_sale",
+        "lowest_price",
+        "tracks",
+        "track_artist_ids",
+        "missing_tracks",
+        "missing_tracks_ratio",
+        "in_collection",
+    )
+
+    _raw: Optional[dict]
     version_raw: Optional[dict]
     id: int
     artists: dict
@@ -36,12 +66,27 @@ class Record:
     year: str
     is_digital: bool
     num_for_sale: Optional[int]
+    lowest_price: Optional[float]
     tracks: dict
     track_artist_ids: set
     missing_tracks: list
     missing_tracks_ratio: dict
     in_collection: bool
 
+    DIGITAL_FORMATS: ClassVar[Tuple[str, ...]] = ("AIFF", "FLAC", "MP3")
+    # the release details fields kept as is by normalize_release
+    NORMALIZED_FIELDS: ClassVar[Tuple[str, ...]] = (
+        "id",
+        "title",
+        "uri",
+        "year",
+        "released",
+        "master_id",
+        "stats",
+        "num_for_sale",
+        "lowest_price",
+    )
+
     def __init__(
         self,
         record_id: int,
@@ -50,6 +95,10 @@ class Record:
         from_cache: bool = True,
         api: API = None,
         version_raw_data: dict = None,
+        release_raw_data: dict = None,
+        collection: CollectionIndex = None,
+        track_registry: TrackRegistry = None,
+        slim: bool = False,
     ):
 
         assert artist is not None
@@ -57,6 +106,9 @@ class Record:
         self.id = record_id
         self.artist = artist
         self.with_artists = with_artists
+        self.track_registry = (
+            track_registry if track_registry is not None else TrackRegistry()
+        )
         self.artist_full_id = artist.full_id
         self.tracks = {}
         self.missing_tracks = []
@@ -64,9 +116,12 @@ class Record:
 
         if api is None:
             api = API()
-        release_details = api.get_release(release_id=self.id, from_cache=from_cache)
+        release_details = release_raw_data or api.get_release(
+            release_id=self.id, from_cache=from_cache
+        )
 
-        self.raw = release_details
+        self._raw = release_details
+        self._api = api
         self.title = release_details["title"]
         self.url = release_details.get("uri")
         self.year = release_details.get(
@@ -76,34 +131,108 @@ class Record:
         if version_raw_data:
             self.version_raw = version_raw_data
         elif "master_id" in release_details:
-            master = api.get_master_releases(
+            self.version_raw = api.get_master_versions(
                 master_id=release_details["master_id"], from_cache=from_cache
-            )
-            for page in master:
-                for version in page["versions"]:
-                    if version["id"] == self.id:
-                        self.version_raw = version
-                        break
+            ).get(self.id)
         else:
             self.version_raw = None
 
-        self.__init_in_collection(api, release_details)
+        self.__init_in_collection(api, release_details, collection)
 
         self.track_artist_ids = set()
         self.num_for_sale = (
             None if from_cache else release_details.get("num_for_sale", 0)
         )
+        self.lowest_price = None if from_cache else release_details.get("lowest_price")
 
         self.__init_format()
-        self.is_digital = (
-            "AIFF" in self.format or "FLAC" in self.format or "MP3" in self.format
-        )
+        self.is_digital = Record.is_digital_format(self.format)
+
+        with api.metrics.timer("track_registration_seconds"):
+            self.__init_tracks()
+
+        if slim:
+            self._raw = self.version_raw = None
+            for tracks in self.tracks.values():
+                for track in tracks:
+                    track.raw = None
+
+    @property
+    def raw(self) -> dict:
+        """The release details. Reloaded from the API cache in slim mode"""
+        if self._raw is None:
+            return self._api.get_release(release_id=self.id, from_cache=True)
+        return self._raw
+
+    @staticmethod
+    def is_digital_format(format_: str) -> bool:
+        return any(digital in format_ for digital in Record.DIGITAL_FORMATS)
+
+    @staticmethod
+    def is_digital_summary(summary: dict) -> bool:
+        """
+        Tells from a master version or an artist release summary, before fetching
+        the release details, whether the record is digital.
+        :param summary: a master versions or artist releases array element
+        :return: True if the summary format is digital, False if it is not or unknown
+        """
+        return Record.is_digital_format(summary.get("format") or "")
+
+    @staticmethod
+    def normalize_release(release: dict) -> dict:
+        """
+        Returns the release details fields read by Record, as plain data: the format
+        string is already built, and the tracklist only holds the tracks, with their
+        normalized title and duration and the ids of their artists. The result can
+        be given as release_raw_data.
+        """
+        normalized = {
+            key: release[key] for key in Record.NORMALIZED_FIELDS if key in release
+        }
+        artists = [{"id": artist["id"]} for artist in release.get("artists", [])]
+        normalized["artists"] = artists
+        normalized["format"] = Record.format_string(release)
+        normalized["tracklist"] = [
+            {
+                "type_": "track",
+                "title": Track.normalize_title(track_dict["title"]),
+                "duration": Track.normalize_duration(track_dict["duration"]),
+                "artists": [
+                    {"id": artist["id"]}
+                    for artist in track_dict.get("artists", artists)
+                ],
+            }
+            for track_dict in release["tracklist"]
+            if track_dict["type_"] == "track"
+        ]
+        return normalized
 
-        self.__init_tracks()
+    @staticmethod
+    def parse_release(body: bytes) -> dict:
+        """
+        Parses and normalizes a release details response body. Being a plain
+        function of plain data, it can run in worker processes.
+        """
+        return Record.normalize_release(API.loads_or_fail(body))
 
-    def __init_in_collection(self, api, release_details):
+    @staticmethod
+    def format_string(release: dict) -> str:
+        """Returns the formatted format of release details or summary"""
+        if "format" in release:
+            return release["format"]
+        format_ = ", ".join(sorted(f["name"] for f in release["formats"]))
+        format_descriptions = ", ".join(
+            ", ".join(sorted(f.get("descriptions", []))) for f in release["formats"]
+        )
+        if format_descriptions:
+            format_ = f"{format_}, {format_descriptions}"
+        return format_
+
+    def __init_in_collection(self, api, release_details, collection):
         self.in_collection = False
-        if "stats" in release_details:
+        if collection is not None:
+            self.in_collection = self.id in collection
+        elif "stats" in release_details:
             self.in_collection = release_details["stats"]["user"]["in_collection"] != 0
         elif self.version_raw and "stats" in self.version_raw:
             self.in_collection = self.version_raw["stats"]["user"]["in_collection"] != 0
@@ -119,16 +248,7 @@ class Record:
                 self.in_collection = False
 
     def __init_format(self):
-        if "format" in self.raw:
-            self.format = self.raw["format"]
-        else:
-            self.format = ", ".join(sorted(f["name"] for f in self.raw["formats"]))
-            format_descriptions = ", ".join(
-                ", ".join(sorted(f.get("descriptions", [])))
-                for f in self.raw["formats"]
-            )
-            if format_descriptions:
-                self.format = f"{self.format}, {format_descriptions}"
+        self.format = Record.format_string(self.raw)
 
     def __init_tracks(self):
         """Create the record related Track objects and registers them.
@@ -143,12 +263,12 @@ class Record:
             self.track_artist_ids.update(
                 {
                     artist["id"]
-                    for artist in track_dict.get("ARTISTS", self.raw.get("ARTISTS", []))
+                    for artist in track_dict.get("artists", self.raw.get("artists", []))
                 }
             )
             track_artist_ids = {
                 artist["id"]
-                for artist in track_dict.get("ARTISTS", self.raw.get("ARTISTS", []))
+                for artist in track_dict.get("artists", self.raw.get("artists", []))
             }
             if self.with_artists:
                 track_artist_ids = track_artist_ids.intersection(self.with_artists)
@@ -158,11 +278,26 @@ class Record:
                     if self.with_artists
                     else self.artist
                 )
-                track = Track.get_or_create(track_dict, self, artist=track_artist)
+                track = self.track_registry.get_or_create(
+                    track_dict, self, artist=track_artist
+                )
                 self.tracks.setdefault(
                     track_artist.full_id if track_artist else None, []
                 ).append(track)
 
+    def set_marketplace_stats(self, stats: dict) -> None:
+        """
+        Sets num_for_sale and lowest_price from the release marketplace statistics,
+        see API.get_marketplace_stats()
+        """
+        self.num_for_sale = stats.get("num_for_sale") or 0
+        lowest_price = stats.get("lowest_price")
+        self.lowest_price = (
+            lowest_price.get("value")
+            if isinstance(lowest_price, dict)
+            else lowest_price
+        )
+
     def set_missing_tracks_ratio(self, artist_ids: str):
         # _missing_tracks are set by the Artist get_missing_tracks() method. This is weird.
         if self.in_collection:
@@ -176,6 +311,30 @@ class Record:
     def __hash__(self):
         return hash((self.id,))
 
+    def __getstate__(self) -> dict:
+        """
+        The record pickled state. Its tracks are kept as their registry ids, so that
+        pickling does not recurse along the records and tracks graph: see
+        TrackRegistry.relink(). Like in slim mode, the raw data are not kept, nor is
+        the api.
+        """
+        state = {
+            slot: getattr(self, slot)
+            for slot in Record.__slots__
+            if hasattr(self, slot)
+        }
+        state["_raw"] = state["version_raw"] = state["_api"] = None
+        state["tracks"] = {
+            full_id: [track.id for track in tracks]
+            for full_id, tracks in self.tracks.items()
+        }
+        state["missing_tracks"] = [track.id for track in self.missing_tracks]
+        return state
+
+    def __setstate__(self, state: dict):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
     def __repr__(self):
         return (
             f"{self.__class__.__name__}"
@@ -0,0 +1,83 @@
+from . import __version__  # type: ignore
+
+from time import time
+from typing import Any, Dict, Optional
+from ujson import dumps, loads
+import os
+import pickle
+
+from logging import getLogger
+
+logger = getLogger("discogs_track")
+
+
+class Snapshot:
+    """
+    Reads and writes the snapshot files of analyzed objects.
+
+    A snapshot is MAGIC, a 2 bytes header length, a JSON header and the pickled
+    object. The header holds the snapshot FORMAT, the package version, the
+    snapshot time and the settings the object was built with: a snapshot written by
+    another FORMAT or package version is ignored, as the pickled classes may have
+    changed, and so is a snapshot of other settings.
+    """
+
+    MAGIC = b"\x00dts"
+    FORMAT = 2
+    DIRECTORY = "~/.cache/discogs_track/snapshots"
+
+    @staticmethod
+    def path(name: str, directory: str = None) -> str:
+        return os.path.join(
+            os.path.expanduser(directory or Snapshot.DIRECTORY), f"{name}.snap"
+        )
+
+    @staticmethod
+    def write(path: str, obj: Any, settings: Dict[str, Any] = None) -> None:
+        """
+        :param settings: the JSON serializable settings obj was built with
+        """
+        header = dumps(
+            {"f": Snapshot.FORMAT, "v": __version__, "t": time(), "s": settings or {}}
+        ).encode()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(Snapshot.MAGIC + len(header).to_bytes(2, "big") + header)
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def read(
+        path: str, max_age: float = None, settings: Dict[str, Any] = None
+    ) -> Optional[Any]:
+        """
+        Returns the object of a snapshot file, or None when there is no usable one
+        :param path: the snapshot file path
+        :param max_age: number of seconds after which a snapshot is ignored. No
+        limit if not provided.
+        :param settings: the settings the object must have been built with, see
+        write()
+        """
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(Snapshot.MAGIC)) != Snapshot.MAGIC:
+                    logger.info(f"{path} is not a snapshot")
+                    return None
+                header = loads(f.read(int.from_bytes(f.read(2), "big")))
+                if header.get("f") != Snapshot.FORMAT or header.get("v") != __version__:
+                    logger.info(f"{path} snapshot format or version ignored")
+                    return None
+                if header.get("s") != loads(dumps(settings or {})):
+                    logger.info(f"{path} snapshot of other settings ignored")
+                    return None
+                if max_age is not None and time() - header["t"] > max_age:
+                    logger.info(f"{path} snapshot is too old")
+                    return None
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError) as e:
+            # a truncated file, or a class renamed within a version
+            logger.warning(f"{path} snapshot ignored: {e!r}")
+            return None
@@ -0,0 +1,96 @@
+from .cache import Cache  # type: ignore
+
+from time import time
+from typing import Dict, Optional, Set
+from ujson import dumps, loads
+
+from logging import getLogger
+
+logger = getLogger("discogs_track")
+
+
+class ArtistState:
+    """
+    Hosts the persisted analysis of an artist: the normalized details of the
+    releases its records were built from (see Record.normalize_release), and the
+    ids of the ones in the user's collection.
+
+    The state is stored in the cache backend, next to the Discogs responses. A later
+    analysis of the artist reuses the details of the known releases, and only fetches
+    the new releases and master versions. The records and tracks are then built
+    again in memory, without parsing a response, and the collection changes are
+    taken from the collection index.
+    """
+
+    VERSION = 1
+    KEY = "discogs_track:state:artist:{artist_id}"
+
+    def __init__(
+        self,
+        artist_id: int,
+        releases: Dict[int, dict] = None,
+        in_collection: Set[int] = None,
+        saved_at: float = None,
+    ):
+        """
+        :param artist_id: the Discogs artist id
+        :param releases: the normalized release details, indexed by release id
+        :param in_collection: the ids of the releases in the user's collection
+        :param saved_at: the timestamp of the analysis, None if never saved
+        """
+        self.artist_id = artist_id
+        self.releases: Dict[int, dict] = releases or {}
+        self.in_collection: Set[int] = in_collection or set()
+        self.saved_at = saved_at
+
+    @property
+    def key(self) -> str:
+        return ArtistState.KEY.format(artist_id=self.artist_id)
+
+    @classmethod
+    def load(cls, cache: Cache, artist_id: int) -> Optional["ArtistState"]:
+        """
+        Returns the saved state of the artist, None if there is none or if it was
+        saved in another VERSION
+        """
+        entry = cache.get_entry(cls.KEY.format(artist_id=artist_id))
+        if entry is None:
+            return None
+        data = loads(entry.body)
+        if data.get("v") != cls.VERSION:
+            logger.info(f"artist {artist_id} state version {data.get('v')} ignored")
+            return None
+        return cls(
+            artist_id,
+            releases={int(i): details for i, details in data["releases"].items()},
+            in_collection=set(data["in_collection"]),
+            saved_at=entry.fetched_at,
+        )
+
+    def save(self, cache: Cache) -> None:
+        data = {
+            "v": ArtistState.VERSION,
+            "releases": self.releases,
+            "in_collection": sorted(self.in_collection),
+        }
+        entry = cache.new_entry(dumps(data))
+        cache.set_entry(self.key, entry)
+        self.saved_at = entry.fetched_at
+
+    def diff(self, other: "ArtistState") -> Dict[str, int]:
+        """
+        Counts the changes from other, an earlier state of the same artist
+        :return: the numbers of new, dropped and known releases, and of the known
+        releases which entered or left the collection
+        """
+        known = self.releases.keys() & other.releases.keys()
+        return {
+            "new": len(self.releases.keys() - other.releases.keys()),
+            "dropped": len(other.releases.keys() - self.releases.keys()),
+            "known": len(known),
+            "collected": len(known & (self.in_collection - other.in_collection)),
+            "uncollected": len(known & (other.in_collection - self.in_collection)),
+        }
+
+    def __repr__(self):
+        return f"ArtistState({self.artist_id}, {len(self.releases)} releases)"
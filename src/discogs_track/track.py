@@ -1,56 +1,71 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Dict, Optional, ClassVar, TYPE_CHECKING
+from typing import Dict, List, Optional, Set, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from .record import Record  # type: ignore
     from .artist import Artist  # type: ignore
+    from .matching import TrackMatcher  # type: ignore
 
 
 @dataclass
 class Track:
-    raw: dict
+    __slots__ = (
+        "raw",
+        "artist",
+        "title",
+        "duration",
+        "records",
+        "in_collection",
+        "id",
+        "group_id",
+        "registry",
+    )
+
+    raw: Optional[dict]
     artist: Optional[Artist]
     title: str
     duration: str
     records: dict
     in_collection: bool
-    alternatives: set  # "alternative_tracks" maybe? or "other_versions"?
-
-    _tracks: ClassVar[Dict[str, Dict[str, Dict[str, "Track"]]]] = {}
-    #  _tracks is indexed by artist_ids csv, then title, then duration
-
-    @staticmethod
-    def get_or_create(track_dict: dict, record: Record, artist: Artist = None):
-        title = track_dict["title"]
-        duration = track_dict["duration"]
-        if (
-            record.artist_full_id in Track._tracks
-            and title in Track._tracks[record.artist_full_id]
-            and duration in Track._tracks[record.artist_full_id][title]
-        ):
-            track = Track._tracks[record.artist_full_id][title][duration]
-            track.add_record(record)
-        else:
-            track = Track(artist, record, track_dict)
-        return track
-
-    @staticmethod
-    def get_all(artist: Artist):
-        """Returns the list of Track objects for the specified Artist"""
-        return Track._tracks.get(artist.full_id)
+    id: int  # the track index in its registry
+    group_id: int  # the registry group of the artist tracks sharing the title
+    registry: Optional[TrackRegistry]
 
     def __init__(self, artist: Artist, record: Record, track_dict: dict):
         self.raw = track_dict
         self.artist = artist
-        self.title = track_dict["title"].strip()
+        self.title = Track.normalize_title(track_dict["title"])
         self.records = {record.id: record}
-        self.duration = track_dict["duration"].strip().lstrip("0")
-        if self.duration.startswith(":"):
-            self.duration = f"0{self.duration}"
+        self.duration = Track.normalize_duration(track_dict["duration"])
         self.in_collection = record.in_collection
-        self.alternatives = set()
-        self._register()
+        self.id = self.group_id = -1  # set by TrackRegistry.add
+        self.registry = None
+
+    @staticmethod
+    def normalize_title(title: str) -> str:
+        return title.strip()
+
+    @staticmethod
+    def normalize_duration(duration: str) -> str:
+        duration = duration.strip().lstrip("0")
+        if duration.startswith(":"):
+            duration = f"0{duration}"
+        return duration
+
+    @property
+    def alternatives(self) -> Set[Track]:
+        """The other durations of the track title"""
+        # "alternative_tracks" maybe? or "other_versions"?
+        if self.registry is None:
+            return set()
+        return set(self.registry.alternatives(self))
+
+    @property
+    def alternatives_count(self) -> int:
+        if self.registry is None:
+            return 0
+        return len(self.registry.groups[self.group_id]) - 1
 
     def add_record(self, record: Record):
         self.records[record.id] = record
@@ -60,18 +75,15 @@ class Track:
             else:
                 self.in_collection |= record.in_collection
 
-    def _register(self):
-        Track._tracks.setdefault(self.artist.full_id, {}).setdefault(self.title, {})
-        alternatives = set()
-        for other_duration, other_track in Track._tracks[self.artist.full_id][
-            self.title
-        ].items():
-            if self.duration == other_duration:
-                continue
-            other_track.alternatives.add(self)
-            alternatives.add(other_track)
-        self.alternatives.update(alternatives)
-        Track._tracks[self.artist.full_id][self.title][self.duration] = self
+    def __getstate__(self) -> dict:
+        """The track pickled state, without its raw data"""
+        state = {slot: getattr(self, slot) for slot in Track.__slots__}
+        state["raw"] = None
+        return state
+
+    def __setstate__(self, state: dict):
+        for slot, value in state.items():
+            setattr(self, slot, value)
 
     def __repr__(self):
         _repr = [self.title, self.duration or "?:??"]
@@ -84,3 +96,127 @@ class Track:
 
     def __hash__(self):
         return hash((self.title, self.duration))
+
+
+class TrackRegistry:
+    """
+    Hosts the Track objects of an analysis, indexed by artist full id, title and
+    duration.
+
+    Each track gets an integer id, its index in tracks. The tracks of an artist
+    sharing a title form a group, indexed in groups by a group id: the
+    alternatives of a track are the other tracks of its group, so registering a new
+    duration does not link it to every other one.
+
+    Artists of the same analysis share one registry, several analyses can run
+    side by side with their own.
+
+    With a matcher, a track without exact title and duration match is matched to a
+    registered track whose title or duration differ slightly, see TrackMatcher,
+    and a new title joins the group of a matching title.
+    """
+
+    def __init__(self, matcher: TrackMatcher = None):
+        """
+        :param matcher: the matcher of the tracks differing slightly. Tracks match
+        exactly if not provided.
+        """
+        self.matcher = matcher
+        self.tracks: List[Track] = []
+        self.groups: List[Dict[str, Track]] = []  # group id -> duration -> Track
+        self._titles: Dict[Optional[str], Dict[str, int]] = {}
+        #  _titles is indexed by artist full id, then title, and gives the group id
+        self.registrations = 0  # number of get_or_create() calls, see Analysis
+
+    def get_or_create(
+        self, track_dict: dict, record: Record, artist: Artist = None
+    ) -> Track:
+        """
+        Returns the registered artist track with the track_dict title and duration,
+        after adding the record to its records. Creates and registers it if needed.
+        """
+        self.registrations += 1
+        artist_full_id = artist.full_id if artist else None
+        title = Track.normalize_title(track_dict["title"])
+        duration = Track.normalize_duration(track_dict["duration"])
+        track = self.find(artist_full_id, title, duration)
+        if track is None and self.matcher is not None:
+            track = self.matcher.match(self, artist_full_id, title, duration)
+        if track is not None:
+            track.add_record(record)
+        else:
+            track = Track(artist, record, track_dict)
+            self.add(track)
+        return track
+
+    def add(self, track: Track) -> None:
+        artist_full_id = track.artist.full_id if track.artist else None
+        titles = self._titles.setdefault(artist_full_id, {})
+        group_id = titles.get(track.title)
+        if group_id is None and self.matcher is not None:
+            group_id, _similar = self.matcher.group(artist_full_id, track.title)
+        if group_id is None:
+            group_id = titles[track.title] = len(self.groups)
+            self.groups.append({})
+            if self.matcher is not None:
+                self.matcher.register(artist_full_id, track.title, group_id)
+        track.id, track.group_id, track.registry = len(self.tracks), group_id, self
+        self.tracks.append(track)
+        self.groups[group_id][track.duration] = track
+
+    def find(
+        self, artist_full_id: Optional[str], title: str, duration: str
+    ) -> Optional[Track]:
+        group_id = self._titles.get(artist_full_id, {}).get(title)
+        if group_id is None:
+            return None
+        return self.groups[group_id].get(duration)
+
+    def by_title(self, artist_full_id: Optional[str], title: str) -> List[Track]:
+        """Returns the artist tracks with that title, one per duration"""
+        group_id = self._titles.get(artist_full_id, {}).get(title)
+        return [] if group_id is None else list(self.groups[group_id].values())
+
+    def title_groups(self, artist_full_id: Optional[str]) -> Dict[str, int]:
+        """Returns the group ids of the artist tracks, indexed by title"""
+        return self._titles.get(artist_full_id, {})
+
+    def alternatives(self, track: Track) -> List[Track]:
+        return [t for t in self.groups[track.group_id].values() if t is not track]
+
+    def get_all(self, artist: Artist) -> Dict[str, Dict[str, Track]]:
+        """Returns the specified Artist tracks, indexed by title then duration"""
+        return {
+            title: self.groups[group_id]
+            for title, group_id in self.title_groups(artist.full_id).items()
+        }
+
+    def relink(self) -> List[Record]:
+        """
+        Replaces by the tracks themselves the track ids kept by the records of the
+        registered tracks when they were pickled, see Record.__getstate__(). To be
+        called once, after unpickling.
+        :return: the relinked records
+        """
+        records = {
+            id(record): record
+            for track in self.tracks
+            for record in track.records.values()
+        }
+        for record in records.values():
+            record.tracks = {
+                full_id: [self.tracks[track_id] for track_id in track_ids]
+                for full_id, track_ids in record.tracks.items()
+            }
+            record.missing_tracks = [
+                self.tracks[track_id] for track_id in record.missing_tracks
+            ]
+        return list(records.values())
+
+    @property
+    def merges(self) -> Dict[str, int]:
+        """The number of tracks merged by the matcher, by kind"""
+        return dict(self.matcher.merges) if self.matcher is not None else {}
+
+    def __len__(self) -> int:
+        return len(self.tracks)
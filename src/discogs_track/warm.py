@@ -0,0 +1,389 @@
+from requests.exceptions import RequestException
+from redis.exceptions import WatchError
+
+from .api import API, TooQuicklyRequests  # type: ignore
+from .cache import CacheBackend, RedisBackend, SQLiteBackend  # type: ignore
+from .collection import CollectionIndex  # type: ignore
+
+from time import time
+from typing import Dict, Iterable, List, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from logging import getLogger
+
+logger = getLogger("discogs_track")
+
+
+class WarmQueue:
+    """
+    The interface of the persistent priority queues of urls to prefetch. The lower
+    the priority, the sooner the url is claimed.
+
+    A claimed url stays in the queue store until done(): when a warmer is killed,
+    the urls it claimed are queued again by recover() once their lease expired, so
+    that each url is processed at least once.
+    """
+
+    name = "none"
+
+    @staticmethod
+    def for_backend(backend: CacheBackend) -> "WarmQueue":
+        """Returns the queue stored along the cache backend"""
+        if isinstance(backend, RedisBackend):
+            return RedisWarmQueue(backend)
+        if isinstance(backend, SQLiteBackend):
+            return SQLiteWarmQueue(backend)
+        raise ValueError(f"No warm queue for the {backend.name} cache backend")
+
+    def push(self, priorities: Dict[str, float]) -> int:
+        """
+        Queues urls, keeping the lowest priority of the already queued ones
+        :return: the number of urls newly queued
+        """
+        raise NotImplementedError
+
+    def claim(self, count: int = 1) -> List[Tuple[str, float]]:
+        """Takes the count first urls and returns them with their priority"""
+        raise NotImplementedError
+
+    def done(self, urls: Iterable[str]) -> None:
+        """Removes claimed urls once processed"""
+        raise NotImplementedError
+
+    def recover(self, lease: float) -> int:
+        """
+        Queues again the urls claimed more than lease seconds ago
+        :return: the number of urls recovered
+        """
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def info(self) -> Dict[str, int]:
+        """Returns the numbers of queued and claimed urls"""
+        raise NotImplementedError
+
+
+class RedisWarmQueue(WarmQueue):
+    """
+    A sorted set of the queued urls scored by priority, a sorted set of the claimed
+    ones scored by claim time, and a hash of their priorities.
+
+    push() compares the queued priorities in a WATCH transaction rather than with
+    ZADD LT, which needs Redis 6.2.
+    """
+
+    name = "redis"
+    QUEUE = "discogs_track:warm:queue"
+    CLAIMED = "discogs_track:warm:claimed"
+    PRIORITIES = "discogs_track:warm:priorities"
+
+    def __init__(self, backend: RedisBackend):
+        self._redis = backend._redis
+
+    def push(self, priorities: Dict[str, float]) -> int:
+        if not priorities:
+            return 0
+        with self._redis.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(RedisWarmQueue.QUEUE)
+                    scores = self._redis.pipeline(transaction=False)
+                    for url in priorities:
+                        scores.zscore(RedisWarmQueue.QUEUE, url)
+                    queued = dict(zip(priorities, scores.execute()))
+                    lower = {
+                        url: priority
+                        for url, priority in priorities.items()
+                        if queued[url] is None or priority < queued[url]
+                    }
+                    if not lower:
+                        return 0
+                    pipeline.multi()
+                    pipeline.zadd(RedisWarmQueue.QUEUE, lower)
+                    pipeline.execute()
+                    return sum(queued[url] is None for url in lower)
+                except WatchError:
+                    continue
+
+    def claim(self, count: int = 1) -> List[Tuple[str, float]]:
+        with self._redis.pipeline() as pipeline:
+            while True:
+                try:
+                    pipeline.watch(RedisWarmQueue.QUEUE)
+                    claimed = [
+                        (url.decode(), priority)
+                        for url, priority in pipeline.zrange(
+                            RedisWarmQueue.QUEUE, 0, count - 1, withscores=True
+                        )
+                    ]
+                    if not claimed:
+                        return []
+                    now = time()
+                    pipeline.multi()
+                    pipeline.zrem(RedisWarmQueue.QUEUE, *(url for url, _ in claimed))
+                    pipeline.zadd(
+                        RedisWarmQueue.CLAIMED, {url: now for url, _ in claimed}
+                    )
+                    pipeline.hset(RedisWarmQueue.PRIORITIES, mapping=dict(claimed))
+                    pipeline.execute()
+                    return claimed
+                except WatchError:
+                    continue
+
+    def done(self, urls: Iterable[str]) -> None:
+        urls = list(urls)
+        if urls:
+            pipeline = self._redis.pipeline()
+            pipeline.zrem(RedisWarmQueue.CLAIMED, *urls)
+            pipeline.hdel(RedisWarmQueue.PRIORITIES, *urls)
+            pipeline.execute()
+
+    def recover(self, lease: float) -> int:
+        urls = self._redis.zrangebyscore(RedisWarmQueue.CLAIMED, "-inf", time() - lease)
+        if not urls:
+            return 0
+        priorities = self._redis.hmget(RedisWarmQueue.PRIORITIES, urls)
+        self.push(
+            {
+                url.decode(): float(priority) if priority is not None else 0.0
+                for url, priority in zip(urls, priorities)
+            }
+        )
+        self.done(url.decode() for url in urls)
+        return len(urls)
+
+    def clear(self) -> None:
+        self._redis.delete(
+            RedisWarmQueue.QUEUE, RedisWarmQueue.CLAIMED, RedisWarmQueue.PRIORITIES
+        )
+
+    def info(self) -> Dict[str, int]:
+        return {
+            "queued": self._redis.zcard(RedisWarmQueue.QUEUE),
+            "claimed": self._redis.zcard(RedisWarmQueue.CLAIMED),
+        }
+
+
+class SQLiteWarmQueue(WarmQueue):
+    """A table of the urls, their priority and claim time, NULL when queued"""
+
+    name = "sqlite"
+
+    def __init__(self, backend: SQLiteBackend):
+        self._db, self._lock = backend._db, backend._lock
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS warm_queue "
+                "(url TEXT PRIMARY KEY, priority REAL, claimed_at REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS warm_queue_priority "
+                "ON warm_queue (claimed_at, priority)"
+            )
+
+    def push(self, priorities: Dict[str, float]) -> int:
+        with self._lock, self._db:
+            changes = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO warm_queue (url, priority) VALUES (?, ?)",
+                priorities.items(),
+            )
+            added = self._db.total_changes - changes
+            self._db.executemany(
+                "UPDATE warm_queue SET priority = ? WHERE url = ? AND priority > ?",
+                ((p, url, p) for url, p in priorities.items()),
+            )
+        return added
+
+    def claim(self, count: int = 1) -> List[Tuple[str, float]]:
+        with self._lock, self._db:
+            claimed = self._db.execute(
+                "SELECT url, priority FROM warm_queue WHERE claimed_at IS NULL "
+                "ORDER BY priority, rowid LIMIT ?",
+                (count,),
+            ).fetchall()
+            now = time()
+            self._db.executemany(
+                "UPDATE warm_queue SET claimed_at = ? WHERE url = ?",
+                ((now, url) for url, _ in claimed),
+            )
+        return claimed
+
+    def done(self, urls: Iterable[str]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "DELETE FROM warm_queue WHERE url = ?", ((url,) for url in urls)
+            )
+
+    def recover(self, lease: float) -> int:
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE warm_queue SET claimed_at = NULL WHERE claimed_at < ?",
+                (time() - lease,),
+            ).rowcount
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM warm_queue")
+
+    def info(self) -> Dict[str, int]:
+        with self._lock:
+            queued, claimed = self._db.execute(
+                "SELECT COUNT(*) - COUNT(claimed_at), COUNT(claimed_at) FROM warm_queue"
+            ).fetchone()
+        return {"queued": queued, "claimed": claimed}
+
+
+class Warmer:
+    """
+    Prefetches into the cache the responses an analysis of a watchlist of artists
+    reads: the artists and their aliases, their releases pages, the master versions
+    pages and the release details. A processed url queues the urls it links to, so
+    that the queue is drained from the artists down to the releases.
+
+    The releases and masters in the user's collection come first, then the others
+    by endpoint, see PRIORITIES. A url whose cache entry is fresh costs no request;
+    an expired one is revalidated with a conditional request. The API rate limiter
+    spaces out the requests.
+    """
+
+    PRIORITIES = {
+        "collection": 0.0,
+        "artist": 10.0,
+        "artist_releases": 20.0,
+        "master_versions": 30.0,
+        "release": 40.0,
+    }
+    COLLECTED = 25.0  # the priority bonus of the collection masters and releases
+    RETRY = 100.0  # the priority penalty of the urls whose request failed
+
+    def __init__(
+        self,
+        api: API,
+        queue: WarmQueue,
+        collection: CollectionIndex = None,
+        lease: float = 300.0,
+    ):
+        """
+        :param api: instance of API class
+        :param queue: the queue of the urls to prefetch
+        :param collection: the index of the user's collection, to prefetch its
+        releases first. All releases have the same priority if not provided.
+        :param lease: number of seconds after which a claimed url not done is
+        queued again (default: 300)
+        """
+        self.api = api
+        self.queue = queue
+        self.collection = collection
+        self.lease = lease
+        self.seen: Set[str] = set()  # the urls queued since watch()
+
+    def watch(self, artist_ids: Iterable[int]) -> int:
+        """
+        Queues the artists and the collection first page, after the claimed urls
+        whose lease expired. Starts a new pass: the urls seen and fetched by the
+        previous ones are forgotten, so that a daemon does not accumulate them.
+        :return: the number of urls newly queued
+        """
+        recovered = self.queue.recover(self.lease)
+        if recovered:
+            logger.info(f"{recovered} interrupted urls queued again")
+        self.seen.clear()
+        self.api.fetched.clear()
+        queries = [f"/artists/{artist_id}" for artist_id in artist_ids]
+        if self.collection is not None:
+            queries.append(
+                self.api.page_query(
+                    f"/users/{self.api.user_name}/collection/folders/0/releases", 1
+                )
+            )
+        return self.push(queries)
+
+    def push(self, queries: Iterable[str], collected: bool = False) -> int:
+        priorities = {}
+        for query in queries:
+            url = self.api.url(query)
+            if url in self.seen:
+                continue
+            self.seen.add(url)
+            priority = Warmer.PRIORITIES.get(self.api.cache_policy.endpoint(url), 50.0)
+            priorities[url] = priority - Warmer.COLLECTED if collected else priority
+        return self.queue.push(priorities)
+
+    def drain(self, max_requests: int = None) -> Dict[str, int]:
+        """
+        Processes the queued urls until the queue is empty
+        :param max_requests: number of requests after which to stop. No limit if
+        not provided.
+        :return: the numbers of urls processed, fetched and failed
+        """
+        stats = {"processed": 0, "fetched": 0, "failed": 0}
+        while max_requests is None or stats["fetched"] < max_requests:
+            claimed = self.queue.claim()
+            if not claimed:
+                break
+            url, priority = claimed[0]
+            try:
+                stats["fetched"] += self.process(url)
+            except (RequestException, TooQuicklyRequests, ValueError) as e:
+                logger.warning(f"{url} prefetch failed: {e!r}")
+                stats["failed"] += 1
+                self.queue.done([url])
+                self.queue.push({url: priority + Warmer.RETRY})
+            else:
+                self.queue.done([url])
+            stats["processed"] += 1
+        return stats
+
+    def process(self, url: str) -> bool:
+        """
+        Caches the url response unless fresh, and queues the urls it links to
+        :return: True when the response was requested
+        """
+        cache, policy = self.api.cache, self.api.cache_policy
+        entry = cache.get_entry(url)
+        fetched = entry is None or not policy.is_fresh(url, entry)
+        if fetched:
+            entry = self.api.fetch_entry(url, entry)
+            cache.set_entry(url, entry)
+        self.expand(url, self.api.parsed(entry))
+        return fetched
+
+    def expand(self, url: str, obj: dict) -> None:
+        """Queues the urls of the response obj of url"""
+        endpoint = self.api.cache_policy.endpoint(url)
+        parsed = urlparse(url)
+        if endpoint == "artist":
+            self.push(f"/artists/{alias['id']}" for alias in obj.get("aliases", []))
+            self.push([self.api.page_query(f"{parsed.path}/releases", 1)])
+            return
+        if "pagination" in obj and parse_qs(parsed.query).get("page") == ["1"]:
+            self.push(
+                self.api.page_query(parsed.path, page)
+                for page in range(2, obj["pagination"]["pages"] + 1)
+            )
+        if endpoint == "artist_releases":
+            for item in obj.get("releases", []):
+                if item.get("type") == "master":
+                    self.push(
+                        [self.api.page_query(f"/masters/{item['id']}/versions", 1)],
+                        collected=self.is_collected(item["id"], master=True),
+                    )
+                else:
+                    self.push_release(item["id"])
+        elif endpoint == "master_versions":
+            for version in obj.get("versions", []):
+                self.push_release(version["id"])
+
+    def push_release(self, release_id: int) -> None:
+        self.push(
+            [self.api.release_query(release_id)],
+            collected=self.is_collected(release_id),
+        )
+
+    def is_collected(self, id_: int, master: bool = False) -> bool:
+        if self.collection is None:
+            return False
+        return self.collection.has_master(id_) if master else id_ in self.collection
@@ -0,0 +1,168 @@
+import json
+from copy import deepcopy
+from functools import partial
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+import pytest
+import responses
+
+from discogs_track.api import API, RateLimiter
+from discogs_track.artist import Artist
+from discogs_track.cache import Cache, SQLiteBackend
+
+
+class FakeConfig:
+    auth = None
+    user_name = "user"
+    cache_options: dict = {}
+
+
+def new_api(sharing: Optional[API] = None, **kwargs) -> API:
+    """Returns an API on an in-memory cache, or sharing the cache, metrics and
+    rate limiter of another API instance"""
+    if sharing is None:
+        api = API(FakeConfig(), cache=Cache(SQLiteBackend(":memory:")), **kwargs)
+        api.rate_limiter = RateLimiter(10**6, burst=10**6, sleeper=lambda seconds: None)
+    else:
+        api = API(FakeConfig(), cache=sharing.cache, metrics=sharing.metrics, **kwargs)
+        api.rate_limiter = sharing.rate_limiter
+    return api
+
+
+@pytest.fixture
+def make_api():
+    return new_api
+
+
+@pytest.fixture
+def api() -> API:
+    return new_api()
+
+
+RELEASES = {
+    10: {
+        "id": 10,
+        "title": "First",
+        "uri": "https://www.discogs.com/release/10",
+        "year": 1981,
+        "artists": [{"id": 1}],
+        "formats": [{"name": "Vinyl", "descriptions": ["LP"]}],
+        "tracklist": [
+            {"type_": "heading", "title": "Side A", "duration": ""},
+            {"type_": "track", "title": "Song A", "duration": "3:00"},
+            {"type_": "track", "title": "Song B", "duration": "4:00"},
+            {"type_": "track", "title": "Song C", "duration": ""},
+        ],
+    },
+    20: {
+        "id": 20,
+        "title": "Second",
+        "year": 1983,
+        "master_id": 100,
+        "artists": [{"id": 1}],
+        "formats": [{"name": "CD", "descriptions": ["Album"]}],
+        "tracklist": [
+            {"type_": "track", "title": "Song A", "duration": "3:00"},
+            {"type_": "track", "title": "Song C", "duration": "2:30"},
+            {"type_": "track", "title": "Song D", "duration": "5:00"},
+        ],
+    },
+    30: {
+        "id": 30,
+        "title": "Compilation",
+        "year": 1985,
+        "artists": [{"id": 194}],
+        "formats": [{"name": "CD", "descriptions": ["Compilation"]}],
+        "tracklist": [
+            {
+                "type_": "track",
+                "title": "Song B",
+                "duration": "4:00",
+                "artists": [{"id": 1}],
+            },
+            {
+                "type_": "track",
+                "title": "Another",
+                "duration": "3:33",
+                "artists": [{"id": 2}],
+            },
+        ],
+    },
+}
+
+
+class Discogs:
+    """
+    A small Discogs, served by responses. Artist 1, "A", has a release in the
+    user's collection, a master whose versions are a CD and a digital file, a
+    compilation track and a digital release. Its other releases are skipped.
+
+    Its tracks are Song A 3:00 (releases 10 and 20), Song B 4:00 (10 and 30),
+    Song C undated (10) and 2:30 (20), and Song D 5:00 (20). Release 10 is
+    collected, so Song C 2:30 and Song D 5:00 are missing, both on release 20.
+    """
+
+    artist = {"id": 1, "name": "A"}
+    artist_releases = [
+        {"id": 10, "type": "release", "artist": "A", "format": "Vinyl, LP"},
+        {"id": 100, "type": "master", "artist": "A"},
+        {"id": 30, "type": "release", "artist": "Various", "format": "CD, Comp"},
+        {"id": 40, "type": "release", "artist": "B", "format": "Vinyl"},
+        {"id": 50, "type": "release", "artist": "A", "format": "File, MP3"},
+    ]
+    master_versions = [
+        {"id": 20, "format": "CD, Album"},
+        {"id": 21, "format": "File, FLAC"},
+    ]
+    releases = RELEASES
+    collection = [{"id": 10, "basic_information": {"master_id": None}}]
+
+    def __init__(self):
+        # served as they are when requested, so that a test can change them
+        for name in ("artist_releases", "master_versions", "releases", "collection"):
+            setattr(self, name, deepcopy(getattr(Discogs, name)))
+        self.add_page("/artists/1/releases", lambda: self.artist_releases, "releases")
+        self.add_page("/masters/100/versions", lambda: self.master_versions, "versions")
+        self.add_page(
+            "/users/user/collection/folders/0/releases",
+            lambda: self.collection,
+            "releases",
+        )
+        responses.add(responses.GET, API.url("/artists/1"), json=self.artist)
+        for release_id in self.releases:
+            responses.add_callback(
+                responses.GET,
+                API.url(f"/releases/{release_id}?EUR"),
+                partial(self.serve_release, release_id),
+            )
+
+    def serve_release(self, release_id: int, request):
+        return 200, {}, json.dumps(self.releases[release_id])
+
+    @staticmethod
+    def add_page(path: str, items: Callable[[], list], key: str) -> None:
+        def callback(request):
+            body = {"pagination": {"page": 1, "pages": 1}, key: items()}
+            return 200, {}, json.dumps(body)
+
+        responses.add_callback(
+            responses.GET, API.url(API.page_query(path, 1)), callback
+        )
+
+    @staticmethod
+    def requested(path: str) -> int:
+        """Returns the number of requests of path"""
+        return sum(urlparse(call.request.url).path == path for call in responses.calls)
+
+
+@pytest.fixture
+def discogs():
+    Artist.ARTISTS.clear()
+    responses.start()
+    try:
+        yield Discogs()
+    finally:
+        responses.stop()
+        responses.reset()
+        Artist.ARTISTS.clear()
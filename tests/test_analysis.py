@@ -0,0 +1,173 @@
+from random import Random
+from types import SimpleNamespace
+
+import pytest
+
+from discogs_track.analysis import Analysis
+from discogs_track.record import Record
+from discogs_track.track import TrackRegistry
+
+ARTISTS = {
+    1: SimpleNamespace(id=1, full_id="f1", name="A"),
+    2: SimpleNamespace(id=2, full_id="f2", name="B"),
+}
+
+
+def random_releases(seed: int, number: int = 15) -> list:
+    rnd = Random(seed)
+    titles = [f"Song {i}" for i in range(8)]
+    releases = []
+    for id_ in range(1, number + 1):
+        tracklist = [
+            {
+                "type_": "track",
+                "title": rnd.choice(titles),
+                "duration": rnd.choice(["", "3:00", "3:01", "4:10"]),
+                "artists": [{"id": a} for a in rnd.choice([[1], [1], [2], [1, 2]])],
+            }
+            for _ in range(rnd.randint(1, 5))
+        ]
+        releases.append(
+            {
+                "id": id_,
+                "title": f"Record {id_}",
+                "format": "Vinyl, LP",
+                "artists": [{"id": 1}],
+                "tracklist": tracklist,
+            }
+        )
+    return releases
+
+
+def build(api, releases: list, collected: set) -> dict:
+    """Returns the records of the releases, with the tracks of a new registry"""
+    registry = TrackRegistry()
+    records = {}
+    for release in releases:
+        release = dict(
+            release, stats={"user": {"in_collection": int(release["id"] in collected)}}
+        )
+        records[release["id"]] = Record(
+            release["id"],
+            artist=ARTISTS[1],
+            with_artists=ARTISTS,
+            api=api,
+            release_raw_data=release,
+            track_registry=registry,
+        )
+    return records
+
+
+def walk_discover(registry: TrackRegistry, artist) -> dict:
+    """The missing tracks of an artist, by the former walk of its tracks"""
+    missing: dict = {}
+    for title, group in registry.get_all(artist).items():
+        for duration, track in group.items():
+            if not track.in_collection and not (
+                not track.duration and track.alternatives_count
+            ):
+                missing.setdefault(title, {})[duration] = track
+                for record in track.records.values():
+                    # by identity: the tracks of two artists may be equal
+                    if all(other is not track for other in record.missing_tracks):
+                        record.missing_tracks.append(track)
+    return missing
+
+
+def walk_completing(records: dict, artist_full_id: str) -> dict:
+    """The completing records, by the former walk of the records"""
+    buckets: dict = {}
+    for id_, record in records.items():
+        record.set_missing_tracks_ratio(artist_full_id)
+        buckets.setdefault(len(record.missing_tracks), {})[id_] = record
+    return buckets
+
+
+def track_keys(tracks) -> set:
+    return {(track.artist.full_id, track.title, track.duration) for track in tracks}
+
+
+def missing_keys(missing: dict) -> set:
+    return track_keys(t for group in missing.values() for t in group.values())
+
+
+def state(records: dict) -> dict:
+    return {id_: track_keys(record.missing_tracks) for id_, record in records.items()}
+
+
+def registry_of(records: dict) -> TrackRegistry:
+    return next(iter(records.values())).track_registry
+
+
+def artist_records(records: dict, artist_full_id: str) -> dict:
+    return {id_: r for id_, r in records.items() if artist_full_id in r.tracks}
+
+
+def completing_state(buckets: dict, artist_full_id: str) -> dict:
+    return {
+        missing_nb: {
+            id_: record.missing_tracks_ratio[artist_full_id]
+            for id_, record in records.items()
+        }
+        for missing_nb, records in buckets.items()
+    }
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_discover_matches_the_track_walk(api, seed):
+    releases = random_releases(seed)
+    collected = {1, 4, 9}
+    walked, analyzed = build(api, releases, collected), build(api, releases, collected)
+    analysis = Analysis(registry_of(analyzed))
+    for artist in ARTISTS.values():
+        assert missing_keys(analysis.discover(artist.full_id)) == missing_keys(
+            walk_discover(registry_of(walked), artist)
+        )
+    # the records shared by both artists keep the missing tracks of both
+    assert state(analyzed) == state(walked)
+    assert not any(analyzed[id_].missing_tracks for id_ in collected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_completing_records_match_the_track_walk(api, seed):
+    releases = random_releases(seed)
+    walked, analyzed = build(api, releases, {2, 3}), build(api, releases, {2, 3})
+    walk_discover(registry_of(walked), ARTISTS[1])
+    analysis = Analysis(registry_of(analyzed))
+    analysis.discover("f1")
+    expected = walk_completing(artist_records(walked, "f1"), "f1")
+    buckets = analysis.completing_records(artist_records(analyzed, "f1"), "f1")
+    assert completing_state(buckets, "f1") == completing_state(expected, "f1")
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_refresh_collection_matches_a_new_walk(api, seed):
+    releases = random_releases(seed)
+    analyzed = build(api, releases, {1, 2, 3})
+    analysis = Analysis(registry_of(analyzed))
+    for artist in ARTISTS.values():
+        analysis.discover(artist.full_id)
+    for id_, record in analyzed.items():
+        record.in_collection = id_ in {3, 5, 6}
+    analysis.refresh_collection()
+    walked = build(api, releases, {3, 5, 6})
+    for artist in ARTISTS.values():
+        assert missing_keys(analysis.discover(artist.full_id)) == missing_keys(
+            walk_discover(registry_of(walked), artist)
+        )
+    assert state(analyzed) == state(walked)
+    assert {
+        track.id for track in registry_of(analyzed).tracks if track.in_collection
+    } == {track.id for track in registry_of(walked).tracks if track.in_collection}
+
+
+def test_undated_track_with_a_dated_alternative_is_not_missing(api):
+    tracklist = [
+        {"type_": "track", "title": "Song", "duration": d, "artists": [{"id": 1}]}
+        for d in ("", "3:00")
+    ]
+    release = {"id": 1, "title": "R", "format": "LP", "tracklist": tracklist}
+    records = build(api, [release], set())
+    missing = Analysis(registry_of(records)).discover("f1")
+    assert list(missing) == ["Song"]
+    assert list(missing["Song"]) == ["3:00"]
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import re
+import sqlite3
+from dataclasses import replace
+from time import sleep
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import responses
+from requests.exceptions import HTTPError
+
+from discogs_track.api import API, AsyncAPI, RateLimiter, TooQuicklyRequests
+
+
+def serve_pages(path: str, items: list, key: str = "versions"):
+    """Serves items as the pages of the path endpoint, of per_page items each"""
+
+    def callback(request):
+        query = parse_qs(urlparse(request.url).query)
+        page = int(query["page"][0])
+        per_page = int(query["per_page"][0])
+        pages = max(1, -(-len(items) // per_page))
+        body = {
+            "pagination": {"page": page, "pages": pages, "per_page": per_page},
+            key: items[(page - 1) * per_page : page * per_page],
+        }
+        return 200, {}, json.dumps(body)
+
+    responses.add_callback(
+        responses.GET, re.compile(re.escape(f"{API.base_url}{path}?")), callback
+    )
+
+
+def requested_pages(path: str) -> list:
+    return sorted(
+        int(parse_qs(urlparse(call.request.url).query)["page"][0])
+        for call in responses.calls
+        if urlparse(call.request.url).path == path
+    )
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(API, "per_page", 2)
+
+
+@responses.activate
+def test_iter_pages_single_page(small_pages, make_api):
+    serve_pages("/masters/1/versions", [{"id": 1}])
+    pages = list(make_api().iter_pages("/masters/1/versions"))
+    assert [page["versions"] for page in pages] == [[{"id": 1}]]
+    assert requested_pages("/masters/1/versions") == [1]
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 4])
+@responses.activate
+def test_iter_pages_ordered(small_pages, max_concurrency, make_api):
+    items = [{"id": i} for i in range(9)]
+    serve_pages("/masters/1/versions", items)
+    pages = list(
+        make_api(max_concurrency=max_concurrency).iter_pages("/masters/1/versions")
+    )
+    assert [page["pagination"]["page"] for page in pages] == [1, 2, 3, 4, 5]
+    assert [item for page in pages for item in page["versions"]] == items
+    assert requested_pages("/masters/1/versions") == [1, 2, 3, 4, 5]
+
+
+@responses.activate
+def test_iter_pages_unordered(small_pages, make_api):
+    items = [{"id": i} for i in range(9)]
+    serve_pages("/masters/1/versions", items)
+    pages = list(make_api().iter_pages("/masters/1/versions", ordered=False))
+    assert pages[0]["pagination"]["page"] == 1
+    assert sorted(page["pagination"]["page"] for page in pages) == [1, 2, 3, 4, 5]
+    assert (
+        sorted(
+            (item for page in pages for item in page["versions"]), key=lambda i: i["id"]
+        )
+        == items
+    )
+
+
+@responses.activate
+def test_iter_pages_from_cache(small_pages, make_api):
+    serve_pages("/masters/1/versions", [{"id": i} for i in range(5)])
+    api = make_api()
+    first = api.get_pages("/masters/1/versions")
+    responses.calls.reset()
+    assert make_api(sharing=api).get_pages("/masters/1/versions") == first
+    assert len(responses.calls) == 0
+
+
+@responses.activate
+def test_get_master_releases_requests_every_page(small_pages, make_api):
+    items = [{"id": i} for i in range(4)]
+    serve_pages("/masters/7/versions", items)
+    pages = make_api().get_master_releases(7)
+    assert requested_pages("/masters/7/versions") == [1, 2]
+    assert [item for page in pages for item in page["versions"]] == items
+
+
+@responses.activate
+def test_get_master_versions_indexes_every_version(small_pages, make_api):
+    serve_pages("/masters/7/versions", [{"id": i} for i in range(5)])
+    assert sorted(make_api().get_master_versions(7)) == [0, 1, 2, 3, 4]
+
+
+def test_page_query():
+    assert API.page_query("/masters/1/versions", 3) == (
+        f"/masters/1/versions?per_page={API.per_page}&page=3"
+    )
+    assert API.page_query("/stats?curr_abbr=EUR", 1) == (
+        f"/stats?curr_abbr=EUR&per_page={API.per_page}&page=1"
+    )
+
+
+def expire(api: API, url: str) -> None:
+    entry = api.cache.get_entry(url)
+    api.cache.set_entry(url, replace(entry, fetched_at=entry.fetched_at - 10**7))
+
+
+def wait_revalidations(api: API) -> None:
+    while api.pending_revalidations:
+        sleep(0.01)
+
+
+@responses.activate
+def test_stale_entry_served_and_refreshed(make_api):
+    api = make_api()
+    url = api.url(api.release_query(1))
+    responses.add(responses.GET, url, json={"id": 1, "title": "Old"})
+    responses.add(responses.GET, url, json={"id": 1, "title": "New"})
+    api.get_release(1)
+    expire(api, url)
+    other = make_api(sharing=api)
+    assert other.get_release(1)["title"] == "Old"
+    wait_revalidations(other)
+    assert other.parsed(api.cache.get_entry(url))["title"] == "New"
+
+
+@responses.activate
+def test_revalidation_survives_non_json_errors(make_api):
+    api = make_api()
+    url = api.url(api.release_query(1))
+    responses.add(responses.GET, url, json={"id": 1})
+    api.get_release(1)
+    responses.replace(responses.GET, url, body="<html>502 Bad Gateway</html>")
+    for _ in range(2):
+        expire(api, url)
+        other = make_api(sharing=api)
+        other.revalidate(url)
+        wait_revalidations(other)
+        assert other._revalidate_thread.is_alive()
+
+
+@responses.activate
+def test_revalidation_survives_cache_errors(make_api, monkeypatch):
+    api = make_api()
+    url = api.url(api.release_query(1))
+    responses.add(responses.GET, url, json={"id": 1})
+    api.get_release(1)
+    expire(api, url)
+
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    other = make_api(sharing=api)
+    monkeypatch.setattr(other.cache, "set_entry", broken)
+    for _ in range(2):
+        other.revalidate(url)
+        wait_revalidations(other)
+        assert other._revalidate_thread.is_alive()
+
+
+@responses.activate
+def test_stale_collection_is_fetched_again(small_pages, make_api):
+    path = "/users/user/collection/folders/0/releases"
+    serve_pages(path, [{"id": 1}], key="releases")
+    api = make_api()
+    api.get_collection_releases()
+    url = api.url(api.page_query(path, 1))
+    expire(api, url)
+    responses.calls.reset()
+    make_api(sharing=api).get_collection_releases()
+    assert requested_pages(path) == [1]
+
+
+@responses.activate
+def test_expired_marketplace_stats_are_fetched_again(make_api):
+    api = make_api()
+    url = api.url(f"/marketplace/stats/1?curr_abbr={api.currency}")
+    responses.add(responses.GET, url, json={"num_for_sale": 1})
+    responses.add(responses.GET, url, json={"num_for_sale": 42})
+    assert api.get_marketplace_stats(1)["num_for_sale"] == 1
+    # fresh: not requested again
+    assert make_api(sharing=api).get_marketplace_stats(1)["num_for_sale"] == 1
+    expire(api, url)
+    assert make_api(sharing=api).get_marketplace_stats(1)["num_for_sale"] == 42
+
+
+@responses.activate
+def test_error_response_keeps_the_cached_entry(make_api):
+    api = make_api()
+    url = api.url(api.release_query(1))
+    responses.add(responses.GET, url, json={"id": 1}, headers={"ETag": '"1"'})
+    responses.add(
+        responses.GET, url, json={"message": "Release not found."}, status=404
+    )
+    api.get_release(1)
+    other = make_api(sharing=api)
+    assert other.get_release(1, from_cache=False) == {"id": 1}
+    assert other.parsed(api.cache.get_entry(url)) == {"id": 1}
+    assert other.metrics.counter("revalidations_total") == 0
+
+
+@responses.activate
+def test_error_response_without_cached_entry_raises(make_api):
+    api = make_api()
+    url = api.url(api.release_query(1))
+    responses.add(
+        responses.GET, url, json={"message": "Release not found."}, status=404
+    )
+    responses.add(responses.GET, api.url("/artists/1"), status=429)
+    with pytest.raises(HTTPError):
+        api.get_release(1)
+    with pytest.raises(TooQuicklyRequests):
+        api.get_artist(1)
+    assert api.cache.get_entry(url) is None
+
+
+@responses.activate
+def test_429_is_sent_again_after_the_quota_window(make_api):
+    api = make_api()
+    sleeps = []
+    api.rate_limiter = RateLimiter(60, burst=5, sleeper=sleeps.append)
+    url = api.url("/artists/1")
+    responses.add(responses.GET, url, status=429)
+    responses.add(responses.GET, url, json={"name": "A"})
+    assert api.get_artist(1) == {"name": "A"}
+    assert len(responses.calls) == 2
+    assert sleeps == [pytest.approx(RateLimiter.window)]
+
+
+@responses.activate
+def test_revalidation_results(make_api):
+    api = make_api()
+    url = api.url(api.release_query(1))
+    responses.add(responses.GET, url, json={"id": 1}, headers={"ETag": '"1"'})
+    responses.add(responses.GET, url, status=304)
+    responses.add(responses.GET, url, json={"id": 2}, headers={"ETag": '"2"'})
+    api.get_release(1)
+    for expected in ({"id": 1}, {"id": 2}):
+        assert make_api(sharing=api).get_release(1, from_cache=False) == expected
+    assert api.metrics.counter("revalidations_total", result="unchanged") == 1
+    assert api.metrics.counter("revalidations_total", result="changed") == 1
+    assert responses.calls[1].request.headers["If-None-Match"] == '"1"'
+
+
+def test_async_get_many_releases(discogs, api):
+    api.get_release(10)
+    async_api = AsyncAPI(api, max_concurrency=4)
+    try:
+        releases = asyncio.run(async_api.get_many_releases([10, 20, 30, 20]))
+    finally:
+        async_api.close()
+    assert list(releases) == [10, 20, 30]
+    assert {i: release["title"] for i, release in releases.items()} == {
+        10: "First",
+        20: "Second",
+        30: "Compilation",
+    }
+    # the cached release is not requested again, the others once
+    assert [discogs.requested(f"/releases/{i}") for i in (10, 20, 30)] == [1, 1, 1]
+    assert api.cache.get_entry(api.url(api.release_query(30))) is not None
@@ -0,0 +1,67 @@
+import responses
+
+from discogs_track.artist import Artist
+from discogs_track.collection import CollectionIndex
+
+
+def make_artist(api, **kwargs) -> Artist:
+    return Artist(1, api=api, collection=CollectionIndex(api), **kwargs)
+
+
+def test_digital_summaries_are_skipped_before_their_details(discogs, api):
+    artist = make_artist(api)
+    assert sorted(artist.records) == [10, 20, 30]
+    assert discogs.requested("/releases/50") == 0
+    assert discogs.requested("/releases/21") == 0
+    # the releases of another artist are skipped as well
+    assert discogs.requested("/releases/40") == 0
+
+
+def test_stream_records(discogs, api):
+    api.batch_size = 1
+    artist = make_artist(api, stream=True)
+    assert discogs.requested("/artists/1/releases") == 0
+    records = artist.stream_records()
+    first = next(records)
+    assert first.id == 10
+    # the next releases are fetched as the records are consumed
+    assert discogs.requested("/releases/30") == 0
+    assert not artist.missing_tracks
+    assert [record.id for record in records] == [20, 30]
+    assert artist.complete
+    assert sorted(artist.missing_tracks) == ["Song C", "Song D"]
+    calls = len(responses.calls)
+    assert [record.id for record in artist.stream_records()] == [10, 20, 30]
+    assert artist.build() is artist
+    assert len(responses.calls) == calls
+
+
+def summary(artist: Artist) -> dict:
+    return {
+        record.id: (
+            record.format,
+            record.in_collection,
+            [(track.title, track.duration) for track in record.tracks["f1"]],
+            [(track.title, track.duration) for track in record.missing_tracks],
+        )
+        for record in artist.records.values()
+    }
+
+
+def test_workers_parse_the_cached_releases(discogs, api, make_api):
+    expected = summary(make_artist(api))
+    Artist.ARTISTS.clear()
+    responses.calls.reset()
+    # a new instance parses the cached release bodies in the workers pool
+    pooled = make_artist(make_api(sharing=api), workers=2)
+    assert summary(pooled) == expected
+    assert sum(discogs.requested(f"/releases/{i}") for i in (10, 20, 30)) == 0
+
+
+def test_workers_fetch_the_missing_releases(discogs, api):
+    expected_missing = {"Song C": ["2:30"], "Song D": ["5:00"]}
+    artist = make_artist(api, workers=2)
+    assert sorted(artist.records) == [10, 20, 30]
+    assert {
+        title: list(durations) for title, durations in artist.missing_tracks.items()
+    } == expected_missing
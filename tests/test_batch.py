@@ -0,0 +1,43 @@
+import pytest
+import responses
+
+from discogs_track.api import API
+from discogs_track.batch import Batch
+
+
+@responses.activate
+def test_non_json_error_page_fails_only_its_artist(api, tmp_path):
+    responses.add(
+        responses.GET,
+        f"{API.base_url}/artists/1",
+        body="<html>Service Unavailable</html>",
+    )
+    responses.add(
+        responses.GET,
+        f"{API.base_url}/artists/2",
+        json={"message": "Artist not found."},
+        status=404,
+    )
+    summaries = list(Batch(api, output_dir=str(tmp_path)).run([1, 2]))
+    assert [summary["id"] for summary in summaries] == [1, 2]
+    assert summaries[0]["error"].startswith("JSONDecodeError")
+    assert summaries[1]["error"].startswith("HTTPError")
+
+
+@responses.activate
+def test_unknown_cached_artist_fails_only_its_artist(api, tmp_path):
+    url = f"{API.base_url}/artists/1"
+    api.cache.set_many({url: b'{"message": "Artist not found."}'})
+    (summary,) = Batch(api, output_dir=str(tmp_path)).run([1])
+    assert summary["error"].startswith("ValueError('artist 1 not found')")
+
+
+@responses.activate
+def test_programming_errors_are_not_swallowed(api, tmp_path, monkeypatch):
+    def broken(*args, **kwargs):
+        raise KeyError("bug")
+
+    responses.add(responses.GET, f"{API.base_url}/artists/1", json={"name": "A"})
+    monkeypatch.setattr("discogs_track.artist.Artist.build", broken)
+    with pytest.raises(KeyError):
+        list(Batch(api, output_dir=str(tmp_path)).run([1]))
@@ -0,0 +1,149 @@
+import pytest
+
+from discogs_track.cache import (
+    CODECS,
+    MAGIC,
+    Cache,
+    CacheEntry,
+    CachePolicy,
+    LRUCache,
+    SQLiteBackend,
+)
+
+BODY = b'{"id": 1, "title": "Album", "notes": "' + b"n" * 1000 + b'"}'
+
+
+@pytest.mark.parametrize("codec", [None, *CODECS])
+def test_entry_round_trip(codec):
+    entry = CacheEntry(
+        body=BODY,
+        fetched_at=1234.5,
+        etag='"abc"',
+        last_modified="Wed, 01 Jan 2020 00:00:00 GMT",
+    )
+    value = entry.encode(codec)
+    assert value.startswith(MAGIC)
+    decoded = CacheEntry.decode(value)
+    assert decoded == CacheEntry(
+        body=BODY,
+        fetched_at=1234.5,
+        codec=codec,
+        etag='"abc"',
+        last_modified="Wed, 01 Jan 2020 00:00:00 GMT",
+    )
+    if codec:
+        assert len(value) < len(BODY)
+
+
+def test_legacy_value_decodes_as_body():
+    entry = CacheEntry.decode(BODY)
+    assert entry.body == BODY
+    assert entry.codec is None
+    assert entry.age() is None
+
+
+def test_validators():
+    assert CacheEntry(body=b"{}").validators == {}
+    assert CacheEntry(body=b"{}", etag='"abc"', last_modified="then").validators == {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "then",
+    }
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        Cache(SQLiteBackend(":memory:"), codec="lzma")
+
+
+def test_small_bodies_are_stored_uncompressed():
+    cache = Cache(SQLiteBackend(":memory:"), min_compress_size=256)
+    cache.set_many({"small": b"{}", "large": BODY})
+    assert CacheEntry.decode(cache.backend.get("small")).codec is None
+    assert CacheEntry.decode(cache.backend.get("large")).codec == "zlib"
+    assert cache.get_many(["small", "large", "missing"]) == [b"{}", BODY, None]
+    assert cache.bytes_stored < cache.bytes_raw
+
+
+def test_migrate():
+    backend = SQLiteBackend(":memory:")
+    backend.set_many({"https://api.discogs.com/releases/1": BODY, "other": BODY})
+    cache = Cache(backend)
+    report = cache.migrate()
+    assert report["scanned"] == report["migrated"] == 1
+    assert report["bytes_after"] < report["bytes_before"] == len(BODY)
+    entry = CacheEntry.decode(backend.get("https://api.discogs.com/releases/1"))
+    assert (entry.body, entry.codec) == (BODY, "zlib")
+    assert backend.get("other") == BODY
+    # migrated keys are left alone
+    assert cache.migrate()["migrated"] == 0
+
+
+def test_projection_keeps_the_read_fields():
+    policy = CachePolicy(project=True)
+    assert policy.projection("https://api.discogs.com/artists/1") is None
+    fields = policy.projection("https://api.discogs.com/releases/1")
+    assert {"id", "tracklist"} <= fields
+    assert "images" not in fields
+    assert CachePolicy().projection("https://api.discogs.com/releases/1") is None
+
+
+def test_legacy_value_ages_from_its_first_read():
+    backend = SQLiteBackend(":memory:")
+    backend.set_many({"https://api.discogs.com/releases/1": BODY})
+    entry = Cache(backend).get_entry("https://api.discogs.com/releases/1")
+    assert entry.body == BODY
+    assert entry.age() < 60
+    assert CachePolicy().is_fresh("https://api.discogs.com/releases/1", entry)
+    stored = CacheEntry.decode(backend.get("https://api.discogs.com/releases/1"))
+    assert stored.fetched_at == entry.fetched_at
+
+
+def test_migrate_dates_legacy_values():
+    backend = SQLiteBackend(":memory:")
+    backend.set_many({"https://api.discogs.com/releases/1": BODY})
+    Cache(backend).migrate()
+    entry = CacheEntry.decode(backend.get("https://api.discogs.com/releases/1"))
+    assert entry.age() < 60
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://api.discogs.com/users/u/collection/folders/0/releases",
+        "https://api.discogs.com/marketplace/stats/1",
+    ],
+)
+def test_legacy_always_revalidated_values_stay_expired(url):
+    backend = SQLiteBackend(":memory:")
+    backend.set_many({url: BODY})
+    entry = Cache(backend).get_entry(url)
+    assert entry.age() is None
+    assert not CachePolicy().is_fresh(url, entry)
+    assert backend.get(url) == BODY
+    Cache(backend).migrate()
+    assert CacheEntry.decode(backend.get(url)).age() is None
+
+
+def test_collection_is_never_served_stale():
+    policy = CachePolicy()
+    assert policy.serves_stale("https://api.discogs.com/releases/1")
+    assert not policy.serves_stale(
+        "https://api.discogs.com/users/u/collection/folders/0/releases"
+    )
+    assert not CachePolicy(stale_while_revalidate=False).serves_stale(
+        "https://api.discogs.com/releases/1"
+    )
+
+
+def test_lru_bound_counts_the_parsed_objects():
+    entry = CacheEntry(body=b"x" * 100)
+    assert LRUCache.size(entry) == 100 * (1 + LRUCache.PARSED_RATIO)
+    memory = LRUCache(max_entries=10, max_bytes=3 * LRUCache.size(entry))
+    for key in "abcd":
+        memory.set(key, CacheEntry(body=b"x" * 100))
+    assert memory.get("a") is None
+    assert memory.get("b") is not None
+    assert memory.info()["evictions"] == 1
+    assert memory.bytes == 3 * LRUCache.size(entry)
+    memory.set("big", CacheEntry(body=b"x" * 400))
+    assert memory.get("big") is None
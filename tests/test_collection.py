@@ -0,0 +1,41 @@
+from dataclasses import replace
+
+from discogs_track.collection import CollectionIndex
+
+COLLECTION_PATH = "/users/user/collection/folders/0/releases"
+
+
+def test_index_is_downloaded_on_first_use(discogs, api):
+    collection = CollectionIndex(api)
+    assert collection.is_stale
+    assert discogs.requested(COLLECTION_PATH) == 0
+    assert 10 in collection
+    assert 20 not in collection
+    assert len(collection) == 1
+    assert not collection.is_stale
+    assert discogs.requested(COLLECTION_PATH) == 1
+
+
+def test_master_ids(discogs, api):
+    discogs.collection.append({"id": 20, "basic_information": {"master_id": 100}})
+    collection = CollectionIndex(api)
+    assert collection.has_master(100)
+    assert not collection.has_master(101)
+
+
+def test_stale_index_is_downloaded_again(discogs, api, monkeypatch):
+    collection = CollectionIndex(api, max_age=60)
+    assert 20 not in collection
+    now = collection.refreshed_at
+    discogs.collection.append({"id": 20})
+    monkeypatch.setattr("discogs_track.collection.time", lambda: now + 30)
+    assert 20 not in collection
+    monkeypatch.setattr("discogs_track.collection.time", lambda: now + 61)
+    assert collection.is_stale
+    # the collection page cached for its TTL expired meanwhile
+    url = api.url(api.page_query(COLLECTION_PATH, 1))
+    entry = api.cache.get_entry(url)
+    api.cache.set_entry(url, replace(entry, fetched_at=entry.fetched_at - 3600))
+    assert 20 in collection
+    assert not collection.is_stale
+    assert discogs.requested(COLLECTION_PATH) == 2
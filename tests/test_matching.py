@@ -0,0 +1,61 @@
+from random import Random
+
+import pytest
+
+from discogs_track.matching import TrackMatcher
+
+
+def test_title_key():
+    matcher = TrackMatcher()
+    assert matcher.title_key("Song (Remastered 2009)") == "song"
+    assert matcher.title_key("Song - 2009 Digital Remaster") == "song"
+    assert matcher.title_key("Café & Crème!") == "cafe and creme"
+    assert TrackMatcher(strip_versions=False).title_key("Song (Remastered)") == (
+        "song remastered"
+    )
+
+
+def test_seconds():
+    assert TrackMatcher.seconds("3:30") == 210
+    assert TrackMatcher.seconds("1:02:03") == 3723
+    assert TrackMatcher.seconds("") is None
+
+
+def jaccard(a: str, b: str) -> float:
+    a_grams, b_grams = TrackMatcher.trigrams(a), TrackMatcher.trigrams(b)
+    return len(a_grams & b_grams) / len(a_grams | b_grams)
+
+
+def random_title(rnd: Random) -> str:
+    words = ["love", "song", "night", "blue", "the", "a", "of", "dance", "rain"]
+    return " ".join(rnd.choice(words) for _ in range(rnd.randint(1, 4))) + (
+        rnd.choice(["", "s", " ii", " part 2"])
+    )
+
+
+@pytest.mark.parametrize("similarity", [0.5, 0.7, 0.9])
+def test_similar_group_matches_brute_force(similarity):
+    rnd = Random(similarity)
+    matcher = TrackMatcher(title_similarity=similarity)
+    keys = []
+    for group_id, title in enumerate(
+        dict.fromkeys(random_title(rnd) for _ in range(80))
+    ):
+        matcher.register("a1", title, group_id)
+        keys.append(matcher.title_key(title))
+    for _ in range(200):
+        key = matcher.title_key(random_title(rnd))
+        if key in keys:
+            continue
+        scores = [(jaccard(key, other), -i) for i, other in enumerate(keys)]
+        best_score, best_index = max(scores)
+        expected = -best_index if best_score >= similarity else None
+        assert matcher.group("a1", key) == (expected, expected is not None)
+
+
+def test_similar_titles_of_another_artist_do_not_match():
+    matcher = TrackMatcher(title_similarity=0.5)
+    matcher.register("a1", "Love Songs", 0)
+    assert matcher.group("a1", "Love Song") == (0, True)
+    assert matcher.group("a2", "Love Song") == (None, False)
+    assert TrackMatcher().group("a1", "Love Song") == (None, False)
@@ -0,0 +1,18 @@
+from discogs_track.metrics import Metrics
+
+
+def test_label_values_are_escaped():
+    assert Metrics.quote('a "b"\\c\nd') == '"a \\"b\\"\\\\c\\nd"'
+    metrics = Metrics()
+    metrics.inc("requests_total", endpoint='re"lease', status=200)
+    assert 'requests_total{endpoint="re\\"lease",status="200"} 1' in (
+        metrics.prometheus()
+    )
+
+
+def test_histogram_samples():
+    metrics = Metrics()
+    metrics.observe("request_seconds", 0.2, endpoint="release")
+    text = metrics.prometheus()
+    assert 'request_seconds_bucket{endpoint="release",le="+Inf"} 1' in text
+    assert 'request_seconds_count{endpoint="release"} 1' in text
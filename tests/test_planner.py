@@ -0,0 +1,142 @@
+from itertools import combinations
+from random import Random
+from types import SimpleNamespace
+
+import pytest
+
+from discogs_track.planner import Planner
+
+ARTIST = SimpleNamespace(full_id="a1")
+
+
+def make_tracks(number: int) -> list:
+    return [
+        SimpleNamespace(id=i, title=f"Song {i}", artist=ARTIST) for i in range(number)
+    ]
+
+
+def make_record(
+    id_, tracks, lowest_price=10.0, num_for_sale=1, in_collection=False
+) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=id_,
+        missing_tracks=list(tracks),
+        lowest_price=lowest_price,
+        num_for_sale=num_for_sale,
+        in_collection=in_collection,
+    )
+
+
+def covered_ids(plan) -> set:
+    return {track.id for step in plan.steps for track in step.tracks}
+
+
+def test_greedy_and_exact_minimum():
+    # greedy takes the 4 tracks record first, then needs 2 more records
+    t = make_tracks(6)
+    records = [
+        make_record(1, t[0:4]),
+        make_record(2, [t[0], t[1], t[4]]),
+        make_record(3, [t[2], t[3], t[5]]),
+        make_record(4, [t[4]]),
+        make_record(5, [t[5]]),
+    ]
+    greedy = Planner(records, t).plan(exact=False)
+    assert greedy.steps[0].record.id == 1
+    assert len(greedy.steps) == 3
+    assert not greedy.exact
+    exact = Planner(records, t).plan()
+    assert sorted(step.record.id for step in exact.steps) == [2, 3]
+    assert exact.exact
+    assert covered_ids(exact) == set(range(6))
+    assert exact.covered == exact.missing == 6
+
+
+def test_steps_only_list_the_new_tracks():
+    t = make_tracks(3)
+    plan = Planner(
+        [make_record(1, t[0:2]), make_record(2, t[1:3])], t, weight="records"
+    ).plan()
+    assert sum(len(step.tracks) for step in plan.steps) == 3
+
+
+def test_skips_collection_and_uncoverable():
+    t = make_tracks(3)
+    records = [
+        make_record(1, t, in_collection=True),
+        make_record(2, t[0:2]),
+    ]
+    plan = Planner(records, t).plan()
+    assert [step.record.id for step in plan.steps] == [2]
+    assert [track.id for track in plan.uncoverable] == [2]
+
+
+def test_price_weight():
+    t = make_tracks(2)
+    records = [
+        make_record(1, t, lowest_price=30.0),
+        make_record(2, t[0:1], lowest_price=5.0),
+        make_record(3, t[1:2], lowest_price=5.0),
+        make_record(4, t, lowest_price=None),
+    ]
+    plan = Planner(records, t, weight="price").plan()
+    assert sorted(step.record.id for step in plan.steps) == [2, 3]
+    assert plan.cost == 10.0
+
+
+def test_for_sale_and_availability():
+    t = make_tracks(1)
+    records = [
+        make_record(1, t, num_for_sale=0),
+        make_record(2, t, num_for_sale=2),
+        make_record(3, t, num_for_sale=8),
+    ]
+    assert Planner(records, t, weight="availability").plan().steps[0].record.id == 3
+    plan = Planner(records[:1], t, for_sale=True).plan()
+    assert not plan.steps
+    assert len(plan.uncoverable) == 1
+
+
+def test_by_title():
+    t = make_tracks(2)
+    t[1].title = t[0].title  # another duration of the same title
+    plan = Planner([make_record(1, t[0:1])], t, by_title=True).plan()
+    assert plan.missing == 1
+    assert not plan.uncoverable
+
+
+def test_unknown_weight():
+    with pytest.raises(ValueError):
+        Planner([], [], weight="weight")
+
+
+def test_nodes_budget_falls_back_to_greedy():
+    rnd = Random(0)
+    t = make_tracks(30)
+    records = [make_record(i, rnd.sample(t, 6)) for i in range(40)]
+    plan = Planner(records, t, nodes_budget=10).plan(exact=True)
+    assert not plan.exact
+    assert covered_ids(plan) == {
+        track.id for record in records for track in record.missing_tracks
+    }
+
+
+def test_exact_matches_brute_force():
+    rnd = Random(1)
+    for _ in range(20):
+        t = make_tracks(8)
+        records = [
+            make_record(i, rnd.sample(t, rnd.randint(1, 4)), rnd.randint(1, 9))
+            for i in range(8)
+        ]
+        plan = Planner(records, t, weight="price").plan(exact=True)
+        coverable = {track.id for record in records for track in record.missing_tracks}
+        best = min(
+            sum(record.lowest_price for record in chosen)
+            for size in range(1, len(records) + 1)
+            for chosen in combinations(records, size)
+            if {track.id for record in chosen for track in record.missing_tracks}
+            == coverable
+        )
+        assert plan.exact
+        assert plan.cost == best
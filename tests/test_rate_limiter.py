@@ -0,0 +1,119 @@
+import pytest
+
+from discogs_track.api import RateLimiter
+
+
+class FakeClock:
+    """A clock advanced by the sleeps only"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_limiter(per_minute=60, **kwargs):
+    clock = FakeClock()
+    return RateLimiter(per_minute, clock=clock, sleeper=clock.sleep, **kwargs), clock
+
+
+def headers(limit=60, used=0, remaining=60):
+    return {
+        "X-Discogs-Ratelimit": str(limit),
+        "X-Discogs-Ratelimit-Used": str(used),
+        "X-Discogs-Ratelimit-Remaining": str(remaining),
+    }
+
+
+def test_burst_then_spaced():
+    limiter, clock = make_limiter(60, burst=3)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert clock.sleeps == [pytest.approx(1.0), pytest.approx(1.0)]
+
+
+def test_sustained_rate_approaches_quota():
+    limiter, clock = make_limiter(59)
+    start = clock.now
+    for _ in range(590):
+        limiter.acquire()
+        limiter.update({})
+    assert 590 / ((clock.now - start) / 60) == pytest.approx(59, rel=0.01)
+
+
+def test_refill_is_capped_by_burst():
+    limiter, clock = make_limiter(60, burst=2)
+    clock.now += 3600
+    assert limiter.tokens == 2.0
+
+
+def test_update_takes_the_server_quota():
+    limiter, clock = make_limiter(59, burst=5)
+    limiter.acquire()
+    limiter.update(headers(limit=25, used=22, remaining=3))
+    # one request of the margin stays unused
+    assert limiter.per_minute == 24
+    assert limiter.tokens == pytest.approx(2.0)
+    assert limiter.state()["used"] == 22
+
+
+def test_update_accounts_for_requests_in_flight():
+    limiter, clock = make_limiter(60, burst=5)
+    limiter.acquire()
+    limiter.acquire()
+    limiter.update(headers(remaining=4))
+    # 4 - margin 1 - the other request still in flight
+    assert limiter.tokens == pytest.approx(2.0)
+
+
+@pytest.mark.parametrize("remaining", [1, 0])
+def test_spent_quota_waits_for_the_window(remaining):
+    # another process sharing the quota has spent it
+    limiter, clock = make_limiter(60, burst=5)
+    limiter.acquire()
+    limiter.update(headers(used=60 - remaining, remaining=remaining))
+    assert limiter.acquire() == pytest.approx(RateLimiter.window)
+    # then spaced out again, at the server quota minus the margin
+    assert limiter.acquire() == pytest.approx(60 / 59)
+
+
+def test_exhaust():
+    limiter, clock = make_limiter(30, burst=5)
+    limiter.exhaust()
+    assert limiter.acquire() == pytest.approx(RateLimiter.window)
+
+
+def test_update_never_raises_the_quota():
+    limiter, clock = make_limiter(59)
+    limiter.acquire()
+    limiter.update(headers(limit=240, remaining=239))
+    assert limiter.per_minute == 59
+
+
+@pytest.mark.parametrize(
+    "bad_headers",
+    [{}, {"X-Discogs-Ratelimit": "x", "X-Discogs-Ratelimit-Remaining": "1"}],
+)
+def test_update_ignores_missing_headers(bad_headers):
+    limiter, clock = make_limiter(60, burst=3)
+    limiter.acquire()
+    limiter.update(bad_headers)
+    assert limiter.per_minute == 60
+    assert limiter.tokens == pytest.approx(2.0)
+
+
+def test_state():
+    limiter, clock = make_limiter(60)
+    limiter.acquire()
+    limiter.acquire()
+    state = limiter.state()
+    assert state["requests"] == 2
+    assert state["waited"] == pytest.approx(1.0)
+    assert state["per_minute"] == 60
@@ -0,0 +1,38 @@
+import pytest
+
+from discogs_track.artist import Artist
+from discogs_track.collection import CollectionIndex
+from discogs_track.record import Record
+
+
+@pytest.mark.parametrize(
+    "summary, digital",
+    [
+        ({"format": "File, FLAC, Album"}, True),
+        ({"format": "File, MP3"}, True),
+        ({"format": "Vinyl, LP"}, False),
+        ({"format": None}, False),
+        ({}, False),
+    ],
+)
+def test_is_digital_summary(summary, digital):
+    assert Record.is_digital_summary(summary) is digital
+
+
+def test_slim_records_reload_raw_from_the_cache(discogs, api):
+    artist = Artist(1, api=api, collection=CollectionIndex(api), slim=True)
+    record = artist.records[20]
+    assert not hasattr(record, "__dict__")
+    assert record._raw is None and record.version_raw is None
+    assert all(track.raw is None for track in record.tracks["f1"])
+    # the reported fields are kept
+    assert (record.title, record.format, record.year) == ("Second", "CD, Album", 1983)
+    assert [track.title for track in record.missing_tracks] == ["Song C", "Song D"]
+    assert record.raw["tracklist"] == discogs.releases[20]["tracklist"]
+    assert discogs.requested("/releases/20") == 1
+
+
+def test_records_keep_raw_by_default(discogs, api):
+    record = Artist(1, api=api, collection=CollectionIndex(api)).records[20]
+    assert record.raw is record._raw
+    assert record.version_raw == discogs.master_versions[0]
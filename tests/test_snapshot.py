@@ -0,0 +1,76 @@
+import pytest
+import responses
+
+from discogs_track.artist import Artist
+from discogs_track.collection import CollectionIndex
+from discogs_track.matching import TrackMatcher
+from discogs_track.snapshot import Snapshot
+
+
+def test_settings_must_match(tmp_path):
+    path = str(tmp_path / "1.snap")
+    settings = Artist.snapshot_settings(slim=True, matcher=TrackMatcher())
+    Snapshot.write(path, {"id": 1}, settings)
+    assert Snapshot.read(path, settings=settings) == {"id": 1}
+    assert Snapshot.read(path) is None
+    for other in (
+        Artist.snapshot_settings(slim=False, matcher=TrackMatcher()),
+        Artist.snapshot_settings(slim=True),
+        Artist.snapshot_settings(slim=True, matcher=TrackMatcher(title_similarity=0.8)),
+        Artist.snapshot_settings(slim=True, matcher=TrackMatcher(duration_tolerance=3)),
+    ):
+        assert Snapshot.read(path, settings=other) is None
+
+
+@pytest.mark.parametrize("cut", [1, 20])
+def test_truncated_snapshot_is_ignored(tmp_path, cut):
+    path = tmp_path / "1.snap"
+    Snapshot.write(str(path), {"id": 1, "title": "t" * 100})
+    path.write_bytes(path.read_bytes()[:-cut])
+    assert Snapshot.read(str(path)) is None
+
+
+def test_snapshot_of_a_removed_class_is_ignored(tmp_path, monkeypatch):
+    path = str(tmp_path / "1.snap")
+    Snapshot.write(path, TrackMatcher())
+    monkeypatch.delattr("discogs_track.matching.TrackMatcher")
+    assert Snapshot.read(path) is None
+
+
+def test_artist_round_trip(discogs, api, make_api, tmp_path):
+    path = str(tmp_path / "1.snap")
+    built = Artist(1, api=api, collection=CollectionIndex(api))
+    assert built.save_snapshot(path) == path
+    Artist.ARTISTS.clear()
+    responses.calls.reset()
+    other = make_api(sharing=api)
+    collection = CollectionIndex(other)
+    artist = Artist.load_snapshot(1, other, collection, path=path)
+    assert artist.api is other and Artist.ARTISTS[1] is artist
+    record = artist.records[20]
+    assert record._api is other
+    # the tracks ids kept by the pickled records are linked to the tracks again
+    registry = artist.track_registry
+    assert all(track.registry is registry for track in record.tracks["f1"])
+    assert [track.id for track in record.tracks["f1"]] == [
+        track.id for track in built.records[20].tracks["f1"]
+    ]
+    assert record.missing_tracks[0] is registry.find("f1", "Song C", "2:30")
+    assert registry.find("f1", "Song A", "3:00").records[20] is record
+    assert [r.id for r in artist.stream_records()] == [10, 20, 30]
+    assert len(responses.calls) == 0
+    assert Artist.load_snapshot(1, other, path=path, slim=True) is None
+
+
+def test_loaded_artist_takes_the_collection_changes(discogs, api, make_api, tmp_path):
+    path = str(tmp_path / "1.snap")
+    Artist(1, api=api, collection=CollectionIndex(api)).save_snapshot(path)
+    Artist.ARTISTS.clear()
+    discogs.collection.append({"id": 20})
+    other = make_api(sharing=api)
+    other.cache_policy.ttls["collection"] = 0
+    artist = Artist.load_snapshot(1, other, CollectionIndex(other), path=path)
+    assert artist.refresh_collection() == 2
+    assert artist.records[20].in_collection
+    assert not artist.missing_tracks
+    assert set(artist.completing_records) == {0}
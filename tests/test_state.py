@@ -0,0 +1,57 @@
+from ujson import dumps
+
+from discogs_track.artist import Artist
+from discogs_track.cache import Cache, SQLiteBackend
+from discogs_track.collection import CollectionIndex
+from discogs_track.state import ArtistState
+
+
+def test_round_trip():
+    cache = Cache(SQLiteBackend(":memory:"))
+    assert ArtistState.load(cache, 1) is None
+    state = ArtistState(
+        1, releases={10: {"id": 10, "title": "First"}}, in_collection={10}
+    )
+    state.save(cache)
+    loaded = ArtistState.load(cache, 1)
+    assert loaded.releases == {10: {"id": 10, "title": "First"}}
+    assert loaded.in_collection == {10}
+    assert loaded.saved_at == state.saved_at
+    assert ArtistState.load(cache, 2) is None
+
+
+def test_other_version_is_ignored():
+    cache = Cache(SQLiteBackend(":memory:"))
+    cache[ArtistState.KEY.format(artist_id=1)] = dumps(
+        {"v": ArtistState.VERSION + 1, "releases": {}, "in_collection": []}
+    )
+    assert ArtistState.load(cache, 1) is None
+
+
+def test_diff():
+    before = ArtistState(1, releases={1: {}, 2: {}, 3: {}}, in_collection={1, 2})
+    after = ArtistState(1, releases={2: {}, 3: {}, 4: {}}, in_collection={3, 4})
+    assert after.diff(before) == {
+        "new": 1,
+        "dropped": 1,
+        "known": 2,
+        "collected": 1,
+        "uncollected": 1,
+    }
+
+
+def test_incremental_analysis_reuses_the_known_releases(discogs, api, make_api):
+    Artist(1, api=api, collection=CollectionIndex(api), incremental=True)
+    state = ArtistState.load(api.cache, 1)
+    assert sorted(state.releases) == [10, 20, 30]
+    assert state.in_collection == {10}
+    # the state details are used instead of the cached release details
+    url = api.url(api.release_query(20))
+    api.cache.set_many({url: dumps(dict(discogs.releases[20], title="Changed"))})
+    Artist.ARTISTS.clear()
+    other = make_api(sharing=api)
+    artist = Artist(1, api=other, collection=CollectionIndex(other), incremental=True)
+    assert sorted(artist.records) == [10, 20, 30]
+    assert artist.records[20].title == "Second"
+    assert sorted(artist.missing_tracks) == ["Song C", "Song D"]
+    assert [discogs.requested(f"/releases/{i}") for i in (10, 20, 30)] == [1, 1, 1]
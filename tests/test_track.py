@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from discogs_track.track import TrackRegistry
+
+A = SimpleNamespace(id=1, full_id="f1", name="A")
+B = SimpleNamespace(id=2, full_id="f2", name="B")
+
+
+def record(id_, in_collection=False) -> SimpleNamespace:
+    return SimpleNamespace(id=id_, in_collection=in_collection)
+
+
+def track(title: str, duration: str) -> dict:
+    return {"title": title, "duration": duration}
+
+
+def test_durations_of_a_title_share_a_group():
+    registry = TrackRegistry()
+    short = registry.get_or_create(track("Song ", "03:00"), record(1), A)
+    long = registry.get_or_create(track("Song", "4:00"), record(2), A)
+    again = registry.get_or_create(track("Song", "3:00"), record(3, True), A)
+    other = registry.get_or_create(track("Other", "3:00"), record(1), A)
+    assert again is short
+    assert (short.id, long.id, other.id) == (0, 1, 2)
+    assert short.group_id == long.group_id != other.group_id
+    assert sorted(short.records) == [1, 3]
+    assert short.in_collection and not long.in_collection
+    assert short.alternatives_count == long.alternatives_count == 1
+    assert other.alternatives_count == 0
+    assert short.alternatives == {long}
+    assert registry.by_title("f1", "Song") == [short, long]
+    assert registry.find("f1", "Song", "4:00") is long
+    assert registry.find("f1", "Song", "5:00") is None
+    assert registry.get_all(A) == {
+        "Song": {"3:00": short, "4:00": long},
+        "Other": {"3:00": other},
+    }
+    assert registry.title_groups("f1") == {"Song": 0, "Other": 1}
+    assert len(registry) == 3
+
+
+def test_artists_and_registries_are_kept_apart():
+    registry, other_registry = TrackRegistry(), TrackRegistry()
+    a_song = registry.get_or_create(track("Song", "3:00"), record(1), A)
+    b_song = registry.get_or_create(track("Song", "3:00"), record(1), B)
+    assert a_song is not b_song
+    assert a_song.group_id != b_song.group_id
+    assert a_song.alternatives_count == b_song.alternatives_count == 0
+    assert registry.get_all(B) == {"Song": {"3:00": b_song}}
+    assert other_registry.find("f1", "Song", "3:00") is None
+    assert len(other_registry) == 0
+    assert registry.registrations == 2
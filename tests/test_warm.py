@@ -0,0 +1,51 @@
+import pytest
+import responses
+
+from discogs_track.cache import RedisBackend, SQLiteBackend
+from discogs_track.warm import RedisWarmQueue, SQLiteWarmQueue, Warmer, WarmQueue
+
+
+def sqlite_queue() -> WarmQueue:
+    return WarmQueue.for_backend(SQLiteBackend(":memory:"))
+
+
+def redis_queue() -> WarmQueue:
+    fakeredis = pytest.importorskip("fakeredis")
+    backend = RedisBackend()  # connects on the first command only
+    backend._redis = fakeredis.FakeRedis()
+    return RedisWarmQueue(backend)
+
+
+@pytest.fixture(params=[sqlite_queue, redis_queue], ids=["sqlite", "redis"])
+def queue(request) -> WarmQueue:
+    return request.param()
+
+
+def test_push_keeps_the_lowest_priority(queue):
+    assert queue.push({"a": 20.0, "b": 10.0}) == 2
+    assert queue.push({"a": 5.0, "b": 30.0, "c": 15.0}) == 1
+    assert queue.info() == {"queued": 3, "claimed": 0}
+    assert queue.claim(3) == [("a", 5.0), ("b", 10.0), ("c", 15.0)]
+
+
+def test_claim_done_and_recover(queue):
+    queue.push({"a": 1.0, "b": 2.0})
+    assert queue.claim() == [("a", 1.0)]
+    assert queue.info() == {"queued": 1, "claimed": 1}
+    assert queue.recover(lease=3600) == 0
+    assert queue.recover(lease=-1) == 1
+    assert queue.claim(2) == [("a", 1.0), ("b", 2.0)]
+    queue.done(["a", "b"])
+    assert queue.info() == {"queued": 0, "claimed": 0}
+    assert queue.claim() == []
+
+
+@responses.activate
+def test_each_pass_forgets_the_fetched_urls(api):
+    url = api.url("/artists/1")
+    responses.add(responses.GET, url, json={"name": "A"})
+    api.get_artist(1)
+    warmer = Warmer(api, sqlite_queue())
+    warmer.watch([1])
+    assert not api.fetched
+    assert warmer.seen == {url}